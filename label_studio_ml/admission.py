@@ -0,0 +1,205 @@
+"""
+Admission control of the server routes.
+
+Without limits a burst of /predict requests starts as many predictions as there are server threads, a GPU model
+runs out of memory and the whole container goes down. AdmissionController lets `limit` requests of a route run
+at the same time, up to `queue_size` more wait for a slot (first come, first served) at most `timeout` seconds,
+the others are rejected right away with 503 and Retry-After header estimated from the recent request durations.
+A request doesn't wait longer than its deadline (label_studio_ml.deadline), it's answered with 504 then.
+"""
+import math
+import time
+import asyncio
+import logging
+
+from collections import deque
+from contextlib import contextmanager
+from threading import Event, Lock
+from typing import Optional
+
+from .metrics import Counter, Gauge, Histogram
+from .deadline import current_deadline
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_IN_FLIGHT = Gauge(
+    'label_studio_ml_admission_in_flight',
+    'Requests being processed',
+    labelnames=('route',))
+ADMISSION_QUEUE_DEPTH = Gauge(
+    'label_studio_ml_admission_queue_depth',
+    'Requests waiting for a free slot',
+    labelnames=('route',))
+ADMISSION_WAIT_SECONDS = Histogram(
+    'label_studio_ml_admission_wait_seconds',
+    'Time requests waited for a free slot',
+    labelnames=('route',))
+ADMISSION_REJECTED = Counter(
+    'label_studio_ml_admission_rejected',
+    'Requests rejected because the server is overloaded',
+    labelnames=('route',))
+
+
+class Overloaded(Exception):
+
+    def __init__(self, route: str, retry_after: int):
+        self.route = route
+        self.retry_after = retry_after
+        super(Overloaded, self).__init__(f'Server is overloaded, retry /{route} in {retry_after} seconds')
+
+
+class _ThreadWaiter:
+
+    def __init__(self):
+        self.event = Event()
+
+    def wake(self):
+        self.event.set()
+
+
+class _AsyncWaiter:
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+
+    def wake(self):
+        self.loop.call_soon_threadsafe(self._set)
+
+    def _set(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class AdmissionController:
+    """
+    Concurrency limit with a bounded wait queue for one route, usable from threads and coroutines
+    """
+
+    # weight of the last request in the average duration used for Retry-After
+    SMOOTHING = 0.2
+
+    def __init__(self, route: str, limit: int, queue_size: int = None, timeout: float = 30.0):
+        """
+        :param route: route name for metrics and errors
+        :param limit: number of requests processed at the same time
+        :param queue_size: number of requests waiting for a slot, 2 * limit by default
+        :param timeout: seconds a request waits for a slot before it's rejected
+        """
+        self.route = route
+        self.limit = limit
+        self.queue_size = 2 * limit if queue_size is None else queue_size
+        self.timeout = timeout
+        self._active = 0
+        self._waiters = deque()
+        self._lock = Lock()
+        self._duration = None
+        self._in_flight = ADMISSION_IN_FLIGHT.labels(route=route)
+        self._queue_depth = ADMISSION_QUEUE_DEPTH.labels(route=route)
+        self._wait_seconds = ADMISSION_WAIT_SECONDS.labels(route=route)
+        self._rejected = ADMISSION_REJECTED.labels(route=route)
+
+    def retry_after(self) -> int:
+        """
+        Seconds until a slot is likely to be free for a new request
+        """
+        duration = self._duration or 1.0
+        return max(1, math.ceil(duration * (len(self._waiters) + 1) / self.limit))
+
+    def _overloaded(self) -> Overloaded:
+        self._rejected.inc()
+        return Overloaded(self.route, self.retry_after())
+
+    def _enter(self, create_waiter):
+        """
+        Take a free slot or queue a waiter, returns the waiter or None if the slot is taken
+        """
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                self._in_flight.set(self._active)
+                return None
+            if len(self._waiters) >= self.queue_size:
+                raise self._overloaded()
+            waiter = create_waiter()
+            self._waiters.append(waiter)
+            self._queue_depth.set(len(self._waiters))
+            return waiter
+
+    def _abandon(self, waiter) -> bool:
+        """
+        Remove the waiter which gave up, returns False if it has got a slot meanwhile
+        """
+        with self._lock:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                return False
+            self._queue_depth.set(len(self._waiters))
+            return True
+
+    def acquire(self) -> float:
+        """
+        Wait for a slot in the current thread, returns the time the request was admitted at
+        """
+        start = time.perf_counter()
+        deadline = current_deadline()
+        waiter = self._enter(_ThreadWaiter)
+        if waiter is not None and not waiter.event.wait(deadline.timeout(self.timeout)) and self._abandon(waiter):
+            deadline.check()
+            raise self._overloaded()
+        admitted = time.perf_counter()
+        self._wait_seconds.observe(admitted - start)
+        return admitted
+
+    async def acquire_async(self) -> float:
+        """
+        Wait for a slot without blocking the event loop, returns the time the request was admitted at
+        """
+        start = time.perf_counter()
+        deadline = current_deadline()
+        waiter = self._enter(lambda: _AsyncWaiter(asyncio.get_running_loop()))
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), deadline.timeout(self.timeout))
+            except asyncio.TimeoutError:
+                if self._abandon(waiter):
+                    deadline.check()
+                    raise self._overloaded()
+            except asyncio.CancelledError:
+                # the client is gone, give the slot away if it has been already handed over
+                if not self._abandon(waiter):
+                    self.release()
+                raise
+        admitted = time.perf_counter()
+        self._wait_seconds.observe(admitted - start)
+        return admitted
+
+    def release(self, admitted: Optional[float] = None):
+        """
+        Free the slot, the first waiting request gets it
+        :param admitted: the time returned by acquire(), used to estimate Retry-After
+        """
+        if admitted is not None:
+            duration = time.perf_counter() - admitted
+            self._duration = duration if self._duration is None else \
+                self.SMOOTHING * duration + (1 - self.SMOOTHING) * self._duration
+        with self._lock:
+            if self._waiters:
+                # the slot is handed over, the number of active requests stays the same
+                waiter = self._waiters.popleft()
+                self._queue_depth.set(len(self._waiters))
+            else:
+                waiter = None
+                self._active -= 1
+                self._in_flight.set(self._active)
+        if waiter is not None:
+            waiter.wake()
+
+    @contextmanager
+    def admit(self):
+        admitted = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(admitted)
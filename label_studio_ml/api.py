@@ -1,28 +1,150 @@
 import hmac
+import functools
+import itertools
+import asyncio
+import inspect
 import logging
 import os
+import threading
 
 from flask import Flask, request, jsonify, Response
+from flask.json.provider import DefaultJSONProvider
 
-from .response import ModelResponse
 from .model import LabelStudioMLBase
 from .exceptions import exception_handler
+from .metrics import generate_latest, CONTENT_TYPE
+from .pool import ModelPool
+from .batching import PredictBatcher
+from . import serialization
+from . import prediction_cache
+from .prediction_cache import PredictionCache
+from .jobs import JobQueue
+from .triggers import TrainingTrigger
+from .admission import AdmissionController, Overloaded
+from .compression import ResponseCompression
+from .singleflight import SingleFlight, request_key
+from .deadline import DeadlineExceeded, current_deadline, deadline_scope, request_deadline
 
 logger = logging.getLogger(__name__)
 
+
+class JSONProvider(DefaultJSONProvider):
+    """
+    jsonify() encodes responses with label_studio_ml.serialization (orjson when it's installed)
+    """
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return serialization.dumps(obj).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(serialization.dumps(obj), mimetype=self.mimetype)
+
+
 _server = Flask(__name__)
+_server.json = JSONProvider(_server)
 MODEL_CLASS = LabelStudioMLBase
+MODEL_POOL = None
+BATCHER = None
+JOB_QUEUE = None
+TRAINING_TRIGGER = None
+# route name -> AdmissionController
+ADMISSION = {}
+COMPRESSION = None
+SINGLE_FLIGHT = None
 BASIC_AUTH = None
 
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+# the most jobs /jobs returns at once
+MAX_JOBS_LIMIT = 1000
 
-def init_app(model_class, basic_auth_user=None, basic_auth_pass=None):
+
+def init_app(model_class, basic_auth_user=None, basic_auth_pass=None, model_pool_size=None,
+             batch_window_ms=None, max_batch_size=None, cache_predictions=None, training_workers=None,
+             training_debounce=None, training_min_annotations=None, training_max_staleness=None,
+             admission=None, compression=None, single_flight=None):
     global MODEL_CLASS
+    global MODEL_POOL
+    global BATCHER
+    global JOB_QUEUE
+    global TRAINING_TRIGGER
+    global ADMISSION
+    global COMPRESSION
+    global SINGLE_FLIGHT
     global BASIC_AUTH
 
     if not issubclass(model_class, LabelStudioMLBase):
         raise ValueError('Inference class should be the subclass of ' + LabelStudioMLBase.__class__.__name__)
 
     MODEL_CLASS = model_class
+    # reuse model instances between requests, disabled by default
+    if model_pool_size is None:
+        model_pool_size = int(os.environ.get('MODEL_POOL_SIZE', 0))
+    MODEL_POOL = ModelPool(model_class, model_pool_size) if model_pool_size > 0 else None
+
+    # coalesce concurrent predict requests into batches, disabled by default
+    if batch_window_ms is None:
+        batch_window_ms = float(os.environ.get('PREDICT_BATCH_WINDOW_MS', 0))
+    if max_batch_size is None:
+        max_batch_size = int(os.environ.get('PREDICT_MAX_BATCH_SIZE', 32))
+    BATCHER = PredictBatcher(_predict_tasks, batch_window_ms / 1000, max_batch_size) if batch_window_ms > 0 else None
+
+    # cache predictions by task content, disabled by default
+    if cache_predictions is None:
+        cache_predictions = os.environ.get('PREDICTION_CACHE', '').lower() in ('1', 'true', 'yes')
+    if not cache_predictions:
+        prediction_cache.PREDICTION_CACHE = None
+    elif prediction_cache.PREDICTION_CACHE is None:
+        prediction_cache.PREDICTION_CACHE = PredictionCache(os.getenv('MODEL_DIR', '.'))
+
+    # run fit() in background jobs, disabled by default
+    if training_workers is None:
+        training_workers = int(os.environ.get('TRAINING_WORKERS', 0))
+    if JOB_QUEUE is not None:
+        JOB_QUEUE.shutdown(wait=False)
+    JOB_QUEUE = JobQueue(os.getenv('MODEL_DIR', '.'), training_workers) if training_workers > 0 else None
+
+    # coalesce bursts of training events, disabled by default
+    if training_debounce is None:
+        training_debounce = float(os.environ.get('TRAINING_DEBOUNCE', 0))
+    if training_min_annotations is None:
+        training_min_annotations = int(os.environ.get('TRAINING_MIN_ANNOTATIONS', 1))
+    if training_max_staleness is None:
+        training_max_staleness = float(os.environ.get('TRAINING_MAX_STALENESS', 0))
+    if TRAINING_TRIGGER is not None:
+        TRAINING_TRIGGER.close()
+    TRAINING_TRIGGER = None
+    if training_debounce > 0 or training_min_annotations > 1:
+        TRAINING_TRIGGER = TrainingTrigger(_start_training, training_debounce, training_min_annotations,
+                                           training_max_staleness)
+
+    # limit concurrent requests per route, e.g. PREDICT_CONCURRENCY=2, disabled by default
+    if admission is None:
+        admission = {}
+        for route in ADMISSION_ROUTES:
+            limit = int(os.environ.get(f'{route.upper()}_CONCURRENCY', 0))
+            if limit > 0:
+                queue_size = os.environ.get(f'{route.upper()}_QUEUE_SIZE')
+                admission[route] = AdmissionController(
+                    route, limit,
+                    queue_size=int(queue_size) if queue_size is not None else None,
+                    timeout=float(os.environ.get(f'{route.upper()}_QUEUE_TIMEOUT', 30)))
+    ADMISSION = admission
+
+    # compress large responses, e.g. RESPONSE_COMPRESSION=auto, disabled by default
+    if compression is None:
+        compression = ResponseCompression.from_config(
+            os.environ.get('RESPONSE_COMPRESSION'),
+            min_size=int(os.environ.get('RESPONSE_COMPRESSION_MIN_SIZE', 1024)))
+    COMPRESSION = compression or None
+
+    # run identical concurrent predictions once, disabled by default
+    if single_flight is None:
+        single_flight = os.environ.get('PREDICT_SINGLE_FLIGHT', '').lower() in ('1', 'true', 'yes')
+    SINGLE_FLIGHT = SingleFlight() if single_flight else None
+
     basic_auth_user = basic_auth_user or os.environ.get('BASIC_AUTH_USER')
     basic_auth_pass = basic_auth_pass or os.environ.get('BASIC_AUTH_PASS')
     if basic_auth_user and basic_auth_pass:
@@ -31,42 +153,139 @@ def init_app(model_class, basic_auth_user=None, basic_auth_pass=None):
     return _server
 
 
-@_server.route('/predict', methods=['POST'])
-@exception_handler
-def _predict():
+ADMISSION_ROUTES = ('predict', 'setup', 'webhook')
+
+
+def admitted(route):
     """
-    Predict tasks
+    Apply admission control of the route, see label_studio_ml.admission.
+    Streamed responses hold the slot until they are sent.
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            controller = ADMISSION.get(route)
+            if controller is None:
+                return f(*args, **kwargs)
+            admitted_at = controller.acquire()
+            try:
+                response = _server.make_response(f(*args, **kwargs))
+            except BaseException:
+                controller.release(admitted_at)
+                raise
+            if response.is_streamed:
+                response.call_on_close(lambda: controller.release(admitted_at))
+            else:
+                controller.release(admitted_at)
+            return response
+        return wrapper
+    return decorator
+
+
+def with_deadline(f):
+    """
+    Run the request with its deadline, see label_studio_ml.deadline
+    """
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        with deadline_scope(request_deadline(request.headers)):
+            return f(*args, **kwargs)
+    return wrapper
 
-    Example request:
-    request = {
-            'tasks': tasks,
-            'model_version': model_version,
-            'project': '{project.id}.{int(project.created_at.timestamp())}',
-            'label_config': project.label_config,
-            'params': {
-                'login': project.task_data_login,
-                'password': project.task_data_password,
-                'context': context,
-            },
-        }
 
-    @return:
-    Predictions in LS format
+def _get_model(project_id, label_config):
+    if MODEL_POOL is not None:
+        return MODEL_POOL.get(project_id, label_config)
+    return MODEL_CLASS(project_id=project_id, label_config=label_config)
+
+
+def _invalidate_models(project_id):
+    if MODEL_POOL is not None:
+        MODEL_POOL.invalidate(project_id)
+
+
+def _resolve(result):
     """
-    data = request.json
+    Run coroutine returned by async def predict() or fit() when it's called from a sync context
+    """
+    if inspect.isawaitable(result):
+        return asyncio.run(result)
+    return result
+
+
+def _parse_predict_request(data):
     tasks = data.get('tasks')
     label_config = data.get('label_config')
     project = data.get('project')
     project_id = project.split('.', 1)[0] if project else None
     params = data.get('params', {})
     context = params.pop('context', {})
+    return project_id, label_config, tasks, context, params
+
 
-    model = MODEL_CLASS(project_id=project_id,
-                        label_config=label_config)
+def _run_predict(model, tasks, context, params):
+    # the client may have given up while the request was waiting
+    current_deadline().check()
+    with model.batch_writes():
+        response = _resolve(model.predict(tasks, context=context, **params))
+        if inspect.isgenerator(response) or inspect.isasyncgen(response):
+            response = list(_iter_response(model, response))
+        return response
 
-    # model.use_label_config(label_config)
 
-    response = model.predict(tasks, context=context, **params)
+def _predict_tasks(model, tasks, context, params):
+    """
+    Run predict() and convert its output to the list of predictions
+    """
+    return _predict_results(model, _run_predict(model, tasks, context, params))
+
+
+def _get_predictions(model, project_id, label_config, tasks, context, params):
+    """
+    Predict tasks, all prediction requests go through here
+    """
+    if SINGLE_FLIGHT is not None:
+        key = request_key(project_id, label_config, tasks, context, params, model.get('model_version'))
+        return SINGLE_FLIGHT.do(key, _get_new_predictions, model, project_id, label_config, tasks, context, params)
+    return _get_new_predictions(model, project_id, label_config, tasks, context, params)
+
+
+def _get_new_predictions(model, project_id, label_config, tasks, context, params):
+    """
+    Predict tasks with the prediction cache and batching if they are enabled
+    """
+    def predict(tasks):
+        if BATCHER is not None:
+            return BATCHER.submit(model, project_id, label_config, tasks, context, params)
+        return _predict_tasks(model, tasks, context, params)
+
+    cache = prediction_cache.PREDICTION_CACHE
+    if cache is None or not isinstance(tasks, list) or not tasks:
+        return predict(tasks)
+
+    project_id = project_id or ''
+    model_version = model.get('model_version')
+    keys = [prediction_cache.task_key(task, label_config, context, params, model_version) for task in tasks]
+    results = cache.lookup(project_id, keys)
+    missing = [i for i, result in enumerate(results) if result is None]
+    if not missing:
+        return results
+
+    predictions = predict([tasks[i] for i in missing])
+    if not isinstance(predictions, list) or len(predictions) != len(missing):
+        # predictions can't be matched with tasks, so they aren't cached
+        return predictions if len(missing) == len(tasks) else predict(tasks)
+    cache.store(project_id, {keys[i]: prediction for i, prediction in zip(missing, predictions)})
+    for i, prediction in zip(missing, predictions):
+        results[i] = prediction
+    return results
+
+
+def _predict_results(model, response):
+    """
+    Convert predict() output to the list of predictions in LS format
+    """
+    from .response import ModelResponse
 
     # if there is no model version we will take the default
     if isinstance(response, ModelResponse):
@@ -77,7 +296,8 @@ def _predict():
         else:
             response.update_predictions_version()
 
-        response = response.serialize()
+        # PredictionValue objects are encoded straight to JSON, see serialization.default()
+        response = response.predictions
 
     res = response
     if res is None:
@@ -86,24 +306,130 @@ def _predict():
     if isinstance(res, dict):
         res = response.get("predictions", response)
 
-    return jsonify({'results': res})
+    return res
 
 
-@_server.route('/setup', methods=['POST'])
-@exception_handler
-def _setup():
-    data = request.json
+def _prediction_result(model, prediction):
+    """
+    Convert a single prediction yielded by predict() to LS format
+    """
+    # PredictionValue
+    if hasattr(prediction, 'serialize'):
+        if not prediction.model_version:
+            mv = model.model_version
+            if mv:
+                prediction.model_version = str(mv)
+    return prediction
+
+
+def _iter_response(model, response):
+    """
+    Iterate predictions yielded by predict() implemented as a generator or an async generator,
+    the next prediction isn't requested after the deadline
+    """
+    deadline = current_deadline()
+    if inspect.isasyncgen(response):
+        loop = asyncio.new_event_loop()
+        try:
+            while True:
+                deadline.check()
+                try:
+                    prediction = loop.run_until_complete(response.__anext__())
+                except StopAsyncIteration:
+                    break
+                yield _prediction_result(model, prediction)
+        finally:
+            loop.run_until_complete(response.aclose())
+            loop.close()
+    else:
+        try:
+            while True:
+                deadline.check()
+                try:
+                    prediction = next(response)
+                except StopIteration:
+                    break
+                yield _prediction_result(model, prediction)
+        finally:
+            response.close()
+
+
+def _accepts_ndjson(accept):
+    return NDJSON_CONTENT_TYPE in (accept or '')
+
+
+def _ndjson_line(prediction):
+    return serialization.dumps(prediction) + b'\n'
+
+
+def _ndjson_error(e):
+    """
+    The last line of the stream when predict() fails after the response has been started
+    """
+    if isinstance(e, DeadlineExceeded):
+        logger.warning(str(e))
+        return _ndjson_line({'status': 504, 'detail': str(e)})
+    logger.error(str(e), exc_info=True)
+    return _ndjson_line({'status': 500, 'detail': e.__class__.__name__ + ': ' + str(e)})
+
+
+def _stream_predictions(model, tasks, context, params, deadline=None):
+    """
+    Yield predictions as NDJSON lines as soon as predict() yields them.
+    Errors raised before the first line are propagated, later ones are reported in the last line.
+    :param deadline: deadline of the request, the response is streamed after the request handler returns
+    """
+    deadline = deadline or current_deadline()
+    lines = _prediction_lines(model, tasks, context, params)
+    try:
+        while True:
+            # the deadline is current only while predict() runs, a scope left open across yields
+            # would be reset out of order with the scopes of the server
+            with deadline_scope(deadline):
+                try:
+                    line = next(lines)
+                except StopIteration:
+                    return
+            yield line
+    finally:
+        lines.close()
+
+
+def _prediction_lines(model, tasks, context, params):
+    started = False
+    try:
+        with model.batch_writes():
+            current_deadline().check()
+            response = _resolve(model.predict(tasks, context=context, **params))
+            if inspect.isgenerator(response) or inspect.isasyncgen(response):
+                predictions = _iter_response(model, response)
+            else:
+                predictions = _predict_results(model, response)
+            for prediction in predictions:
+                yield _ndjson_line(prediction)
+                started = True
+    except Exception as e:
+        if not started:
+            raise
+        yield _ndjson_error(e)
+
+
+def _handle_setup(data):
     project_id = data.get('project').split('.', 1)[0]
     label_config = data.get('schema')
     extra_params = data.get('extra_params')
-    model = MODEL_CLASS(project_id=project_id,
-                        label_config=label_config)
+    # setup is requested when the model is connected or its settings are changed, start from a fresh instance
+    _invalidate_models(project_id)
+    model = _get_model(project_id, label_config)
 
-    if extra_params:
+    if extra_params and model.get('extra_params') != extra_params:
         model.set_extra_params(extra_params)
+        _invalidate_models(project_id)
+        # predictions may depend on extra params, e.g. the prompt
+        prediction_cache.invalidate_project(project_id)
 
     model_version = model.get('model_version')
-    return jsonify({'model_version': model_version})
+    return {'model_version': model_version}
 
 
 TRAIN_EVENTS = (
@@ -114,17 +440,134 @@ TRAIN_EVENTS = (
 )
 
 
-@_server.route('/webhook', methods=['POST'])
-def webhook():
-    data = request.json
+def _train(project_id, label_config, event, data):
+    model = _get_model(project_id, label_config)
+    with model.batch_writes():
+        _resolve(model.fit(event, data))
+    # fit may have changed the state setup() relies on, e.g. the model version or weights
+    _invalidate_models(project_id)
+    prediction_cache.invalidate_project(project_id)
+
+
+def _start_training(project_id, event, data, done):
+    """
+    Start training triggered by TRAINING_TRIGGER, in a job when the queue is enabled
+    """
+    label_config = data['project']['label_config']
+
+    def train():
+        try:
+            _train(project_id, label_config, event, data)
+        finally:
+            done()
+
+    def train_logged():
+        try:
+            train()
+        except Exception as e:
+            logger.error(f'Training of project {project_id} failed: {e}', exc_info=True)
+
+    if JOB_QUEUE is not None:
+        JOB_QUEUE.submit(project_id, event, train)
+    else:
+        threading.Thread(target=train_logged, name=f'training-{project_id}', daemon=True).start()
+
+
+def _handle_webhook(data):
     event = data.pop('action')
     if event not in TRAIN_EVENTS:
-        return jsonify({'status': 'Unknown event'}), 200
+        return {'status': 'Unknown event'}, 200
     project_id = str(data['project']['id'])
     label_config = data['project']['label_config']
-    model = MODEL_CLASS(project_id, label_config=label_config)
-    model.fit(event, data)
-    return jsonify({}), 201
+    if TRAINING_TRIGGER is not None:
+        return TRAINING_TRIGGER.event(project_id, event, data), 201
+    if JOB_QUEUE is not None:
+        job = JOB_QUEUE.submit(project_id, event, _train, project_id, label_config, event, data)
+        return {'job_id': job['id'], 'status': job['status']}, 201
+    _train(project_id, label_config, event, data)
+    return {}, 201
+
+
+def _handle_jobs(query):
+    if JOB_QUEUE is None:
+        return {'status': 'Training queue is disabled, set TRAINING_WORKERS to enable it'}, 404
+    try:
+        limit = int(query.get('limit', 100))
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return {'status': 'limit must be a positive integer'}, 400
+    return {'jobs': JOB_QUEUE.jobs(project_id=query.get('project'), status=query.get('status'),
+                                   limit=min(limit, MAX_JOBS_LIMIT))}, 200
+
+
+def _handle_job(job_id):
+    job = JOB_QUEUE.get(job_id) if JOB_QUEUE is not None else None
+    if job is None:
+        return {'status': 'Job not found'}, 404
+    return job, 200
+
+
+@_server.route('/predict', methods=['POST'])
+@with_deadline
+@admitted('predict')
+@exception_handler
+def _predict():
+    """
+    Predict tasks
+
+    Example request:
+    request = {
+            'tasks': tasks,
+            'model_version': model_version,
+            'project': '{project.id}.{int(project.created_at.timestamp())}',
+            'label_config': project.label_config,
+            'params': {
+                'login': project.task_data_login,
+                'password': project.task_data_password,
+                'context': context,
+            },
+        }
+
+    @return:
+    Predictions in LS format
+    """
+    project_id, label_config, tasks, context, params = _parse_predict_request(request.json)
+    model = _get_model(project_id, label_config)
+    if _accepts_ndjson(request.headers.get('Accept')):
+        lines = _stream_predictions(model, tasks, context, params, current_deadline())
+        # errors before the first prediction get the usual error answer
+        first = next(lines, None)
+        return Response(itertools.chain([first], lines) if first is not None else [],
+                        content_type=NDJSON_CONTENT_TYPE)
+    results = _get_predictions(model, project_id, label_config, tasks, context, params)
+    return jsonify({'results': results})
+
+
+@_server.route('/setup', methods=['POST'])
+@admitted('setup')
+@exception_handler
+def _setup():
+    return jsonify(_handle_setup(request.json))
+
+
+@_server.route('/webhook', methods=['POST'])
+@admitted('webhook')
+def webhook():
+    body, status = _handle_webhook(request.json)
+    return jsonify(body), status
+
+
+@_server.route('/jobs', methods=['GET'])
+def jobs():
+    body, status = _handle_jobs(request.args)
+    return jsonify(body), status
+
+
+@_server.route('/jobs/<job_id>', methods=['GET'])
+def job(job_id):
+    body, status = _handle_job(job_id)
+    return jsonify(body), status
 
 
 @_server.route('/health', methods=['GET'])
@@ -140,7 +583,19 @@ def health():
 @_server.route('/metrics', methods=['GET'])
 @exception_handler
 def metrics():
-    return jsonify({})
+    return Response(generate_latest(), content_type=CONTENT_TYPE)
+
+
+@_server.errorhandler(Overloaded)
+def overloaded_error_handler(error):
+    logger.warning(str(error))
+    return jsonify({'status': 503, 'detail': str(error)}), 503, {'Retry-After': str(error.retry_after)}
+
+
+@_server.errorhandler(DeadlineExceeded)
+def deadline_exceeded_error_handler(error):
+    logger.warning(str(error))
+    return jsonify({'status': 504, 'detail': str(error)}), 504
 
 
 @_server.errorhandler(FileNotFoundError)
@@ -180,9 +635,35 @@ def log_request_info():
     logger.debug('Request body: %s', request.get_data())
 
 
+# registered before log_response_info() to run after it, the log shows the uncompressed body
+@_server.after_request
+def compress_response(response):
+    """
+    Compress the response with the encoding negotiated by Accept-Encoding header, see label_studio_ml.compression
+    """
+    if COMPRESSION is None:
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.direct_passthrough or 'Content-Encoding' in response.headers or \
+            response.status_code < 200 or response.status_code in (204, 304):
+        return response
+    size = None if response.is_streamed else response.calculate_content_length()
+    encoding = COMPRESSION.negotiate(request.headers.get('Accept-Encoding'), response.content_type, size)
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = COMPRESSION.stream(response.response, encoding)
+    else:
+        response.set_data(COMPRESSION.compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
 @_server.after_request
 def log_response_info(response):
     logger.debug('Response status: %s', response.status)
     logger.debug('Response headers: %s', response.headers)
-    logger.debug('Response body: %s', response.get_data())
+    # reading a streamed body would buffer the whole stream
+    if not response.is_streamed:
+        logger.debug('Response body: %s', response.get_data())
     return response
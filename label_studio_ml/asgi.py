@@ -0,0 +1,407 @@
+"""
+ASGI serving mode for the prediction API.
+
+The app has the same routes as the Flask app from label_studio_ml.api, but requests are handled on an event loop:
+`async def predict()` of a model is awaited directly, so one process can hold hundreds of concurrent I/O-bound
+predictions (e.g. remote LLM calls), while sync models, model creation, setup and fit run in a bounded thread pool.
+
+Usage in _wsgi.py:
+    from label_studio_ml.asgi import init_asgi_app
+    app = init_asgi_app(model_class=NewModel)
+
+and run it with any ASGI server, e.g.:
+    uvicorn _wsgi:app --port 9090
+"""
+import os
+import json
+import base64
+import asyncio
+import inspect
+import logging
+import functools
+import threading
+import contextvars
+import traceback as tb
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from urllib.parse import parse_qsl
+
+from . import api, serialization
+from .admission import Overloaded
+from .deadline import DeadlineExceeded, current_deadline, deadline_scope, request_deadline
+from .singleflight import request_key
+from .metrics import generate_latest, CONTENT_TYPE
+
+logger = logging.getLogger(__name__)
+
+JSON_CONTENT_TYPE = 'application/json'
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status, body, content_type='text/plain; charset=utf-8', headers=None):
+        self.status, self.body, self.content_type, self.headers = status, body, content_type, headers or []
+
+
+class ASGIApp:
+    """
+    Minimal ASGI application serving /predict, /setup, /webhook, /jobs, /health and /metrics
+    """
+
+    def __init__(self, max_threads: int = None):
+        if max_threads is None:
+            max_threads = int(os.getenv('ASGI_THREADS', os.getenv('THREADS', 8)))
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix='asgi-sync')
+        self.routes = {
+            ('POST', '/predict'): self.predict,
+            ('POST', '/setup'): self.setup,
+            ('POST', '/webhook'): self.webhook,
+            ('GET', '/health'): self.health,
+            ('GET', '/'): self.health,
+            ('GET', '/metrics'): self.metrics,
+            ('GET', '/jobs'): self.jobs,
+        }
+
+    async def run_sync(self, f, *args, **kwargs):
+        """
+        Run blocking function in the thread pool, it sees the context variables of the request (e.g. the deadline)
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self.executor, functools.partial(context.run, f, *args, **kwargs))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        request = {
+            'method': scope['method'],
+            'path': scope['path'],
+            'query': dict(parse_qsl(scope.get('query_string', b'').decode('latin-1'))),
+            'headers': {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope.get('headers', [])},
+        }
+        # only predictions are cut off at the deadline
+        deadline = request_deadline(request['headers']) if request['path'] == '/predict' else None
+        with deadline_scope(deadline) if deadline is not None else nullcontext():
+            await self._handle(request, receive, send)
+
+    async def _handle(self, request, receive, send):
+        admission = admitted = None
+        try:
+            try:
+                self._check_auth(request)
+                handler = self.routes.get((request['method'], request['path']))
+                if handler is None and request['method'] == 'GET' and request['path'].startswith('/jobs/'):
+                    handler = self.job
+                if handler is None:
+                    raise HTTPError(404, b'Not Found')
+                admission = api.ADMISSION.get(request['path'].strip('/'))
+                if admission is not None:
+                    try:
+                        admitted = await admission.acquire_async()
+                    except Overloaded as e:
+                        admission = None
+                        raise HTTPError(503, json.dumps({'status': 503, 'detail': str(e)}).encode('utf-8'),
+                                        JSON_CONTENT_TYPE, [('Retry-After', str(e.retry_after))])
+                    except DeadlineExceeded as e:
+                        admission = None
+                        raise HTTPError(504, json.dumps({'status': 504, 'detail': str(e)}).encode('utf-8'),
+                                        JSON_CONTENT_TYPE)
+                request['body'] = await self._read_body(receive)
+                watcher = asyncio.ensure_future(self._watch_disconnect(receive))
+                try:
+                    status, body, content_type, headers = await handler(request)
+                finally:
+                    watcher.cancel()
+            except HTTPError as e:
+                status, body, content_type, headers = e.status, e.body, e.content_type, e.headers
+
+            body, headers = await self._compress(request, body, content_type, headers)
+            await self._send(send, status, body, content_type, headers)
+        finally:
+            # streamed responses hold the slot until they are sent
+            if admission is not None:
+                admission.release(admitted)
+
+    async def _compress(self, request, body, content_type, headers):
+        """
+        Compress the response with the encoding negotiated by Accept-Encoding header, see label_studio_ml.compression
+        """
+        compression = api.COMPRESSION
+        if compression is None:
+            return body, headers
+        headers = headers + [('Vary', 'Accept-Encoding')]
+        streamed = not isinstance(body, bytes)
+        encoding = compression.negotiate(request['headers'].get('accept-encoding'), content_type,
+                                         None if streamed else len(body))
+        if encoding is None:
+            return body, headers
+        if streamed:
+            body = compression.stream_async(body, encoding)
+        else:
+            # megabytes of predictions take milliseconds to compress, don't block the event loop
+            body = await self.run_sync(compression.compress, body, encoding)
+        return body, headers + [('Content-Encoding', encoding)]
+
+    @staticmethod
+    async def _watch_disconnect(receive):
+        """
+        Cancel the deadline of the request when the client disconnects before it's answered
+        """
+        deadline = current_deadline()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                deadline.cancel()
+                return
+
+    @staticmethod
+    async def _send(send, status, body, content_type, headers):
+        headers = [(b'content-type', content_type.encode('latin-1'))] + \
+                  [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+        if isinstance(body, bytes):
+            headers.append((b'content-length', str(len(body)).encode('latin-1')))
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': body})
+            return
+
+        # streamed response: body is an async iterator of chunks
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        try:
+            async for chunk in body:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            await body.aclose()
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def iterate_in_thread(self, iterator):
+        """
+        Run blocking iterator in one thread of the pool and hand its items over one by one,
+        the thread waits until the previous item is taken
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=1)
+        stopped = threading.Event()
+        done = object()
+
+        def put(item, error=None):
+            asyncio.run_coroutine_threadsafe(queue.put((item, error)), loop).result()
+
+        def produce():
+            try:
+                for item in iterator:
+                    put(item)
+                    if stopped.is_set():
+                        break
+                put(done)
+            except Exception as e:
+                put(None, e)
+            finally:
+                if hasattr(iterator, 'close'):
+                    iterator.close()
+
+        future = loop.run_in_executor(self.executor, produce)
+        try:
+            while True:
+                item, error = await queue.get()
+                if error is not None:
+                    raise error
+                if item is done:
+                    break
+                yield item
+        finally:
+            # the consumer is gone (e.g. the client disconnected), let the thread finish
+            stopped.set()
+            while not future.done():
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    await asyncio.sleep(0.001)
+            await future
+
+    async def _async_predictions(self, model, tasks, context, params):
+        """
+        Predictions of async def predict(), it may be an async generator
+        """
+        deadline = current_deadline()
+        deadline.check()
+        with model.batch_writes():
+            response = model.predict(tasks, context=context, **params)
+            if inspect.isasyncgen(response):
+                try:
+                    while True:
+                        deadline.check()
+                        try:
+                            prediction = await response.__anext__()
+                        except StopAsyncIteration:
+                            break
+                        yield api._prediction_result(model, prediction)
+                finally:
+                    await response.aclose()
+            else:
+                for prediction in api._predict_results(model, await response):
+                    yield prediction
+
+    async def _stream_predictions(self, model, tasks, context, params):
+        """
+        NDJSON lines of predictions, the same as label_studio_ml.api._stream_predictions() gives
+        """
+        if not (inspect.iscoroutinefunction(model.predict) or inspect.isasyncgenfunction(model.predict)):
+            lines = self.iterate_in_thread(api._stream_predictions(model, tasks, context, params,
+                                                                   current_deadline()))
+            try:
+                async for line in lines:
+                    yield line
+            finally:
+                await lines.aclose()
+            return
+
+        predictions = self._async_predictions(model, tasks, context, params)
+        started = False
+        try:
+            async for prediction in predictions:
+                yield api._ndjson_line(prediction)
+                started = True
+        except Exception as e:
+            if not started:
+                raise
+            yield api._ndjson_error(e)
+        finally:
+            await predictions.aclose()
+
+    @staticmethod
+    async def _chain(first, rest):
+        try:
+            yield first
+            async for item in rest:
+                yield item
+        finally:
+            await rest.aclose()
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    @staticmethod
+    def _check_auth(request):
+        if api.BASIC_AUTH is None:
+            return
+        auth = request['headers'].get('authorization', '')
+        try:
+            scheme, credentials = auth.split(' ', 1)
+            username, password = base64.b64decode(credentials).decode('utf-8').split(':', 1)
+        except ValueError:
+            username = password = None
+        if not (username is not None and scheme.lower() == 'basic' and
+                api.safe_str_cmp(username, api.BASIC_AUTH[0]) and api.safe_str_cmp(password, api.BASIC_AUTH[1])):
+            raise HTTPError(401, b'Unauthorized', headers=[('WWW-Authenticate', 'Basic realm="Login required"')])
+
+    @staticmethod
+    def _json(body, status=200):
+        return status, serialization.dumps(body), JSON_CONTENT_TYPE, []
+
+    def _error(self, request, e):
+        if isinstance(e, DeadlineExceeded):
+            logger.warning(str(e))
+            return self._json({'status': 504, 'detail': str(e), 'request': request['query']}, 504)
+        # the same answer as label_studio_ml.exceptions.exception_handler gives
+        traceback = tb.format_exc()
+        logger.error(traceback)
+        return self._json({
+            'status': 500,
+            'detail': e.__class__.__name__ + ': ' + str(e),
+            'request': request['query'],
+            'result': {'traceback': traceback}
+        }, 500)
+
+    async def predict(self, request):
+        try:
+            data = json.loads(request['body'])
+            project_id, label_config, tasks, context, params = api._parse_predict_request(data)
+            model = await self.run_sync(api._get_model, project_id, label_config)
+            if api._accepts_ndjson(request['headers'].get('accept')):
+                lines = self._stream_predictions(model, tasks, context, params)
+                # errors before the first prediction get the usual error answer
+                try:
+                    first = await lines.__anext__()
+                except StopAsyncIteration:
+                    return 200, b'', api.NDJSON_CONTENT_TYPE, []
+                return 200, self._chain(first, lines), api.NDJSON_CONTENT_TYPE, []
+            if inspect.iscoroutinefunction(model.predict) or inspect.isasyncgenfunction(model.predict):
+                async def predict():
+                    return [prediction async for prediction in self._async_predictions(model, tasks, context, params)]
+
+                if api.SINGLE_FLIGHT is not None:
+                    key = request_key(project_id, label_config, tasks, context, params, model.get('model_version'))
+                    results = await api.SINGLE_FLIGHT.do_async(key, predict)
+                else:
+                    results = await predict()
+            else:
+                results = await self.run_sync(api._get_predictions, model, project_id, label_config, tasks, context, params)
+        except Exception as e:
+            return self._error(request, e)
+        return self._json({'results': results})
+
+    async def setup(self, request):
+        try:
+            body = await self.run_sync(api._handle_setup, json.loads(request['body']))
+        except Exception as e:
+            return self._error(request, e)
+        return self._json(body)
+
+    async def webhook(self, request):
+        try:
+            body, status = await self.run_sync(api._handle_webhook, json.loads(request['body']))
+        except FileNotFoundError as e:
+            logger.warning('Got error: ' + str(e))
+            raise HTTPError(404, str(e).encode('utf-8'))
+        except Exception as e:
+            logger.error(str(e), exc_info=True)
+            raise HTTPError(500, str(e).encode('utf-8'))
+        return self._json(body, status)
+
+    async def jobs(self, request):
+        body, status = await self.run_sync(api._handle_jobs, request['query'])
+        return self._json(body, status)
+
+    async def job(self, request):
+        body, status = await self.run_sync(api._handle_job, request['path'][len('/jobs/'):])
+        return self._json(body, status)
+
+    async def health(self, request):
+        return self._json({
+            'status': 'UP',
+            'model_class': api.MODEL_CLASS.__name__
+        })
+
+    async def metrics(self, request):
+        return 200, generate_latest().encode('utf-8'), CONTENT_TYPE, []
+
+
+def init_asgi_app(model_class, basic_auth_user=None, basic_auth_pass=None, model_pool_size=None, max_threads=None):
+    """
+    Create ASGI app for the model class, parameters are the same as for label_studio_ml.api.init_app()
+    :param max_threads: size of the thread pool running sync code, ASGI_THREADS (or THREADS) env by default
+    """
+    api.init_app(model_class, basic_auth_user=basic_auth_user, basic_auth_pass=basic_auth_pass,
+                 model_pool_size=model_pool_size)
+    return ASGIApp(max_threads=max_threads)
@@ -0,0 +1,119 @@
+import json
+import logging
+import threading
+
+from threading import Lock
+from typing import Callable, List, Optional
+
+from .metrics import Histogram
+from .pool import config_hash
+from .deadline import Deadline, current_deadline, deadline_scope
+
+logger = logging.getLogger(__name__)
+
+PREDICT_BATCH_SIZE = Histogram(
+    'label_studio_ml_predict_batch_tasks',
+    'Number of tasks in coalesced predict batches',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+
+
+class _Batch:
+
+    def __init__(self):
+        self.tasks = []
+        self.requests = 0
+        self.deadlines = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class PredictBatcher:
+    """
+    Coalesces concurrent /predict requests of the same project, label config, context and params:
+    the first request waits up to `window` seconds for others to join (or until `max_batch_size` tasks
+    are collected), then predict() is called once for all tasks and the results are scattered back.
+    predict() must return exactly one prediction per task in the same order.
+    The batch runs until the latest deadline of its requests, each request stops waiting at its own one.
+    """
+
+    def __init__(self, predict: Callable, window: float, max_batch_size: int = 32):
+        """
+        :param predict: function(model, tasks, context, params) returning the list of predictions
+        :param window: seconds to wait for other requests
+        :param max_batch_size: maximum number of tasks in a batch
+        """
+        self.predict = predict
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def batch_key(project_id, label_config, context, params):
+        return (
+            project_id,
+            config_hash(label_config),
+            json.dumps([context, params], sort_keys=True, default=str)
+        )
+
+    def submit(self, model, project_id: Optional[str], label_config: Optional[str],
+               tasks: List, context, params) -> List:
+        """
+        Predict tasks as a part of a batch, returns predictions for the given tasks
+        """
+        if not isinstance(tasks, list) or not tasks or len(tasks) >= self.max_batch_size:
+            return self.predict(model, tasks, context, params)
+
+        key = self.batch_key(project_id, label_config, context, params)
+        with self._lock:
+            batch = self._pending.get(key)
+            leader = batch is None or len(batch.tasks) + len(tasks) > self.max_batch_size
+            if leader:
+                if batch is not None:
+                    # no room for this request, let the current batch go
+                    batch.full.set()
+                batch = self._pending[key] = _Batch()
+            start = len(batch.tasks)
+            batch.tasks.extend(tasks)
+            batch.requests += 1
+            batch.deadlines.append(current_deadline())
+            end = len(batch.tasks)
+            if end >= self.max_batch_size:
+                batch.full.set()
+                del self._pending[key]
+
+        if leader:
+            batch.full.wait(self.window)
+            with self._lock:
+                if self._pending.get(key) is batch:
+                    del self._pending[key]
+            # the batch is closed, nobody can join it anymore
+            with deadline_scope(Deadline.latest(batch.deadlines)):
+                self._run(model, batch, context, params)
+        elif not batch.done.wait(current_deadline().remaining()):
+            # the batch goes on for the other requests
+            current_deadline().check()
+
+        if batch.error is not None:
+            raise batch.error
+        if batch.requests == 1:
+            return batch.results
+        return batch.results[start:end]
+
+    def _run(self, model, batch: _Batch, context, params):
+        PREDICT_BATCH_SIZE.observe(len(batch.tasks))
+        logger.debug(f'Predict batch of {len(batch.tasks)} tasks from {batch.requests} requests')
+        try:
+            results = self.predict(model, batch.tasks, context, params)
+            if batch.requests > 1 and (not isinstance(results, list) or len(results) != len(batch.tasks)):
+                raise ValueError(
+                    f'Batched predict returned {len(results) if isinstance(results, list) else results!r} '
+                    f'predictions for {len(batch.tasks)} tasks, it must return one prediction per task '
+                    f'to use PREDICT_BATCH_WINDOW_MS')
+            batch.results = results
+        except Exception as e:
+            batch.error = e
+        finally:
+            batch.done.set()
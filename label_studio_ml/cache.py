@@ -1,8 +1,16 @@
 import os
+import time
+import logging
 import sqlite3
+import threading
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
 from threading import Lock
-from functools import lru_cache
+
+from .metrics import timed_cache_operation, CACHE_MEMORY_HITS, CACHE_MEMORY_MISSES, CACHE_LOCK_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
 
 
 class BaseCache(ABC):
@@ -43,18 +51,182 @@ class BaseCache(ABC):
         :return:
         """
 
+    def get_many(self, project_id, keys) -> dict:
+        """
+        Get several values of the project at once, backends override it to make a single round trip
+        :param project_id: project ID
+        :param keys: list of keys
+        :return: dict {key: value}, value is None for missing keys
+        """
+        return {key: self[project_id, key] for key in keys}
+
+    def set_many(self, project_id, mapping: dict):
+        """
+        Set several values of the project at once, backends override it to write them in a single transaction
+        :param project_id: project ID
+        :param mapping: dict {key: value}
+        :return:
+        """
+        for key, value in mapping.items():
+            self[project_id, key] = value
+
+    def projects(self) -> list:
+        """
+        Get IDs of all projects stored in cache
+        :return: list of project IDs
+        """
+        raise NotImplementedError(f'{self.__class__.__name__} does not support listing projects')
+
+    def keys(self, project_id) -> list:
+        """
+        Get all keys stored for the project
+        :param project_id: project ID
+        :return: list of keys
+        """
+        raise NotImplementedError(f'{self.__class__.__name__} does not support listing keys')
+
+    def delete_project(self, project_id):
+        """
+        Delete all keys of the project
+        :param project_id: project ID
+        :return:
+        """
+        for key in self.keys(project_id):
+            del self[project_id, key]
+
+
+_MISSING = object()
+
+
+class MemoryLayer:
+    """
+    Thread-safe in-memory LRU layer keyed by (project_id, key),
+    used as a read-through cache in front of persistent backends.
+    Values are invalidated per key, so writes of one project don't evict the others.
+    With `ttl` set, entries are dropped `ttl` seconds after they were put.
+    """
+
+    def __init__(self, capacity: int = 1024, ttl: float = None, name: str = 'memory'):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._hits_metric = CACHE_MEMORY_HITS.labels(backend=name)
+        self._misses_metric = CACHE_MEMORY_MISSES.labels(backend=name)
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+        # incremented on every write, protects from filling the layer with values read before the write
+        self._version = 0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def get(self, project_id_key: tuple, default=_MISSING):
+        with self._lock:
+            try:
+                value, deadline = self._data[project_id_key]
+            except KeyError:
+                self.misses += 1
+                self._misses_metric.inc()
+                return default
+            if deadline is not None and deadline <= time.monotonic():
+                del self._data[project_id_key]
+                self.misses += 1
+                self._misses_metric.inc()
+                return default
+            self._data.move_to_end(project_id_key)
+            self.hits += 1
+            self._hits_metric.inc()
+            return value
+
+    def put(self, project_id_key: tuple, value, version: int = None, ttl: float = None):
+        """
+        Put value into the layer
+        :param project_id_key: tuple (project_id, key)
+        :param value: value read from or written to the backend
+        :param version: layer version observed before reading the value from the backend,
+        the value is dropped if there were writes since then
+        :param ttl: keep the value at most `ttl` seconds, the layer ttl is used if it's shorter
+        :return:
+        """
+        if self.capacity <= 0:
+            return
+        if self.ttl is not None:
+            ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        deadline = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            self._data[project_id_key] = (value, deadline)
+            self._data.move_to_end(project_id_key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+    def invalidate(self, project_id_key: tuple):
+        with self._lock:
+            self._version += 1
+            self._data.pop(project_id_key, None)
+
+    def invalidate_project(self, project_id: str):
+        with self._lock:
+            self._version += 1
+            for project_id_key in [k for k in self._data if k[0] == project_id]:
+                del self._data[project_id_key]
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._data),
+            'capacity': self.capacity,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
 
 class SqliteCache(BaseCache):
-    def __init__(self, path: str, db_name: str = 'cache.db'):
+    """
+    SQLite backed cache. Every thread keeps its own connection to the database,
+    the database is switched to WAL journal mode, so readers don't block each other
+    and don't wait for writers, while writes are serialized with a lock.
+    Reads go through an in-memory LRU layer (CACHE_MEMORY_SIZE entries, 0 to disable).
+
+    The in-memory layer stays coherent across processes (e.g. gunicorn workers) sharing the same database:
+    every write bumps the generation counter of its project in the same transaction,
+    and readers check the cheap `PRAGMA data_version` first, re-reading the generations
+    and evicting projects changed by other connections only when the database was actually modified.
+    """
+    PRAGMAS = (
+        'PRAGMA journal_mode=WAL;',
+        'PRAGMA synchronous=NORMAL;',
+        'PRAGMA mmap_size=268435456;',
+        'PRAGMA temp_store=MEMORY;',
+    )
+
+    def __init__(self, path: str, db_name: str = 'cache.db', timeout: float = 30.0, memory_size: int = None):
         super(SqliteCache, self).__init__(path)
         os.makedirs(self.path, exist_ok=True)
         self.db_name = os.path.join(self.path, db_name)
+        self.timeout = timeout
         self.lock = Lock()
+        self._local = threading.local()
+        if memory_size is None:
+            memory_size = int(os.getenv('CACHE_MEMORY_SIZE', 1024))
+        self.memory = MemoryLayer(memory_size, name=self.__class__.__name__)
+        self._lock_wait = CACHE_LOCK_WAIT_SECONDS.labels(backend=self.__class__.__name__)
+        # generations of projects as they are known by the in-memory layer
+        self._generations = {}
 
-        # Establish a connection and create table if it doesn't exist
-        with self.lock, sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
+        # Create table if it doesn't exist
+        with self.lock:
+            self._connection().execute('''
                 CREATE TABLE IF NOT EXISTS cache (
                     project_id TEXT NOT NULL,
                     key TEXT NOT NULL,  
@@ -62,49 +234,628 @@ class SqliteCache(BaseCache):
                     PRIMARY KEY (project_id, key)
                 );
             ''')
+            self._connection().execute('''
+                CREATE TABLE IF NOT EXISTS generations (
+                    project_id TEXT NOT NULL PRIMARY KEY,
+                    generation INTEGER NOT NULL
+                );
+            ''')
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Get the connection of the current thread, open it on the first use.
+        Connections are never shared between processes: after fork (e.g. gunicorn --preload)
+        a worker opens its own one.
+        """
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is None or local.pid != os.getpid():
+            # isolation_level=None: autocommit for reads, explicit transactions for writes
+            conn = sqlite3.connect(self.db_name, timeout=self.timeout, isolation_level=None, cached_statements=32)
+            for pragma in self.PRAGMAS:
+                conn.execute(pragma)
+            local.conn = conn
+            local.pid = os.getpid()
+            local.data_version = None
+        return conn
+
+    @contextmanager
+    def _locked(self):
+        """
+        Acquire the write lock, recording how long it took
+        """
+        start = time.perf_counter()
+        with self.lock:
+            self._lock_wait.observe(time.perf_counter() - start)
+            yield
+
+    def _write(self, project_id: str, sql: str, seq_of_params: list, bump: bool = True):
+        """
+        Execute a write statement in its own transaction and bump the project generation,
+        must be called with self.lock held
+        :param bump: False for writes which don't invalidate the in-memory layers of other connections
+        """
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE;')
+        try:
+            if bump:
+                stored = conn.execute(
+                    'SELECT generation FROM generations WHERE project_id = ?;',
+                    (project_id,)).fetchone()
+            conn.executemany(sql, seq_of_params)
+            if bump:
+                conn.execute(
+                    'INSERT INTO generations (project_id, generation) VALUES (?, 1) '
+                    'ON CONFLICT (project_id) DO UPDATE SET generation = generation + 1;',
+                    (project_id,))
+        except BaseException:
+            conn.execute('ROLLBACK;')
+            raise
+        conn.execute('COMMIT;')
+        if not bump:
+            return
+        stored = stored[0] if stored is not None else 0
+        if self._generations.get(project_id, 0) != stored:
+            # the project was modified by other connections since we last synced,
+            # once we record our generation _sync() won't notice that anymore
+            self.memory.invalidate_project(project_id)
+        # our own write is already reflected in the in-memory layer
+        self._generations[project_id] = stored + 1
+
+    def _sync(self, conn: sqlite3.Connection):
+        """
+        Evict projects modified by other connections from the in-memory layer.
+        `PRAGMA data_version` changes only when another connection commits to the database,
+        so in the common case it's the only statement executed.
+        """
+        if self.memory.capacity <= 0:
+            return
+        data_version = conn.execute('PRAGMA data_version;').fetchone()[0]
+        local = self._local
+        if getattr(local, 'data_version', None) == data_version:
+            return
+        local.data_version = data_version
+        for project_id, generation in conn.execute('SELECT project_id, generation FROM generations;'):
+            if self._generations.get(project_id) != generation:
+                self.memory.invalidate_project(project_id)
+                self._generations[project_id] = generation
+
+    def close(self):
+        """
+        Close the connection of the current thread
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
+
+    @timed_cache_operation('get')
+    def __getitem__(self, project_id_key):
+        conn = self._connection()
+        self._sync(conn)
+        value = self.memory.get(project_id_key)
+        if value is not _MISSING:
+            return value
+        version = self.memory.version
+        project_id, key = project_id_key
+        result = conn.execute(
+            'SELECT value FROM cache WHERE project_id = ? AND key = ?;',
+            (project_id, key)).fetchone()
+        value = result[0] if result is not None else None
+        self.memory.put(project_id_key, value, version)
+        return value
+
+    @timed_cache_operation('set')
+    def __setitem__(self, project_id_key, value):
+        project_id, key = project_id_key
+        if not isinstance(value, str):
+            raise ValueError('Value must be a string')
+        with self._locked():
+            try:
+                self._write(project_id, 'REPLACE INTO cache (project_id, key, value) VALUES (?, ?, ?);',
+                            [(project_id, key, value)])
+            finally:
+                self.memory.invalidate(project_id_key)
+            self.memory.put(project_id_key, value)
+
+    @timed_cache_operation('delete')
+    def __delitem__(self, project_id_key):
+        project_id, key = project_id_key
+        with self._locked():
+            try:
+                self._write(project_id, 'DELETE FROM cache WHERE project_id = ? AND key = ?;',
+                            [(project_id, key)])
+            finally:
+                self.memory.invalidate(project_id_key)
+
+    @timed_cache_operation('contains')
+    def __contains__(self, project_id_key):
+        conn = self._connection()
+        self._sync(conn)
+        value = self.memory.get(project_id_key)
+        if value is not _MISSING:
+            return value is not None
+        project_id, key = project_id_key
+        result = conn.execute(
+            'SELECT 1 FROM cache WHERE project_id = ? AND key = ?;',
+            (project_id, key)).fetchone()
+        return result is not None
+
+    @timed_cache_operation('get_many')
+    def get_many(self, project_id, keys) -> dict:
+        conn = self._connection()
+        self._sync(conn)
+        values = {}
+        missing = []
+        for key in keys:
+            value = self.memory.get((project_id, key))
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                values[key] = value
+        if missing:
+            version = self.memory.version
+            placeholders = ', '.join('?' * len(missing))
+            found = dict(conn.execute(
+                f'SELECT key, value FROM cache WHERE project_id = ? AND key IN ({placeholders});',
+                (project_id, *missing)).fetchall())
+            for key in missing:
+                values[key] = found.get(key)
+                self.memory.put((project_id, key), values[key], version)
+        return values
+
+    @timed_cache_operation('set_many')
+    def set_many(self, project_id, mapping: dict):
+        if not all(isinstance(value, str) for value in mapping.values()):
+            raise ValueError('Value must be a string')
+        if not mapping:
+            return
+        with self._locked():
+            try:
+                self._write(project_id, 'REPLACE INTO cache (project_id, key, value) VALUES (?, ?, ?);',
+                            [(project_id, key, value) for key, value in mapping.items()])
+            finally:
+                for key in mapping:
+                    self.memory.invalidate((project_id, key))
+            for key, value in mapping.items():
+                self.memory.put((project_id, key), value)
+
+    def projects(self) -> list:
+        return [row[0] for row in self._connection().execute('SELECT DISTINCT project_id FROM cache;')]
+
+    def keys(self, project_id) -> list:
+        return [row[0] for row in self._connection().execute(
+            'SELECT key FROM cache WHERE project_id = ?;', (project_id,))]
+
+    @timed_cache_operation('delete_project')
+    def delete_project(self, project_id):
+        with self._locked():
+            try:
+                self._write(project_id, 'DELETE FROM cache WHERE project_id = ?;', [(project_id,)])
+            finally:
+                self.memory.invalidate_project(project_id)
+
 
-    @lru_cache(maxsize=100)
+class RedisCache(BaseCache):
+    """
+    Redis backed cache, so several replicas of the ML backend on different nodes can share the state.
+    The state of each project is stored in a single hash `<prefix>:<project_id>`,
+    which can optionally expire `ttl` seconds after its last write.
+    Requires `redis` package: pip install redis
+    """
+
+    def __init__(self, path: str, url: str = None, prefix: str = None, ttl: int = None,
+                 max_connections: int = None, client=None):
+        super(RedisCache, self).__init__(path)
+        self.prefix = prefix or os.getenv('REDIS_KEY_PREFIX', 'ml-backend')
+        if ttl is None and os.getenv('REDIS_TTL'):
+            ttl = int(os.getenv('REDIS_TTL'))
+        self.ttl = ttl
+
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImportError('CACHE_TYPE=redis requires redis package, install it with: pip install redis')
+            url = url or os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+            if max_connections is None:
+                max_connections = int(os.getenv('REDIS_MAX_CONNECTIONS', 50))
+            pool = redis.BlockingConnectionPool.from_url(
+                url, max_connections=max_connections, decode_responses=True)
+            client = redis.Redis(connection_pool=pool)
+        self.client = client
+
+    def _name(self, project_id) -> str:
+        return f'{self.prefix}:{project_id}'
+
+    @timed_cache_operation('get')
     def __getitem__(self, project_id_key):
         project_id, key = project_id_key
-        with self.lock, sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                'SELECT value FROM cache WHERE project_id = ? AND key = ?;',
-                (project_id, key))
-            result = cursor.fetchone()
-            if result is None:
-                return result
-            return result[0]
+        value = self.client.hget(self._name(project_id), key)
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return value
 
+    @timed_cache_operation('set')
     def __setitem__(self, project_id_key, value):
         project_id, key = project_id_key
         if not isinstance(value, str):
             raise ValueError('Value must be a string')
-        with self.lock, sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute('REPLACE INTO cache (project_id, key, value) VALUES (?, ?, ?);',
-                           (project_id, key, value))
-        self.__getitem__.cache_clear()
+        name = self._name(project_id)
+        with self.client.pipeline() as pipe:
+            pipe.hset(name, key, value)
+            if self.ttl:
+                pipe.expire(name, self.ttl)
+            pipe.execute()
+
+    @timed_cache_operation('delete')
+    def __delitem__(self, project_id_key):
+        project_id, key = project_id_key
+        self.client.hdel(self._name(project_id), key)
+
+    @timed_cache_operation('contains')
+    def __contains__(self, project_id_key):
+        project_id, key = project_id_key
+        return bool(self.client.hexists(self._name(project_id), key))
+
+    @timed_cache_operation('get_many')
+    def get_many(self, project_id, keys) -> dict:
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self.client.hmget(self._name(project_id), keys)
+        return {
+            key: value.decode('utf-8') if isinstance(value, bytes) else value
+            for key, value in zip(keys, values)
+        }
+
+    @timed_cache_operation('set_many')
+    def set_many(self, project_id, mapping: dict):
+        if not all(isinstance(value, str) for value in mapping.values()):
+            raise ValueError('Value must be a string')
+        if not mapping:
+            return
+        name = self._name(project_id)
+        with self.client.pipeline() as pipe:
+            pipe.hset(name, mapping=mapping)
+            if self.ttl:
+                pipe.expire(name, self.ttl)
+            pipe.execute()
+
+    @staticmethod
+    def _str(value) -> str:
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def projects(self) -> list:
+        start = len(self.prefix) + 1
+        return [self._str(name)[start:] for name in self.client.scan_iter(match=f'{self.prefix}:*')]
+
+    def keys(self, project_id) -> list:
+        return [self._str(key) for key in self.client.hkeys(self._name(project_id))]
+
+    @timed_cache_operation('delete_project')
+    def delete_project(self, project_id):
+        self.client.delete(self._name(project_id))
+
+
+class LmdbCache(BaseCache):
+    """
+    LMDB backed cache. The database is memory-mapped and shared by all worker processes:
+    reads don't block each other and values are decoded straight from the map without intermediate copies,
+    which pays off for large values like prompts or parsed label configs of big projects.
+    Requires `lmdb` package: pip install lmdb
+    """
+
+    def __init__(self, path: str, db_name: str = 'cache.lmdb', map_size: int = None):
+        super(LmdbCache, self).__init__(path)
+        try:
+            import lmdb
+        except ImportError:
+            raise ImportError('CACHE_TYPE=lmdb requires lmdb package, install it with: pip install lmdb')
+        self._lmdb = lmdb
+        os.makedirs(self.path, exist_ok=True)
+        self.db_name = os.path.join(self.path, db_name)
+        if map_size is None:
+            map_size = int(os.getenv('LMDB_MAP_SIZE', 1 << 30))
+        self.map_size = map_size
+        self.lock = Lock()
+        self._env = None
+        self._pid = None
+        self._environment()
+
+    def _environment(self):
+        """
+        Get the LMDB environment, it's opened once per process,
+        so workers forked after the cache creation (e.g. gunicorn --preload) open their own one
+        """
+        env = self._env
+        if env is None or self._pid != os.getpid():
+            with self.lock:
+                if self._env is None or self._pid != os.getpid():
+                    if self._env is not None:
+                        # the environment inherited from the parent process can't be used after fork,
+                        # it has to be closed before the path can be opened again
+                        self._env.close()
+                    self._env = self._lmdb.open(self.db_name, map_size=self.map_size, max_dbs=0)
+                    self._pid = os.getpid()
+                env = self._env
+        return env
+
+    @staticmethod
+    def _key(project_id, key) -> bytes:
+        return f'{project_id}\x00{key}'.encode('utf-8')
+
+    @staticmethod
+    def _decode(buffer):
+        return str(buffer, 'utf-8') if buffer is not None else None
+
+    def close(self):
+        if self._env is not None:
+            self._env.close()
+        self._env = None
+
+    @timed_cache_operation('get')
+    def __getitem__(self, project_id_key):
+        with self._environment().begin(buffers=True) as txn:
+            return self._decode(txn.get(self._key(*project_id_key)))
+
+    @timed_cache_operation('set')
+    def __setitem__(self, project_id_key, value):
+        if not isinstance(value, str):
+            raise ValueError('Value must be a string')
+        with self._environment().begin(write=True) as txn:
+            txn.put(self._key(*project_id_key), value.encode('utf-8'))
+
+    @timed_cache_operation('delete')
+    def __delitem__(self, project_id_key):
+        with self._environment().begin(write=True) as txn:
+            txn.delete(self._key(*project_id_key))
+
+    @timed_cache_operation('contains')
+    def __contains__(self, project_id_key):
+        with self._environment().begin(buffers=True) as txn:
+            return txn.get(self._key(*project_id_key)) is not None
+
+    @timed_cache_operation('get_many')
+    def get_many(self, project_id, keys) -> dict:
+        with self._environment().begin(buffers=True) as txn:
+            return {key: self._decode(txn.get(self._key(project_id, key))) for key in keys}
+
+    @timed_cache_operation('set_many')
+    def set_many(self, project_id, mapping: dict):
+        if not all(isinstance(value, str) for value in mapping.values()):
+            raise ValueError('Value must be a string')
+        with self._environment().begin(write=True) as txn:
+            for key, value in mapping.items():
+                txn.put(self._key(project_id, key), value.encode('utf-8'))
+
+    def projects(self) -> list:
+        projects = []
+        with self._environment().begin() as txn:
+            for raw_key in txn.cursor().iternext(keys=True, values=False):
+                project_id = raw_key.split(b'\x00', 1)[0].decode('utf-8')
+                if not projects or projects[-1] != project_id:
+                    projects.append(project_id)
+        return projects
+
+    def _project_keys(self, txn, project_id) -> list:
+        prefix = self._key(project_id, '')
+        cursor = txn.cursor()
+        keys = []
+        if cursor.set_range(prefix):
+            for raw_key in cursor.iternext(keys=True, values=False):
+                if not raw_key.startswith(prefix):
+                    break
+                keys.append(raw_key)
+        return keys
+
+    def keys(self, project_id) -> list:
+        start = len(self._key(project_id, ''))
+        with self._environment().begin() as txn:
+            return [raw_key[start:].decode('utf-8') for raw_key in self._project_keys(txn, project_id)]
+
+    @timed_cache_operation('delete_project')
+    def delete_project(self, project_id):
+        with self._environment().begin(write=True) as txn:
+            for raw_key in self._project_keys(txn, project_id):
+                txn.delete(raw_key)
+
+
+class TieredCache(BaseCache):
+    """
+    Two-level cache: bounded in-memory L1 with TTL on top of any persistent L2 cache from create_cache().
+    L1 entries live at most `ttl` seconds, which also bounds how long other workers' writes may stay unseen.
+    Keys can have their own TTL (set_with_ttl), expiration times are stored in L2 next to the values,
+    so all workers honor them and they survive restarts.
+    Compaction runs every `compaction_interval` seconds in a background thread, it deletes expired keys
+    and projects which haven't been written for `project_ttl` seconds.
+    """
+    EXPIRES_PREFIX = '__expires__:'
+    UPDATED_AT = '__updated_at__'
+
+    def __init__(self, path: str, backend=None, capacity: int = None, ttl: float = None,
+                 project_ttl: float = None, compaction_interval: float = None, **backend_kwargs):
+        super(TieredCache, self).__init__(path)
+        if backend is None:
+            backend = os.getenv('CACHE_TIERED_BACKEND', 'sqlite')
+        self.l2 = backend if isinstance(backend, BaseCache) else create_cache(backend, path, **backend_kwargs)
+
+        if capacity is None:
+            capacity = int(os.getenv('CACHE_L1_SIZE', 1024))
+        if ttl is None:
+            ttl = float(os.getenv('CACHE_L1_TTL', 60))
+        if project_ttl is None and os.getenv('CACHE_PROJECT_TTL'):
+            project_ttl = float(os.getenv('CACHE_PROJECT_TTL'))
+        if compaction_interval is None:
+            compaction_interval = float(os.getenv('CACHE_COMPACTION_INTERVAL', 3600))
+        self.l1 = MemoryLayer(capacity, ttl=ttl, name=self.__class__.__name__)
+        self.project_ttl = project_ttl
+        self.compaction_interval = compaction_interval
+
+        self._stop = threading.Event()
+        self._compaction_thread = None
+        if compaction_interval > 0:
+            self._compaction_thread = threading.Thread(
+                target=self._compaction_loop, name='cache-compaction', daemon=True)
+            self._compaction_thread.start()
+
+    def _expires_key(self, key) -> str:
+        return self.EXPIRES_PREFIX + key
+
+    def _is_reserved(self, key) -> bool:
+        return key == self.UPDATED_AT or key.startswith(self.EXPIRES_PREFIX)
+
+    @timed_cache_operation('get')
+    def __getitem__(self, project_id_key):
+        value = self.l1.get(project_id_key)
+        if value is not _MISSING:
+            return value
+        project_id, key = project_id_key
+        return self._get_many(project_id, [key])[key]
+
+    @timed_cache_operation('set')
+    def __setitem__(self, project_id_key, value):
+        project_id, key = project_id_key
+        self._set_many(project_id, {key: value})
+
+    def set_with_ttl(self, project_id_key, value, ttl: float):
+        """
+        Set value which expires in `ttl` seconds
+        """
+        project_id, key = project_id_key
+        self._set_many(project_id, {key: value}, ttl=ttl)
 
+    @timed_cache_operation('delete')
     def __delitem__(self, project_id_key):
         project_id, key = project_id_key
-        with self.lock, sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM cache WHERE project_id = ? AND key = ?;',
-                           (project_id, key))
-        self.__getitem__.cache_clear()
+        try:
+            del self.l2[project_id, key]
+            del self.l2[project_id, self._expires_key(key)]
+        finally:
+            self.l1.invalidate(project_id_key)
 
+    @timed_cache_operation('contains')
     def __contains__(self, project_id_key):
+        value = self.l1.get(project_id_key)
+        if value is not _MISSING:
+            return value is not None
         project_id, key = project_id_key
-        with self.lock, sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT 1 FROM cache WHERE project_id = ? AND key = ?;',
-                           (project_id, key))
-            return cursor.fetchone() is not None
+        return self._get_many(project_id, [key])[key] is not None
+
+    @timed_cache_operation('get_many')
+    def get_many(self, project_id, keys) -> dict:
+        return self._get_many(project_id, keys)
+
+    def _get_many(self, project_id, keys) -> dict:
+        values = {}
+        missing = []
+        for key in keys:
+            value = self.l1.get((project_id, key))
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                values[key] = value
+        if missing:
+            version = self.l1.version
+            stored = self.l2.get_many(project_id, missing + [self._expires_key(key) for key in missing])
+            now = time.time()
+            for key in missing:
+                value = stored[key]
+                expires = stored[self._expires_key(key)]
+                ttl = float(expires) - now if expires else None
+                if ttl is not None and ttl <= 0:
+                    # expired, compaction will delete it
+                    value, ttl = None, None
+                values[key] = value
+                self.l1.put((project_id, key), value, version, ttl=ttl)
+        return values
+
+    @timed_cache_operation('set_many')
+    def set_many(self, project_id, mapping: dict, ttl: float = None):
+        self._set_many(project_id, mapping, ttl)
+
+    def _set_many(self, project_id, mapping: dict, ttl: float = None):
+        if not all(isinstance(value, str) for value in mapping.values()):
+            raise ValueError('Value must be a string')
+        if not mapping:
+            return
+        now = time.time()
+        expires = repr(now + ttl) if ttl else ''
+        stored = dict(mapping)
+        for key in mapping:
+            stored[self._expires_key(key)] = expires
+        stored[self.UPDATED_AT] = repr(now)
+        try:
+            self.l2.set_many(project_id, stored)
+        finally:
+            for key in mapping:
+                self.l1.invalidate((project_id, key))
+        for key, value in mapping.items():
+            self.l1.put((project_id, key), value, ttl=ttl)
+
+    def projects(self) -> list:
+        return self.l2.projects()
+
+    def keys(self, project_id) -> list:
+        return [key for key in self.l2.keys(project_id) if not self._is_reserved(key)]
+
+    @timed_cache_operation('delete_project')
+    def delete_project(self, project_id):
+        try:
+            self.l2.delete_project(project_id)
+        finally:
+            self.l1.invalidate_project(project_id)
+
+    @timed_cache_operation('compact')
+    def compact(self) -> int:
+        """
+        Delete expired keys and stale projects from L2
+        :return: number of deleted projects and keys
+        """
+        now = time.time()
+        deleted = 0
+        for project_id in self.l2.projects():
+            keys = self.l2.keys(project_id)
+            if self.project_ttl:
+                updated_at = self.l2[project_id, self.UPDATED_AT]
+                if updated_at and float(updated_at) + self.project_ttl <= now:
+                    logger.debug(f'Compaction: delete stale project {project_id}')
+                    self.delete_project(project_id)
+                    deleted += 1
+                    continue
+            expires_keys = [key for key in keys if key.startswith(self.EXPIRES_PREFIX)]
+            if not expires_keys:
+                continue
+            for expires_key, expires in self.l2.get_many(project_id, expires_keys).items():
+                if expires and float(expires) <= now:
+                    key = expires_key[len(self.EXPIRES_PREFIX):]
+                    del self[project_id, key]
+                    deleted += 1
+        return deleted
+
+    def _compaction_loop(self):
+        while not self._stop.wait(self.compaction_interval):
+            try:
+                deleted = self.compact()
+                logger.debug(f'Cache compaction finished, {deleted} projects and keys deleted')
+            except Exception:
+                logger.error('Cache compaction failed', exc_info=True)
+
+    def close(self):
+        self._stop.set()
+        close = getattr(self.l2, 'close', None)
+        if close:
+            close()
 
 
 def create_cache(cache_type, path, **kwargs):
     if cache_type == 'sqlite':
         return SqliteCache(path, **kwargs)
+    elif cache_type == 'redis':
+        return RedisCache(path, **kwargs)
+    elif cache_type == 'lmdb':
+        return LmdbCache(path, **kwargs)
+    elif cache_type == 'tiered':
+        return TieredCache(path, **kwargs)
     else:
         raise ValueError(f"Unsupported cache type: {cache_type}")
@@ -0,0 +1,201 @@
+"""
+Compression of the ML backend responses.
+
+Predictions of segmentation models carry RLE masks as long integer lists, the /predict answer for one task is
+often megabytes of JSON, while it compresses by an order of magnitude. With RESPONSE_COMPRESSION enabled
+JSON, NDJSON and text responses of at least RESPONSE_COMPRESSION_MIN_SIZE bytes are compressed with the best
+encoding both sides support according to the request Accept-Encoding header:
+- zstd, if `zstandard` package is installed (`pip install zstandard`), it's several times faster than gzip
+- gzip
+
+RESPONSE_COMPRESSION is `auto` (zstd if available and gzip) or the list of encodings in order of preference,
+e.g. `gzip` or `zstd,gzip`. Streamed responses are compressed chunk by chunk and flushed after every chunk,
+so clients get each prediction as soon as it's ready.
+"""
+import zlib
+import logging
+
+from typing import AsyncIterator, Dict, Iterable, Iterator, Optional, Sequence
+
+from .metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+ENCODINGS = ('zstd', 'gzip')
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+# fast levels: responses are compressed once per request, CPU time matters more than the last percents of size
+DEFAULT_LEVELS = {'gzip': 1, 'zstd': 3}
+
+RESPONSE_COMPRESSION_BYTES = Counter(
+    'label_studio_ml_response_compression_bytes',
+    'Size of compressed responses before (input) and after (output) compression',
+    labelnames=('encoding', 'stage'))
+
+
+class _GzipCompressor:
+
+    def __init__(self, level: int):
+        # wbits 16 + MAX_WBITS writes gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        out = self._compressor.compress(data)
+        if flush:
+            out += self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        return out
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _ZstdCompressor:
+
+    def __init__(self, level: int):
+        import zstandard
+        self._flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        out = self._compressor.compress(data)
+        if flush:
+            out += self._compressor.flush(self._flush_block)
+        return out
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+COMPRESSORS = {'gzip': _GzipCompressor, 'zstd': _ZstdCompressor}
+
+
+def zstd_available() -> bool:
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """
+    Accept-Encoding header as {encoding: quality}
+    """
+    accepted = {}
+    for item in (header or '').split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+class ResponseCompression:
+    """
+    Negotiates the response encoding and compresses response bodies, whole or streamed
+    """
+
+    def __init__(self, encodings: Sequence[str] = ENCODINGS, min_size: int = 1024, levels: Dict[str, int] = None):
+        """
+        :param encodings: encodings in order of preference, zstd is skipped if zstandard isn't installed
+        :param min_size: smaller responses are sent as is, compression wouldn't pay off
+        :param levels: compression level by encoding, DEFAULT_LEVELS by default
+        """
+        for encoding in encodings:
+            if encoding not in COMPRESSORS:
+                raise ValueError(f'Unknown response compression: {encoding}, use {" or ".join(ENCODINGS)}')
+        if 'zstd' in encodings and not zstd_available():
+            logger.warning('zstd response compression requires zstandard package, install it with '
+                           '`pip install zstandard`')
+            encodings = [encoding for encoding in encodings if encoding != 'zstd']
+        self.encodings = tuple(encodings)
+        self.min_size = min_size
+        self.levels = dict(DEFAULT_LEVELS, **(levels or {}))
+
+    @classmethod
+    def from_config(cls, value: Optional[str], min_size: int = 1024) -> Optional['ResponseCompression']:
+        """
+        Create from RESPONSE_COMPRESSION value: empty or 0 disables compression, `auto` enables all encodings
+        """
+        value = (value or '').strip().lower()
+        if value in ('', '0', 'false', 'no'):
+            return None
+        if value in ('1', 'true', 'yes', 'auto'):
+            return cls(min_size=min_size)
+        return cls([encoding.strip() for encoding in value.split(',') if encoding.strip()], min_size=min_size)
+
+    def negotiate(self, accept_encoding: Optional[str], content_type: Optional[str],
+                  size: Optional[int] = None) -> Optional[str]:
+        """
+        Encoding of the response, None if it should be sent as is
+        :param size: body size, None for streamed responses
+        """
+        if size is not None and size < self.min_size:
+            return None
+        if not content_type or not content_type.startswith(COMPRESSIBLE_TYPES):
+            return None
+        accepted = parse_accept_encoding(accept_encoding)
+        best, best_quality = None, 0.0
+        for encoding in self.encodings:
+            quality = accepted.get(encoding, accepted.get('*', 0.0))
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def compressor(self, encoding: str):
+        return COMPRESSORS[encoding](self.levels[encoding])
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        compressor = self.compressor(encoding)
+        out = compressor.compress(body) + compressor.finish()
+        self._count(encoding, len(body), len(out))
+        return out
+
+    def stream(self, chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+        """
+        Compress streamed response, every chunk is flushed to the client
+        """
+        compressor = self.compressor(encoding)
+        size = compressed = 0
+        try:
+            for chunk in chunks:
+                out = compressor.compress(chunk, flush=True)
+                size, compressed = size + len(chunk), compressed + len(out)
+                yield out
+            out = compressor.finish()
+            yield out
+            self._count(encoding, size, compressed + len(out))
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    async def stream_async(self, chunks: AsyncIterator[bytes], encoding: str) -> AsyncIterator[bytes]:
+        """
+        The same as stream() for ASGI responses
+        """
+        compressor = self.compressor(encoding)
+        size = compressed = 0
+        try:
+            async for chunk in chunks:
+                out = compressor.compress(chunk, flush=True)
+                size, compressed = size + len(chunk), compressed + len(out)
+                yield out
+            out = compressor.finish()
+            yield out
+            self._count(encoding, size, compressed + len(out))
+        finally:
+            await chunks.aclose()
+
+    @staticmethod
+    def _count(encoding: str, size: int, compressed: int):
+        RESPONSE_COMPRESSION_BYTES.labels(encoding=encoding, stage='input').inc(size)
+        RESPONSE_COMPRESSION_BYTES.labels(encoding=encoding, stage='output').inc(compressed)
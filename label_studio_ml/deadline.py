@@ -0,0 +1,183 @@
+"""
+Request deadlines.
+
+Label Studio stops waiting for /predict after its own timeout, but the backend would go on computing predictions
+nobody reads. Every /predict request gets a Deadline: `X-Request-Timeout` header (seconds) or PREDICT_TIMEOUT env,
+no limit by default. The deadline of the current request is available in predict() as `self.deadline`:
+
+    def predict(self, tasks, context=None, **kwargs):
+        for task in tasks:
+            self.deadline.check()  # raises DeadlineExceeded, the request is answered with 504
+            path = self.get_local_path(task['data']['image'], task_id=task['id'])  # gives up at the deadline
+            requests.get(url, timeout=self.deadline.timeout(10))  # 10 seconds at most
+
+The deadline is also cancelled when the client disconnects, so the remaining work is cut off early.
+"""
+import os
+import time
+import logging
+import threading
+
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Callable, Iterable, Mapping, Optional
+
+from .metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT_HEADER = 'X-Request-Timeout'
+
+DEADLINE_EXCEEDED = Counter(
+    'label_studio_ml_deadline_exceeded',
+    'Requests cut off because their deadline expired or the client disconnected')
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Deadline:
+    """
+    Point in time the request must be answered by, all methods are thread-safe
+    """
+
+    def __init__(self, timeout: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        """
+        :param timeout: seconds from now, None for no limit
+        """
+        self.clock = clock
+        self.expires_at = clock() + timeout if timeout is not None else None
+        self._cancelled = threading.Event()
+
+    @classmethod
+    def latest(cls, deadlines: Iterable['Deadline']) -> 'Deadline':
+        """
+        Deadline expiring with the last of the given ones, e.g. for work shared by several requests
+        """
+        deadline = cls()
+        expires = [d.expires_at for d in deadlines]
+        if expires and None not in expires:
+            deadline.expires_at = max(expires)
+        return deadline
+
+    def remaining(self) -> Optional[float]:
+        """
+        Seconds left, None for no limit
+        """
+        if self._cancelled.is_set():
+            return 0.0
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - self.clock())
+
+    def timeout(self, default: Optional[float] = None) -> Optional[float]:
+        """
+        Timeout for a blocking call: the default capped by the remaining time
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        return remaining if default is None else min(default, remaining)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def expired(self) -> bool:
+        return self.remaining() == 0
+
+    def cancel(self):
+        """
+        Cut off the work of the request, e.g. the client is gone
+        """
+        self._cancelled.set()
+
+    def check(self):
+        """
+        Raise DeadlineExceeded if the work should stop
+        """
+        if self._cancelled.is_set():
+            DEADLINE_EXCEEDED.inc()
+            raise DeadlineExceeded('Request was cancelled')
+        if self.expired():
+            DEADLINE_EXCEEDED.inc()
+            raise DeadlineExceeded('Request deadline exceeded')
+
+    def sleep(self, seconds: float):
+        """
+        time.sleep() interrupted by the deadline
+        """
+        self.check()
+        remaining = self.remaining()
+        if remaining is not None and remaining < seconds:
+            self._cancelled.wait(remaining)
+            self.check()
+        elif self._cancelled.wait(seconds):
+            self.check()
+
+    def run(self, f: Callable, *args, **kwargs):
+        """
+        Call blocking f() which has no timeout of its own and stop waiting for it at the deadline.
+        f() isn't interrupted: it finishes in its own daemon thread and its result is dropped,
+        so abandoned calls never hold up the calls of other requests.
+        """
+        self.check()
+        if self.remaining() is None:
+            return f(*args, **kwargs)
+        future = Future()
+        context = copy_context()
+
+        def call():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(context.run(f, *args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=call, name='deadline', daemon=True).start()
+        try:
+            return future.result(self.remaining())
+        except FutureTimeoutError:
+            # nobody waits for the result anymore, don't start f() if the thread hasn't yet
+            future.cancel()
+            self.check()
+            raise
+
+
+_current: ContextVar[Optional[Deadline]] = ContextVar('label_studio_ml_deadline', default=None)
+
+
+def current_deadline() -> Deadline:
+    """
+    Deadline of the request being processed, without a limit outside of requests
+    """
+    deadline = _current.get()
+    return deadline if deadline is not None else Deadline()
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]):
+    """
+    Make the deadline current in the block
+    """
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def request_deadline(headers: Mapping[str, str]) -> Deadline:
+    """
+    Deadline of a request: X-Request-Timeout header or PREDICT_TIMEOUT env, in seconds, 0 for no limit
+    """
+    value = headers.get(TIMEOUT_HEADER) or headers.get(TIMEOUT_HEADER.lower()) or os.getenv('PREDICT_TIMEOUT')
+    try:
+        timeout = float(value) if value else 0
+    except ValueError:
+        logger.warning(f'Invalid request timeout {value!r} is ignored')
+        timeout = 0
+    return Deadline(timeout if timeout > 0 else None)
@@ -6,6 +6,7 @@ import logging
 
 from typing import List, Dict, Optional
 from label_studio_ml.model import LabelStudioMLBase
+from label_studio_ml.registry import ModelRegistry
 from label_studio_ml.response import ModelResponse
 from transformers import pipeline, Pipeline
 from itertools import groupby
@@ -15,26 +16,25 @@ from datasets import Dataset, ClassLabel, Value, Sequence, Features
 from functools import partial
 
 logger = logging.getLogger(__name__)
-_model: Optional[Pipeline] = None
 MODEL_DIR = os.getenv('MODEL_DIR', './results')
 BASELINE_MODEL_NAME = os.getenv('BASELINE_MODEL_NAME', 'dslim/bert-base-NER')
 FINETUNED_MODEL_NAME = os.getenv('FINETUNED_MODEL_NAME', 'finetuned_model')
 
 
-def reload_model():
-    global _model
-    _model = None
+def load_model() -> Pipeline:
     try:
         chk_path = str(pathlib.Path(MODEL_DIR) / FINETUNED_MODEL_NAME)
         logger.info(f"Loading finetuned model from {chk_path}")
-        _model = pipeline("ner", model=chk_path, tokenizer=chk_path)
+        return pipeline("ner", model=chk_path, tokenizer=chk_path)
     except:
         # if finetuned model is not available, use the baseline model with the original labels
         logger.info(f"Loading baseline model {BASELINE_MODEL_NAME}")
-        _model = pipeline("ner", model=BASELINE_MODEL_NAME, tokenizer=BASELINE_MODEL_NAME)
+        return pipeline("ner", model=BASELINE_MODEL_NAME, tokenizer=BASELINE_MODEL_NAME)
 
 
-reload_model()
+# the pipeline shared by all requests, replaced atomically after training
+_models = ModelRegistry()
+_models.load(load_model)
 
 
 class HuggingFaceNER(LabelStudioMLBase):
@@ -71,7 +71,8 @@ class HuggingFaceNER(LabelStudioMLBase):
         texts = [task['data'][value] for task in tasks]
 
         # run predictions
-        model_predictions = _model(texts)
+        with _models.acquire() as model:
+            model_predictions = model(texts)
 
         predictions = []
         for prediction in model_predictions:
@@ -244,6 +245,6 @@ class HuggingFaceNER(LabelStudioMLBase):
         logger.info(f"Model is trained and saved as {chk_path}")
         trainer.save_model(chk_path)
 
-        # reload model
-        # TODO: this is not thread-safe, should be done with critical section
-        reload_model()
+        # the finetuned model is fully loaded before it replaces the current one,
+        # predictions in flight finish with the old one
+        _models.load(load_model)
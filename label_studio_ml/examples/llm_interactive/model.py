@@ -10,8 +10,10 @@ from PIL import Image
 from io import BytesIO
 from typing import Union, List, Dict, Optional, Any, Tuple
 from tenacity import retry, stop_after_attempt, wait_random
+from tenacity.stop import stop_base
 from openai import OpenAI, AzureOpenAI
 
+from label_studio_ml.deadline import DEADLINE_EXCEEDED, DeadlineExceeded, current_deadline
 from label_studio_ml.model import LabelStudioMLBase
 from label_studio_ml.response import ModelResponse
 from label_studio_sdk.objects import PredictionValue
@@ -20,8 +22,31 @@ from label_studio_sdk.label_interface.control_tags import ControlTag, ObjectTag
 
 logger = logging.getLogger(__name__)
 
+RETRY_MIN_WAIT = 5
 
-@retry(wait=wait_random(min=5, max=10), stop=stop_after_attempt(6))
+
+class stop_before_deadline(stop_base):
+    """
+    Stop retrying when the request deadline doesn't leave time for the next wait,
+    the request is answered with 504 instead of RetryError
+    """
+
+    def __init__(self, wait: float):
+        self.wait = wait
+
+    def __call__(self, retry_state) -> bool:
+        deadline = current_deadline()
+        deadline.check()
+        remaining = deadline.remaining()
+        if remaining is not None and remaining < self.wait:
+            DEADLINE_EXCEEDED.inc()
+            raise DeadlineExceeded('Request deadline leaves no time to retry') from retry_state.outcome.exception()
+        return False
+
+
+@retry(wait=wait_random(min=RETRY_MIN_WAIT, max=10),
+       stop=stop_after_attempt(6) | stop_before_deadline(RETRY_MIN_WAIT),
+       sleep=lambda seconds: current_deadline().sleep(seconds))
 def chat_completion_call(messages, params, *args, **kwargs):
     """
     Request to OpenAI API (OpenAI, Azure)
@@ -66,7 +91,8 @@ def chat_completion_call(messages, params, *args, **kwargs):
         "temperature": params.get("temperature", OpenAIInteractive.TEMPERATURE)
     }
 
-    completion = client.chat.completions.create(**request_params)
+    # the request is cut off at the deadline of /predict instead of the default 10 minutes
+    completion = client.chat.completions.create(**request_params, timeout=current_deadline().timeout(600))
 
     return completion
 
@@ -111,8 +137,9 @@ class OpenAIInteractive(LabelStudioMLBase):
                 self.DEFAULT_PROMPT = f.read()
 
     def _ocr(self, image_url):
-        # Open the image containing the text
-        response = requests.get(image_url)
+        # Open the image containing the text, requests doesn't accept zero timeout of an expired deadline
+        self.deadline.check()
+        response = requests.get(image_url, timeout=self.deadline.timeout())
         image = Image.open(BytesIO(response.content))
 
         # Run OCR on the image
@@ -6,6 +6,7 @@ import numpy as np
 
 from typing import List, Dict, Optional
 from label_studio_ml.model import LabelStudioMLBase
+from label_studio_ml.registry import ModelRegistry
 from label_studio_ml.response import ModelResponse
 from label_studio_ml.utils import DATA_UNDEFINED_NAME
 from sklearn.linear_model import LogisticRegression
@@ -14,7 +15,8 @@ from sklearn.pipeline import make_pipeline, Pipeline
 
 logger = logging.getLogger(__name__)
 
-_model: Optional[Pipeline] = None
+# the trained pipeline shared by all requests, replaced atomically after training
+_models = ModelRegistry()
 
 
 class SklearnTextClassifier(LabelStudioMLBase):
@@ -35,30 +37,26 @@ class SklearnTextClassifier(LabelStudioMLBase):
     def setup(self):
         self.set("model_version", f'{self.__class__.__name__}-v0.0.1')
 
-    def get_model(self, blank=False):
-        global _model
-        # Lazy initialization of the model
-        # If the model is not already initialized, it is initialized here
-        if _model is not None:
-            logger.debug('Model is already initialized')
-            return _model
-
+    def get_model(self, blank=False) -> Pipeline:
+        """Load the model from MODEL_DIR/model.pkl, or create a new one
+        if it doesn't exist or `blank` is set
+        """
         model_path = os.path.join(self.MODEL_DIR, 'model.pkl')
         if not os.path.exists(model_path) or blank:
-            _model = make_pipeline(
+            model = make_pipeline(
                 TfidfVectorizer(ngram_range=(1, 3), token_pattern=r"(?u)\b\w\w+\b|\w"),
                 LogisticRegression(C=self.LOGISTIC_REGRESSION_C, verbose=True)
             )
             config = self.get_label_studio_parameters()
             logger.info(f'Creating a new model using labels: {config["labels"]}')
-            _model.fit(X=config['labels'], y=list(range(len(config['labels']))))
+            model.fit(X=config['labels'], y=list(range(len(config['labels']))))
             logger.debug('Created a new model with labels: %s', config['labels'])
         else:
             logger.info(f'Loading model from {model_path}')
             with open(model_path, 'rb') as f:
-                _model = pickle.load(f)
+                model = pickle.load(f)
 
-        return _model
+        return model
 
     def get_label_studio_parameters(self) -> Dict:
         # Expect labeling config to have only one output of <Choices> type and one input of <Text> type
@@ -87,7 +85,6 @@ class SklearnTextClassifier(LabelStudioMLBase):
         ModelResponse: A ModelResponse object that contains the predictions for each task.
 
         """
-        model = self.get_model()
         config = self.get_label_studio_parameters()
 
         # Collect input texts
@@ -99,7 +96,9 @@ class SklearnTextClassifier(LabelStudioMLBase):
 
         # Get model predictions
         # The model's predict_proba method is used to get the probabilities of each label for each task
-        probabilities = model.predict_proba(input_texts)
+        # Lazy initialization of the model: it's loaded on the first request
+        with _models.acquire(self.get_model) as model:
+            probabilities = model.predict_proba(input_texts)
 
         # The label with the highest probability is selected as the predicted label for each task
         predicted_label_indices = np.argmax(probabilities, axis=1)
@@ -195,7 +194,6 @@ class SklearnTextClassifier(LabelStudioMLBase):
         model_path = os.path.join(self.MODEL_DIR, f'model.pkl')
         with open(model_path, 'wb') as f:
             pickle.dump(model, f)
-        # TODO: not thread safe
-        global _model
-        _model = None
-        self.get_model()
+
+        # the trained model replaces the current one, predictions in flight finish with the old one
+        _models.load(lambda: model)
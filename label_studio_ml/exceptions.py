@@ -3,6 +3,8 @@ import logging
 
 from flask import request, jsonify, make_response
 
+from .deadline import DeadlineExceeded
+
 logger = logging.getLogger(__name__)
 
 
@@ -16,7 +18,7 @@ def answer(status=0, msg='', result=None):
         msg = 'ok'
 
     a = {"status": status, "detail": msg}
-    a.update({'request': request.args})
+    a.update({'request': request.args.to_dict()})
 
     if result is not None:
         a.update({"result": result})
@@ -48,6 +50,11 @@ def exception_handler(f):
 
             return answer(e.status, e.msg, e.result)
 
+        except DeadlineExceeded as e:
+            # the client has given up, nothing to debug
+            logger.warning(str(e))
+            return answer(504, str(e))
+
         except Exception as e:
             traceback = tb.format_exc()
             logger.error(traceback)
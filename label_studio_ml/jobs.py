@@ -0,0 +1,247 @@
+"""
+Background training jobs.
+
+With the queue enabled (TRAINING_WORKERS > 0) /webhook accepts training events instantly and fit() runs
+in a pool of TRAINING_WORKERS threads. Jobs are recorded in MODEL_DIR/jobs.db shared by all workers of the server,
+a job claims its project in the database before it starts, so jobs of the same project never run at the same time,
+even when they were queued by different workers. Their status and duration are available on /jobs and /jobs/<job_id>.
+"""
+import os
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+import traceback as tb
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from .metrics import Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+TRAINING_JOBS = Gauge(
+    'label_studio_ml_training_jobs',
+    'Training jobs of this process by status',
+    labelnames=('status',))
+TRAINING_JOB_SECONDS = Histogram(
+    'label_studio_ml_training_job_seconds',
+    'Duration of training jobs',
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200))
+
+COLUMNS = ('id', 'project_id', 'event', 'status', 'pid', 'token', 'created_at', 'started_at', 'finished_at',
+           'error')
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _process_token(pid: int) -> Optional[str]:
+    """
+    Identify the process beyond its pid, which the system reuses: boot id and the start time of the process.
+    None where /proc isn't available, then only the pid is checked
+    """
+    try:
+        with open('/proc/sys/kernel/random/boot_id') as f:
+            boot_id = f.read().strip()
+        with open(f'/proc/{pid}/stat') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # the command in parentheses may contain spaces, starttime is the 20th field after it
+    return f'{boot_id}:{stat.rsplit(")", 1)[1].split()[19]}'
+
+
+def _process_alive(pid: int, token: Optional[str]) -> bool:
+    if not _pid_alive(pid):
+        return False
+    if token is None:
+        return True
+    current = _process_token(pid)
+    return current is None or current == token
+
+
+class JobQueue:
+    """
+    Runs submitted functions in a bounded thread pool and keeps their status in SQLite
+    """
+
+    def __init__(self, path: str, workers: int = 1, db_name: str = 'jobs.db', ttl: float = None,
+                 timeout: float = 30.0, poll_interval: float = 1.0):
+        """
+        :param path: directory of the jobs database
+        :param workers: number of jobs running at the same time
+        :param ttl: seconds finished jobs are kept, TRAINING_JOBS_TTL env or 7 days by default
+        :param poll_interval: seconds between attempts to claim a project busy with a job of another worker
+        """
+        os.makedirs(path, exist_ok=True)
+        self.db_name = os.path.join(path, db_name)
+        self.timeout = timeout
+        if ttl is None:
+            ttl = float(os.getenv('TRAINING_JOBS_TTL', 7 * 24 * 3600))
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='training')
+        self._local = threading.local()
+        # notified when a job of this process finishes, so its waiting jobs don't wait for the next poll
+        self._finished = threading.Condition()
+
+        conn = self._connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT NOT NULL PRIMARY KEY,
+                project_id TEXT NOT NULL,
+                event TEXT,
+                status TEXT NOT NULL,
+                pid INTEGER NOT NULL,
+                token TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                error TEXT
+            );
+        ''')
+        if 'token' not in [row[1] for row in conn.execute('PRAGMA table_info(jobs);')]:
+            # databases created before process tokens were recorded
+            conn.execute('ALTER TABLE jobs ADD COLUMN token TEXT;')
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_project_created ON jobs (project_id, created_at);')
+        self._fail_interrupted()
+
+    def _connection(self) -> sqlite3.Connection:
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is None or local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_name, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL;')
+            local.conn = conn
+            local.pid = os.getpid()
+        return conn
+
+    def _fail_interrupted(self):
+        """
+        Mark jobs of processes which don't exist anymore as failed
+        """
+        conn = self._connection()
+        rows = conn.execute(
+            'SELECT DISTINCT pid, token FROM jobs WHERE status IN (?, ?);', (QUEUED, RUNNING)).fetchall()
+        for pid, token in rows:
+            if not _process_alive(pid, token):
+                conn.execute(
+                    'UPDATE jobs SET status = ?, error = ?, finished_at = ? '
+                    'WHERE pid = ? AND token IS ? AND status IN (?, ?);',
+                    (FAILED, 'Interrupted: the server was stopped', time.time(), pid, token, QUEUED, RUNNING))
+
+    def _update(self, job_id: str, **fields):
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        self._connection().execute(f'UPDATE jobs SET {assignments} WHERE id = ?;', (*fields.values(), job_id))
+
+    def _claim(self, job_id: str, project_id: str) -> Optional[float]:
+        """
+        Start the job unless another job of the project is running in any process, returns its start time
+        """
+        conn = self._connection()
+        started = time.time()
+        conn.execute('BEGIN IMMEDIATE;')
+        try:
+            claimed = conn.execute(
+                'UPDATE jobs SET status = ?, started_at = ? WHERE id = ? AND NOT EXISTS '
+                '(SELECT 1 FROM jobs WHERE project_id = ? AND status = ?);',
+                (RUNNING, started, job_id, project_id, RUNNING)).rowcount
+        except BaseException:
+            conn.execute('ROLLBACK;')
+            raise
+        conn.execute('COMMIT;')
+        return started if claimed else None
+
+    def _wait_claim(self, job_id: str, project_id: str) -> float:
+        started = self._claim(job_id, project_id)
+        while started is None:
+            with self._finished:
+                self._finished.wait(self.poll_interval)
+            # the running job may belong to a process which was killed
+            self._fail_interrupted()
+            started = self._claim(job_id, project_id)
+        return started
+
+    def submit(self, project_id: str, event: Optional[str], fn: Callable, *args, **kwargs) -> Dict:
+        """
+        Queue fn(*args, **kwargs) as a job of the project, returns the job
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connection()
+        conn.execute('DELETE FROM jobs WHERE finished_at < ?;', (now - self.ttl,))
+        conn.execute(
+            'INSERT INTO jobs (id, project_id, event, status, pid, token, created_at) VALUES (?, ?, ?, ?, ?, ?, ?);',
+            (job_id, project_id, event, QUEUED, os.getpid(), _process_token(os.getpid()), now))
+        TRAINING_JOBS.labels(status=QUEUED).inc()
+        self.executor.submit(self._run, job_id, project_id, fn, args, kwargs)
+        logger.debug(f'Job {job_id}: queued {event} for project {project_id}')
+        return self.get(job_id)
+
+    def _run(self, job_id: str, project_id: str, fn: Callable, args, kwargs):
+        started = self._wait_claim(job_id, project_id)
+        TRAINING_JOBS.labels(status=QUEUED).dec()
+        TRAINING_JOBS.labels(status=RUNNING).inc()
+        try:
+            fn(*args, **kwargs)
+        except Exception:
+            error = tb.format_exc()
+            logger.error(f'Job {job_id} failed: {error}')
+            self._update(job_id, status=FAILED, finished_at=time.time(), error=error)
+        else:
+            self._update(job_id, status=COMPLETED, finished_at=time.time())
+            logger.debug(f'Job {job_id}: completed in {time.time() - started:.1f}s')
+        finally:
+            TRAINING_JOBS.labels(status=RUNNING).dec()
+            TRAINING_JOB_SECONDS.observe(time.time() - started)
+            with self._finished:
+                self._finished.notify_all()
+
+    @staticmethod
+    def _job(row) -> Dict:
+        job = dict(zip(COLUMNS, row))
+        del job['pid'], job['token']
+        started, finished = job['started_at'], job['finished_at']
+        # seconds the job has been running, it's still growing for running jobs
+        job['duration'] = (finished or time.time()) - started if started else None
+        job['wait'] = (started or finished or time.time()) - job['created_at']
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        row = self._connection().execute(
+            f'SELECT {", ".join(COLUMNS)} FROM jobs WHERE id = ?;', (job_id,)).fetchone()
+        return self._job(row) if row is not None else None
+
+    def jobs(self, project_id: str = None, status: str = None, limit: int = 100) -> List[Dict]:
+        """
+        The latest jobs, optionally of the project and with the status
+        """
+        conditions, params = [], []
+        if project_id is not None:
+            conditions.append('project_id = ?')
+            params.append(project_id)
+        if status is not None:
+            conditions.append('status = ?')
+            params.append(status)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        rows = self._connection().execute(
+            f'SELECT {", ".join(COLUMNS)} FROM jobs {where} ORDER BY created_at DESC LIMIT ?;',
+            (*params, limit)).fetchall()
+        return [self._job(row) for row in rows]
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,81 @@
+"""
+Process-wide memo of parsed label configs.
+
+Label Studio sends the same label config with every request of a project, so parsing results
+are memoized by config content and shared between requests and model instances.
+Returned objects are shared: treat them as read-only.
+SDK modules are heavy, they are imported on the first parsing.
+"""
+import os
+import json
+
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from label_studio_sdk.label_interface import LabelInterface
+
+MEMO_SIZE = int(os.getenv('LABEL_CONFIG_CACHE_SIZE', 128))
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def get_label_interface(label_config: str) -> 'LabelInterface':
+    """
+    Get LabelInterface for the label config
+    """
+    from label_studio_sdk.label_interface import LabelInterface
+
+    return LabelInterface(config=label_config)
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def get_parsed_config(label_config: str) -> dict:
+    """
+    Get parse_config() output for the label config
+    """
+    from label_studio_tools.core.label_config import parse_config
+
+    return parse_config(label_config)
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def get_parsed_config_json(label_config: str) -> str:
+    """
+    Get parse_config() output for the label config serialized to JSON, as it's stored in the cache
+    """
+    return json.dumps(get_parsed_config(label_config))
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def load_parsed_config(parsed_label_config: str) -> dict:
+    """
+    Load parsed label config stored in the cache as JSON
+    """
+    return json.loads(parsed_label_config)
+
+
+@lru_cache(maxsize=MEMO_SIZE * 8)
+def get_first_tag_occurence(label_interface: 'LabelInterface', control_type, object_type):
+    """
+    Memoized LabelInterface.get_first_tag_occurence() without name filters,
+    LabelInterface instances are memoized too, so they are stable keys
+    """
+    return label_interface.get_first_tag_occurence(control_type=control_type, object_type=object_type)
+
+
+def cache_info() -> dict:
+    return {
+        'label_interface': get_label_interface.cache_info(),
+        'parsed_config': get_parsed_config.cache_info(),
+        'parsed_config_json': get_parsed_config_json.cache_info(),
+        'loaded_parsed_config': load_parsed_config.cache_info(),
+        'first_tag_occurence': get_first_tag_occurence.cache_info(),
+    }
+
+
+def cache_clear():
+    get_label_interface.cache_clear()
+    get_parsed_config.cache_clear()
+    get_parsed_config_json.cache_clear()
+    load_parsed_config.cache_clear()
+    get_first_tag_occurence.cache_clear()
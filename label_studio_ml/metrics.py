@@ -0,0 +1,243 @@
+"""
+Minimal in-process metrics registry exposed by /metrics in Prometheus text format.
+Metrics are collected per process: with several gunicorn workers each worker reports its own values.
+"""
+import time
+import bisect
+import functools
+
+from threading import Lock
+from typing import Dict, List, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+REGISTRY: List['Metric'] = []
+
+
+def _format_labels(labelnames: Tuple[str, ...], labelvalues: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), register: bool = True):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], 'Metric'] = {}
+        self._lock = Lock()
+        if register:
+            REGISTRY.append(self)
+
+    def labels(self, **labels):
+        """
+        Get the child metric for the label values, e.g. CACHE_OPERATIONS.labels(backend='SqliteCache', operation='get')
+        """
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    self._children[key] = child
+        return child
+
+    @property
+    def family(self) -> str:
+        """
+        Name of the metric family in the exposition, HELP and TYPE lines and samples use it
+        """
+        return self.name
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self) -> str:
+        family = self.family
+        lines = [f'# HELP {family} {self.documentation}', f'# TYPE {family} {self.type}']
+        if self.labelnames:
+            for labelvalues, child in list(self._children.items()):
+                lines.extend(child._samples_with(family, self.labelnames, labelvalues))
+        else:
+            lines.extend(self._samples_with(family, (), ()))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._value = 0
+
+    def _new_child(self):
+        return self.__class__(self.name, self.documentation, register=False)
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    def get(self):
+        return self._value
+
+    @property
+    def family(self) -> str:
+        return f'{self.name}_total'
+
+    def _samples_with(self, name, labelnames, labelvalues):
+        return [f'{name}{_format_labels(labelnames, labelvalues)} {_format_value(self._value)}']
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = value
+
+    @property
+    def family(self) -> str:
+        return self.name
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS, register: bool = True):
+        super().__init__(name, documentation, labelnames, register)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._counts = [0] * len(self.buckets)
+        self._sum = 0.0
+        self._count = 0
+
+    def _new_child(self):
+        return Histogram(self.name, self.documentation, buckets=self.buckets[:-1], register=False)
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def time(self):
+        """
+        Decorator and context manager observing the duration in seconds
+        """
+        return _Timer(self)
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def _samples_with(self, name, labelnames, labelvalues):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self._counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f'{name}_bucket{_format_labels(labelnames, labelvalues, le)} {cumulative}')
+        lines.append(f'{name}_sum{_format_labels(labelnames, labelvalues)} {_format_value(self._sum)}')
+        lines.append(f'{name}_count{_format_labels(labelnames, labelvalues)} {self._count}')
+        return lines
+
+
+class _Timer:
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+    def __call__(self, f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            with _Timer(self.histogram):
+                return f(*args, **kwargs)
+        return wrapper
+
+
+def generate_latest() -> str:
+    """
+    Render all registered metrics in Prometheus text format
+    """
+    return '\n'.join(metric.collect() for metric in REGISTRY) + '\n'
+
+
+# Cache metrics
+
+CACHE_OPERATION_SECONDS = Histogram(
+    'label_studio_ml_cache_operation_seconds',
+    'Duration of cache operations',
+    ('backend', 'operation'))
+
+CACHE_ERRORS = Counter(
+    'label_studio_ml_cache_errors',
+    'Number of failed cache operations',
+    ('backend', 'operation'))
+
+CACHE_MEMORY_HITS = Counter(
+    'label_studio_ml_cache_memory_hits',
+    'Number of lookups served by the in-memory cache layer',
+    ('backend',))
+
+CACHE_MEMORY_MISSES = Counter(
+    'label_studio_ml_cache_memory_misses',
+    'Number of lookups which missed the in-memory cache layer and went to the backend',
+    ('backend',))
+
+CACHE_LOCK_WAIT_SECONDS = Histogram(
+    'label_studio_ml_cache_lock_wait_seconds',
+    'Time spent waiting for the cache write lock',
+    ('backend',))
+
+
+def timed_cache_operation(operation: str):
+    """
+    Decorator for cache methods recording their duration and errors per backend class
+    """
+    def decorator(f):
+        histograms = {}
+
+        @functools.wraps(f)
+        def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return f(self, *args, **kwargs)
+            except Exception:
+                CACHE_ERRORS.labels(backend=self.__class__.__name__, operation=operation).inc()
+                raise
+            finally:
+                histogram = histograms.get(self.__class__)
+                if histogram is None:
+                    histogram = histograms[self.__class__] = CACHE_OPERATION_SECONDS.labels(
+                        backend=self.__class__.__name__, operation=operation)
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
@@ -5,28 +5,23 @@ import json
 import importlib
 import importlib.util
 import inspect
+import threading
 
-try:
-    import torch.multiprocessing as mp
-    try:
-        # avoid "cannot reinit CUDA in forked process" error in loading cuda?
-        mp.set_start_method('spawn')
-    except RuntimeError:
-        pass
-except ImportError:
-    import multiprocessing as mp
+from contextlib import contextmanager
 
 from semver import Version
 
-from typing import Tuple, Callable, Union, List, Dict, Optional
+from typing import Tuple, Callable, Union, List, Dict, Optional, TYPE_CHECKING
 from abc import ABC
 from colorama import Fore
 
-from label_studio_sdk.label_interface import LabelInterface
-from label_studio_tools.core.label_config import parse_config
-from label_studio_tools.core.utils.io import get_local_path
-from .response import ModelResponse
 from .cache import create_cache
+from . import label_config as label_config_memo
+from . import prediction_cache
+from .deadline import Deadline, current_deadline
+
+if TYPE_CHECKING:
+    from .response import ModelResponse
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +30,14 @@ CACHE = create_cache(
     path=os.getenv('MODEL_DIR', '.'))
 
 
+def __getattr__(name):
+    # pydantic based response models are heavy to import, load them on first use
+    if name == 'ModelResponse':
+        from .response import ModelResponse
+        return ModelResponse
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
 # Decorator to register predict function
 _predict_fn: Callable = None
 _update_fn: Callable = None
@@ -68,6 +71,14 @@ class LabelStudioMLBase(ABC):
         'PROJECT_UPDATED'
     )
 
+    # project state keys loaded from the cache in one shot when the model is created
+    STATE_KEYS = (
+        'label_config',
+        'parsed_label_config',
+        'model_version',
+        'extra_params'
+    )
+
     def __init__(self, project_id: Optional[str] = None, label_config=None):
         """
         Initialize LabelStudioMLBase with a project ID.
@@ -76,13 +87,22 @@ class LabelStudioMLBase(ABC):
             project_id (str, optional): The project ID. Defaults to None.
         """
         self.project_id = project_id or ''
-        self.use_label_config(label_config)
-
-        # set initial model version
-        if not self.model_version:
-            self.set("model_version", self.INITIAL_MODEL_VERSION)
-        
-        self.setup()
+        self._dirty = {}
+        # guards _state and _dirty, set() and flush() of different threads may race on a pooled instance
+        self._state_lock = threading.Lock()
+        # batch_writes() depth is tracked per thread, pooled model instances serve several requests at once
+        self._batches = threading.local()
+
+        # all state changes made during initialization are written in a single transaction
+        with self.batch_writes():
+            self.load_state()
+            self.use_label_config(label_config)
+
+            # set initial model version
+            if not self.model_version:
+                self.set("model_version", self.INITIAL_MODEL_VERSION)
+
+            self.setup()
         
     def setup(self):
         """Abstract method for setting up the machine learning model.
@@ -101,7 +121,7 @@ class LabelStudioMLBase(ABC):
         Args:
             label_config (str): The label configuration.
         """
-        self.label_interface = LabelInterface(config=label_config)
+        self.label_interface = label_config_memo.get_label_interface(label_config)
         
         # if not current_label_config:
             # first time model is initialized
@@ -110,8 +130,10 @@ class LabelStudioMLBase(ABC):
         current_label_config = self.get('label_config')    
         # label config has been changed, need to save
         if current_label_config != label_config:
-            self.set('label_config', label_config)
-            self.set('parsed_label_config', json.dumps(parse_config(label_config)))        
+            self.set_many({
+                'label_config': label_config,
+                'parsed_label_config': label_config_memo.get_parsed_config_json(label_config)
+            })
             
 
     def set_extra_params(self, extra_params):
@@ -140,13 +162,75 @@ class LabelStudioMLBase(ABC):
         else:
             return {}
             
+    def load_state(self):
+        """
+        Load the project state (STATE_KEYS) from the cache with a single request,
+        changes which are not written yet are kept
+        """
+        state = CACHE.get_many(self.project_id, self.STATE_KEYS)
+        with self._state_lock:
+            self._state = {**state, **self._dirty}
+
     def get(self, key: str):
+        if key in self._state:
+            return self._state[key]
         return CACHE[self.project_id, key]
 
     def set(self, key: str, value: str):
-        CACHE[self.project_id, key] = value
+        self.set_many({key: value})
+
+    def set_many(self, mapping: Dict[str, str]):
+        """
+        Set several keys at once, they are written to the cache in a single transaction.
+        Values equal to the stored ones are not written at all, inside batch_writes()
+        changed values are collected and written when the batch ends.
+        """
+        changed = {key: value for key, value in mapping.items() if self.get(key) != value}
+        if not changed:
+            return
+        with self._state_lock:
+            self._state.update(changed)
+            self._dirty.update(changed)
+        if not getattr(self._batches, 'depth', 0):
+            self.flush()
+
+    def flush(self):
+        """
+        Write all changed keys to the cache
+        """
+        with self._state_lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, {}
+            # written under the lock, so a flush of older values can't overwrite newer ones
+            try:
+                CACHE.set_many(self.project_id, dirty)
+            except Exception:
+                # the values weren't stored, read them from the cache next time
+                for key in dirty:
+                    self._state.pop(key, None)
+                raise
+
+    @contextmanager
+    def batch_writes(self):
+        """
+        Defer writes made inside the block and flush them in a single transaction at its end, e.g.:
+
+            with model.batch_writes():
+                model.predict(tasks)
+        """
+        self._batches.depth = getattr(self._batches, 'depth', 0) + 1
+        try:
+            yield self
+        finally:
+            # batches of coroutines running in the same thread may end in any order
+            self._batches.depth -= 1
+            if not self._batches.depth:
+                self.flush()
 
     def has(self, key: str):
+        if key in self._state:
+            return self._state[key] is not None
         return (self.project_id, key) in CACHE
 
     @property
@@ -154,8 +238,9 @@ class LabelStudioMLBase(ABC):
         return self.get('label_config')
 
     @property
-    def parsed_label_config(self):        
-        return json.loads(self.get('parsed_label_config'))
+    def parsed_label_config(self):
+        # shared between model instances with the same config, don't modify it
+        return label_config_memo.load_parsed_config(self.get('parsed_label_config'))
 
     @property
     def model_version(self):
@@ -169,20 +254,33 @@ class LabelStudioMLBase(ABC):
         else:
             return None
 
+    @property
+    def deadline(self) -> Deadline:
+        """
+        Deadline of the request being processed, see label_studio_ml.deadline.
+        Long predictions should call self.deadline.check() between steps and pass self.deadline.timeout()
+        to blocking calls.
+        """
+        return current_deadline()
+
     def bump_model_version(self):
         """
+        Bump the minor part of the semantic model version, e.g. 0.0.1 -> 0.1.0,
+        cached predictions of the project are dropped
         """
         mv = self.model_version
+        if not isinstance(mv, Version):
+            raise ValueError(f'Model version {mv!r} is not a semantic version, it can\'t be bumped')
 
-        # TODO: check if this is correct - seems like it doesn't work, check RND-7 and make sure it's test covered
-        mv.bump_minor()
-        logger.debug(f'Bumping model version from {self.model_version} to {mv}')
-        self.set('model_version', str(mv))
-        
-        return mv
+        new_mv = mv.bump_minor()
+        logger.debug(f'Bumping model version from {mv} to {new_mv}')
+        self.set('model_version', str(new_mv))
+        prediction_cache.invalidate_project(self.project_id)
+
+        return new_mv
         
     # @abstractmethod
-    def predict(self, tasks: List[Dict], context: Optional[Dict] = None, **kwargs) -> Union[List[Dict], ModelResponse]:
+    def predict(self, tasks: List[Dict], context: Optional[Dict] = None, **kwargs) -> Union[List[Dict], 'ModelResponse']:
         """
         Predict and return a list of dicts with predictions for each task.
 
@@ -192,7 +290,9 @@ class LabelStudioMLBase(ABC):
             kwargs: Additional parameters passed on to the predict function.
 
         Returns:
-            list[dict]: A list of dictionaries containing predictions.                
+            list[dict]: A list of dictionaries containing predictions.
+            predict() can also be a generator (or an async generator) yielding predictions one by one,
+            they are sent to clients requesting `application/x-ndjson` as soon as they are ready.
         """
 
         # if there is a registered predict function, use it
@@ -243,8 +343,14 @@ class LabelStudioMLBase(ABC):
 
         Returns:
           The local path for the given URL.
+          Raises DeadlineExceeded when the download doesn't finish before the request deadline.
         """
-        return get_local_path(
+        from label_studio_tools.core.utils.io import get_local_path
+
+        # the download has no timeout of its own, stop waiting for it at the deadline,
+        # it still completes in the background and the file is cached for the next request
+        return self.deadline.run(
+            get_local_path,
             url,
             project_dir=project_dir,
             hostname=ls_host,
@@ -277,6 +383,8 @@ class LabelStudioMLBase(ABC):
         Returns:
           tuple: (from_name, to_name, value), representing control tag, object tag and input value.        
         """
+        if name_filter is None and to_name_filter is None:
+            return label_config_memo.get_first_tag_occurence(self.label_interface, control_type, object_type)
         return self.label_interface.get_first_tag_occurence(
             control_type=control_type,
             object_type=object_type,
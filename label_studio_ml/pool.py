@@ -0,0 +1,74 @@
+import hashlib
+import logging
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional, Type
+
+logger = logging.getLogger(__name__)
+
+
+def config_hash(label_config: Optional[str]) -> str:
+    """
+    Stable content hash of the label config
+    """
+    return hashlib.sha1((label_config or '').encode('utf-8')).hexdigest()
+
+
+class ModelPool:
+    """
+    Bounded thread-safe pool of live model instances keyed by (project_id, label config hash).
+    Steady-state requests reuse the instance instead of parsing the label config
+    and running setup() again, the least recently used instances are evicted.
+    Pooled instances are shared by concurrent requests, so model classes must not keep
+    per-request data on self.
+    """
+
+    def __init__(self, model_class: Type, size: int = 16):
+        self.model_class = model_class
+        self.size = size
+        self._models = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, project_id: Optional[str], label_config: Optional[str]):
+        """
+        Get the model for the project and label config, create it if it's not in the pool
+        """
+        key = (project_id or '', config_hash(label_config))
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._models.move_to_end(key)
+        if model is not None:
+            # pick up state changes made by other requests or workers
+            model.load_state()
+            return model
+
+        model = self.model_class(project_id=project_id, label_config=label_config)
+        with self._lock:
+            existing = self._models.get(key)
+            if existing is not None:
+                # created by a concurrent request
+                return existing
+            # the label config of the project has changed, instances with old configs are useless
+            for stale in [k for k in self._models if k[0] == key[0]]:
+                del self._models[stale]
+            self._models[key] = model
+            while len(self._models) > self.size:
+                evicted, _ = self._models.popitem(last=False)
+                logger.debug(f'Model for project {evicted[0]} is evicted from the pool')
+        return model
+
+    def invalidate(self, project_id: Optional[str] = None):
+        """
+        Drop models of the project from the pool, or all models if project_id is None
+        """
+        with self._lock:
+            if project_id is None:
+                self._models.clear()
+                return
+            for key in [k for k in self._models if k[0] == project_id]:
+                del self._models[key]
+
+    def __len__(self):
+        return len(self._models)
@@ -0,0 +1,125 @@
+"""
+Cache of predictions keyed by task content.
+
+Label Studio requests predictions for the same tasks again and again (tasks are reopened, pre-annotation is re-run),
+with the cache enabled (PREDICTION_CACHE=1) predict() is called only for tasks which haven't been predicted yet
+with the same task data, label config, context, params and model version.
+Predictions are kept in MODEL_DIR/predictions.db bounded by PREDICTION_CACHE_MAX_BYTES (the oldest ones are evicted),
+with the most used ones in memory (PREDICTION_CACHE_MEMORY_SIZE entries).
+The project's predictions are dropped when the model version is bumped, after training
+and when /setup changes the extra params.
+"""
+import os
+import json
+import hashlib
+import logging
+
+from typing import Dict, List, Optional
+
+from .cache import SqliteCache
+from .metrics import Counter
+from . import serialization
+
+logger = logging.getLogger(__name__)
+
+PREDICTION_CACHE_TASKS = Counter(
+    'label_studio_ml_prediction_cache_tasks',
+    'Tasks looked up in the prediction cache',
+    labelnames=('result',))
+_HITS = PREDICTION_CACHE_TASKS.labels(result='hit')
+_MISSES = PREDICTION_CACHE_TASKS.labels(result='miss')
+
+# the cache used by the server, set by label_studio_ml.api.init_app()
+PREDICTION_CACHE: Optional['PredictionCache'] = None
+
+
+def task_key(task: Dict, label_config: Optional[str], context, params, model_version: Optional[str]) -> str:
+    """
+    Stable hash of everything the prediction of the task depends on
+    """
+    data = task.get('data', task) if isinstance(task, dict) else task
+    payload = json.dumps([data, label_config, context, params, model_version],
+                         sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class PredictionCache(SqliteCache):
+    """
+    SQLite store of predictions in JSON with an in-memory LRU layer, keyed by (project_id, task_key()).
+    The database size is kept under `max_bytes`: the oldest predictions are evicted.
+    """
+
+    def __init__(self, path: str, db_name: str = 'predictions.db', max_bytes: int = None, memory_size: int = None,
+                 **kwargs):
+        if memory_size is None:
+            memory_size = int(os.getenv('PREDICTION_CACHE_MEMORY_SIZE', 1024))
+        super(PredictionCache, self).__init__(path, db_name=db_name, memory_size=memory_size, **kwargs)
+        if max_bytes is None:
+            max_bytes = int(os.getenv('PREDICTION_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+        self.max_bytes = max_bytes
+        # bytes written since the last eviction check
+        self._written = 0
+
+    def lookup(self, project_id: str, keys: List[str]) -> List:
+        """
+        Get predictions for the keys, None for missing ones
+        """
+        values = self.get_many(project_id, keys)
+        results = []
+        for key in keys:
+            value = values.get(key)
+            results.append(json.loads(value) if value is not None else None)
+        hits = sum(result is not None for result in results)
+        _HITS.inc(hits)
+        _MISSES.inc(len(results) - hits)
+        return results
+
+    def store(self, project_id: str, predictions: Dict[str, Dict]):
+        """
+        Store predictions by their keys
+        """
+        mapping = {key: serialization.dumps(prediction).decode('utf-8') for key, prediction in predictions.items()}
+        if not mapping:
+            return
+        # the prediction of a key never changes, so the generation of the project isn't bumped:
+        # other workers keep their in-memory layers, they are dropped only by delete_project()
+        with self._locked():
+            self._write(project_id, 'REPLACE INTO cache (project_id, key, value) VALUES (?, ?, ?);',
+                        [(project_id, key, value) for key, value in mapping.items()], bump=False)
+        for key, value in mapping.items():
+            self.memory.put((project_id, key), value)
+        self._written += sum(len(value) for value in mapping.values())
+        if self._written * 16 >= self.max_bytes:
+            self._written = 0
+            self.evict()
+
+    def evict(self):
+        """
+        Delete the oldest predictions above `max_bytes`.
+        Values never change for a key, so entries of the in-memory layer stay valid.
+        """
+        with self._locked():
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE;')
+            try:
+                deleted = conn.execute('''
+                    DELETE FROM cache WHERE rowid IN (
+                        SELECT rowid FROM (
+                            SELECT rowid, SUM(length(value)) OVER (ORDER BY rowid DESC) AS total FROM cache
+                        ) WHERE total > ?
+                    );
+                ''', (self.max_bytes,)).rowcount
+            except BaseException:
+                conn.execute('ROLLBACK;')
+                raise
+            conn.execute('COMMIT;')
+        if deleted:
+            logger.debug(f'Evicted {deleted} predictions from the prediction cache')
+
+
+def invalidate_project(project_id: str):
+    """
+    Drop cached predictions of the project, e.g. when the model has changed
+    """
+    if PREDICTION_CACHE is not None:
+        PREDICTION_CACHE.delete_project(project_id or '')
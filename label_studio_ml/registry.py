@@ -0,0 +1,172 @@
+"""
+Hot-swap of loaded models.
+
+A model retrained by fit() must replace the one serving predictions without requests seeing a half-loaded model:
+ModelRegistry loads the new version completely before swapping it in under a lock, requests hold the version
+they started with until they finish, and the previous versions are kept for rollback.
+
+    MODELS = ModelRegistry()
+
+    def load_model():
+        return pipeline('ner', model=MODEL_PATH)
+
+    class MyModel(LabelStudioMLBase):
+
+        def predict(self, tasks, context=None, **kwargs):
+            with MODELS.acquire(load_model) as model:
+                return model(...)
+
+        def fit(self, event, data, **kwargs):
+            ...
+            MODELS.load(load_model)
+"""
+import logging
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ('version', 'model', 'refs', 'retired')
+
+    def __init__(self, version: str, model):
+        self.version = version
+        self.model = model
+        self.refs = 0
+        self.retired = False
+
+
+class ModelRegistry:
+    """
+    Holds the current model version and `keep` previous ones, all methods are thread-safe
+    """
+
+    def __init__(self, keep: int = 1, on_release: Optional[Callable[[Any], None]] = None):
+        """
+        :param keep: number of previous versions kept for rollback
+        :param on_release: called with a model when it's dropped and no request uses it anymore,
+        e.g. to free GPU memory
+        """
+        self.keep = keep
+        self.on_release = on_release
+        self._current: Optional[_Entry] = None
+        self._previous: List[_Entry] = []
+        self._lock = threading.Lock()
+        # serializes loads of the initial version
+        self._initial_lock = threading.Lock()
+        self._loads = 0
+        self._executor = None
+
+    @property
+    def version(self) -> Optional[str]:
+        current = self._current
+        return current.version if current is not None else None
+
+    def versions(self) -> List[str]:
+        """
+        The current version followed by versions available for rollback
+        """
+        with self._lock:
+            entries = ([self._current] if self._current is not None else []) + self._previous
+            return [entry.version for entry in entries]
+
+    def load(self, loader: Callable[[], Any], version: str = None) -> str:
+        """
+        Load the model with loader() and make it current, requests in flight keep using the model they acquired.
+        If loader() fails, the current model stays.
+        :param version: version name, a sequence number by default
+        :return: version name
+        """
+        model = loader()
+        with self._lock:
+            self._loads += 1
+            entry = _Entry(version or str(self._loads), model)
+            if self._current is not None:
+                self._previous.insert(0, self._current)
+            self._current = entry
+            released = [self._retire(old) for old in self._previous[self.keep:]]
+            del self._previous[self.keep:]
+        logger.info(f'Model version {entry.version} is loaded')
+        self._release(released)
+        return entry.version
+
+    def load_in_background(self, loader: Callable[[], Any], version: str = None) -> Future:
+        """
+        The same as load(), but it runs in a background thread, the current model is served meanwhile.
+        Loads are done one by one in the order they are requested.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-loader')
+            executor = self._executor
+
+        def load():
+            try:
+                return self.load(loader, version)
+            except Exception:
+                logger.error('Model loading failed, the current version is kept', exc_info=True)
+                raise
+
+        return executor.submit(load)
+
+    def rollback(self) -> str:
+        """
+        Drop the current version and make the previous one current again
+        """
+        with self._lock:
+            if not self._previous:
+                raise LookupError('There is no previous model version to roll back to')
+            dropped = self._current
+            self._current = self._previous.pop(0)
+            released = [self._retire(dropped)]
+            version = self._current.version
+        logger.info(f'Model version {dropped.version} is rolled back to {version}')
+        self._release(released)
+        return version
+
+    @contextmanager
+    def acquire(self, loader: Callable[[], Any] = None):
+        """
+        Use the current model until the block ends, it isn't released even if another version is loaded meanwhile.
+        :param loader: loads the initial version when there is no model yet
+        """
+        if self._current is None and loader is not None:
+            with self._initial_lock:
+                if self._current is None:
+                    self.load(loader)
+        with self._lock:
+            entry = self._current
+            if entry is None:
+                raise LookupError('No model is loaded')
+            entry.refs += 1
+        try:
+            yield entry.model
+        finally:
+            with self._lock:
+                entry.refs -= 1
+                released = [entry] if entry.retired and entry.refs == 0 else []
+            self._release(released)
+
+    def _retire(self, entry: _Entry) -> Optional[_Entry]:
+        """
+        Mark the entry as dropped from the registry, returns it if it can be released right away.
+        Must be called with the lock held.
+        """
+        entry.retired = True
+        return entry if entry.refs == 0 else None
+
+    def _release(self, entries: List[Optional[_Entry]]):
+        for entry in entries:
+            if entry is None:
+                continue
+            logger.debug(f'Model version {entry.version} is released')
+            if self.on_release is not None:
+                try:
+                    self.on_release(entry.model)
+                except Exception:
+                    logger.error(f'Failed to release model version {entry.version}', exc_info=True)
+            entry.model = None
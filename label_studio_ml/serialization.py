@@ -0,0 +1,102 @@
+"""
+JSON encoding of the ML backend responses.
+
+Predictions of segmentation models carry long integer lists (RLE masks), encoding them with stdlib json takes
+most of the request CPU time. orjson is used when it's installed (`pip install orjson`): it's several times faster
+and encodes numpy arrays and scalars natively, so predict() may put them into results without .tolist().
+Without orjson stdlib json is used, numpy values are converted with .tolist().
+
+The encoder is chosen with JSON_ENCODER env: `auto` (default, orjson if available), `orjson` or `json`,
+or replaced with any function returning bytes:
+
+    from label_studio_ml.serialization import set_encoder
+    set_encoder(lambda obj: my_json_lib.dumps(obj).encode('utf-8'))
+
+Predictions returned as ModelResponse reach the encoder as PredictionValue objects, they are encoded
+without converting the whole response to dicts first: custom encoders should pass `default` to their library.
+"""
+import os
+import json
+import logging
+
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+Encoder = Callable[[Any], bytes]
+
+_encoder: Optional[Encoder] = None
+
+
+def default(obj):
+    """
+    Convert objects unknown to JSON encoders: numpy arrays and scalars, PredictionValue and other pydantic models,
+    then the types Flask's encoder supports (dates as HTTP dates, Decimal, UUID, dataclasses, __html__)
+    """
+    # numpy arrays and scalars, numpy isn't imported for the check
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    # PredictionValue
+    if hasattr(obj, 'serialize'):
+        return obj.serialize()
+    if hasattr(obj, 'model_dump'):
+        return obj.model_dump()
+    # encode the rest the same way jsonify() did before, Flask isn't imported by model scripts
+    from flask.json.provider import DefaultJSONProvider
+    return DefaultJSONProvider.default(obj)
+
+
+def json_encoder(obj) -> bytes:
+    return json.dumps(obj, default=default).encode('utf-8')
+
+
+def orjson_encoder() -> Encoder:
+    import orjson
+
+    # dates and dataclasses go to default(), so they are encoded the same way as with stdlib json
+    options = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME |
+               orjson.OPT_PASSTHROUGH_DATACLASS)
+
+    def encode(obj) -> bytes:
+        return orjson.dumps(obj, default=default, option=options)
+
+    return encode
+
+
+def _create_encoder(name: str) -> Encoder:
+    if name == 'json':
+        return json_encoder
+    if name == 'orjson':
+        try:
+            return orjson_encoder()
+        except ImportError as e:
+            raise ImportError('JSON_ENCODER=orjson requires orjson package, install it with `pip install orjson`') from e
+    if name == 'auto':
+        try:
+            return orjson_encoder()
+        except ImportError:
+            return json_encoder
+    raise ValueError(f'Unknown JSON_ENCODER: {name}, use auto, orjson or json')
+
+
+def get_encoder() -> Encoder:
+    global _encoder
+    if _encoder is None:
+        _encoder = _create_encoder(os.getenv('JSON_ENCODER', 'auto'))
+        logger.debug(f'JSON encoder: {getattr(_encoder, "__qualname__", _encoder)}')
+    return _encoder
+
+
+def set_encoder(encoder: Optional[Encoder]):
+    """
+    Replace the encoder with a function returning bytes, None resets it to the one chosen by JSON_ENCODER
+    """
+    global _encoder
+    _encoder = encoder
+
+
+def dumps(obj) -> bytes:
+    """
+    Encode obj to JSON bytes with the current encoder
+    """
+    return get_encoder()(obj)
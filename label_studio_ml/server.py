@@ -10,9 +10,6 @@ import re
 from colorama import Fore
 
 
-from .model import get_all_classes_inherited_LabelStudioMLBase
-
-
 colorama.init()
 logger = logging.getLogger(__name__)
 
@@ -115,6 +112,9 @@ def create_dir(args):
     if model_def_in_path(script_path):
         script_path, model_class = args.script.rsplit(':', 1)
     else:
+        # importing the model pulls the whole ML backend in, do it only when the model class has to be found
+        from .model import get_all_classes_inherited_LabelStudioMLBase
+
         model_classes = get_all_classes_inherited_LabelStudioMLBase(script_path)
         if len(model_classes) > 1:
             raise ValueError(
@@ -0,0 +1,151 @@
+"""
+Deduplication of identical in-flight predictions.
+
+Several annotators open the same task, Label Studio retries a request which has timed out - the same /predict
+payload arrives while the model is still working on it. With PREDICT_SINGLE_FLIGHT enabled the first request
+(the leader) runs predict(), identical requests arriving meanwhile (the followers) wait for its result instead
+of running the model again. Requests are identical if they have the same project, label config, tasks, context,
+params and model version. Followers get the leader's error too, except when the leader ran out of its deadline:
+then one of the followers runs predict() again.
+"""
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from .deadline import DeadlineExceeded, current_deadline
+from .metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+PREDICT_SINGLE_FLIGHT = Counter(
+    'label_studio_ml_predict_single_flight',
+    'Predict requests which ran the model (leader) or waited for an identical one (follower)',
+    labelnames=('role',))
+_LEADERS = PREDICT_SINGLE_FLIGHT.labels(role='leader')
+_FOLLOWERS = PREDICT_SINGLE_FLIGHT.labels(role='follower')
+
+
+def request_key(project_id, label_config, tasks, context, params, model_version) -> str:
+    """
+    Stable hash of everything the predictions of the request depend on
+    """
+    payload = json.dumps([project_id, label_config, tasks, context, params, model_version],
+                         sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _shared(result):
+    # callers may modify the list they get, predictions themselves are shared
+    return list(result) if isinstance(result, list) else result
+
+
+class SingleFlight:
+    """
+    One call per key at a time, concurrent callers with the same key share its result.
+    do() is used from threads, do_async() from coroutines of one event loop.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._async_calls: Dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, f: Callable, *args, **kwargs) -> Any:
+        """
+        Return f(*args, **kwargs), or the result of the same call in flight in another thread
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+            if leader:
+                return self._lead(key, call, f, args, kwargs)
+
+            _FOLLOWERS.inc()
+            deadline = current_deadline()
+            if not call.done.wait(deadline.remaining()):
+                deadline.check()
+            if isinstance(call.error, DeadlineExceeded):
+                # the leader has given up, this request may still have time
+                deadline.check()
+                continue
+            if call.error is not None:
+                raise call.error
+            return _shared(call.result)
+
+    def _lead(self, key, call: _Call, f, args, kwargs):
+        _LEADERS.inc()
+        try:
+            call.result = f(*args, **kwargs)
+            return _shared(call.result)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # requests arriving from now on run f() again
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key: Hashable, f: Callable[[], Awaitable]) -> Any:
+        """
+        Return await f(), or the result of the same call in flight in another coroutine
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            future = self._async_calls.get(key)
+            if future is None or future.get_loop() is not loop:
+                return await self._lead_async(key, loop, f)
+
+            _FOLLOWERS.inc()
+            deadline = current_deadline()
+            try:
+                result = await asyncio.wait_for(asyncio.shield(future), deadline.remaining())
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    # this request itself was cancelled
+                    raise
+            except (asyncio.TimeoutError, TimeoutError):
+                # DeadlineExceeded of the leader is a TimeoutError too, on 3.11+ asyncio.TimeoutError is the same class
+                if not future.done() or future.cancelled() or not isinstance(future.exception(), DeadlineExceeded):
+                    # this request ran out of its own deadline, or the leader failed with another timeout
+                    deadline.check()
+                    raise
+            else:
+                return _shared(result)
+            # the leader has given up, this request may still have time
+            deadline.check()
+
+    async def _lead_async(self, key, loop, f):
+        _LEADERS.inc()
+        future = self._async_calls[key] = loop.create_future()
+        try:
+            result = await f()
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # followers get it, don't warn if there are none
+                future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return _shared(result)
+        finally:
+            del self._async_calls[key]
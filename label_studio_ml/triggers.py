@@ -0,0 +1,145 @@
+"""
+Coalescing of training events.
+
+Annotators create and update annotations in bursts, and every ANNOTATION_* webhook event would start a training
+(often downloading the whole labeled dataset first). TrainingTrigger collects events per project and starts one
+training for a burst:
+- after `debounce` seconds without new events,
+- once at least `min_annotations` annotation events were collected (PROJECT_UPDATED starts training anyway),
+- but no later than `max_staleness` seconds after the first collected event, even if the burst goes on
+  or fewer annotations were collected.
+At most one training is pending and one is running per project, events received during a training
+are collected for the next one.
+"""
+import time
+import logging
+import threading
+
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+ANNOTATION_EVENTS = ('ANNOTATION_CREATED', 'ANNOTATION_UPDATED', 'ANNOTATION_DELETED')
+
+
+class _Pending:
+    __slots__ = ('annotations', 'forced', 'first', 'last', 'event', 'data')
+
+    def __init__(self, now):
+        self.annotations = 0
+        self.forced = False
+        self.first = self.last = now
+        self.event = self.data = None
+
+
+class TrainingTrigger:
+
+    def __init__(self, start: Callable, debounce: float = 0, min_annotations: int = 1,
+                 max_staleness: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        """
+        :param start: function(project_id, event, data, done) starting the training with the latest event,
+        it must call done() when the training is finished
+        :param debounce: seconds without new events before the training starts
+        :param min_annotations: number of annotation events required to start the training
+        :param max_staleness: maximum seconds the first collected event waits for the training, None for no limit
+        """
+        self.start = start
+        self.debounce = debounce
+        self.min_annotations = min_annotations
+        self.max_staleness = max_staleness or None
+        self.clock = clock
+        self._pending: Dict[str, _Pending] = {}
+        self._running = set()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+
+    def event(self, project_id: str, event: str, data: Dict) -> Dict:
+        """
+        Collect the training event of the project
+        """
+        with self._cond:
+            now = self.clock()
+            pending = self._pending.get(project_id)
+            if pending is None:
+                pending = self._pending[project_id] = _Pending(now)
+            if event in ANNOTATION_EVENTS:
+                pending.annotations += 1
+            else:
+                pending.forced = True
+            pending.last = now
+            pending.event, pending.data = event, data
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='training-trigger', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+            return {'status': 'pending', 'annotations': pending.annotations}
+
+    def _due(self, pending: _Pending) -> Optional[float]:
+        """
+        Time the training should start at, None if it's not known yet
+        """
+        stale_at = pending.first + self.max_staleness if self.max_staleness is not None else None
+        if pending.forced or pending.annotations >= self.min_annotations:
+            quiet_at = pending.last + self.debounce
+            return quiet_at if stale_at is None else min(quiet_at, stale_at)
+        return stale_at
+
+    def _collect(self):
+        """
+        Take projects due to train, returns them with the seconds to wait for the next one
+        """
+        now = self.clock()
+        ready, timeout = [], None
+        for project_id, pending in list(self._pending.items()):
+            if project_id in self._running:
+                continue
+            due = self._due(pending)
+            if due is None:
+                continue
+            if due <= now:
+                del self._pending[project_id]
+                self._running.add(project_id)
+                ready.append((project_id, pending))
+            else:
+                timeout = due - now if timeout is None else min(timeout, due - now)
+        return ready, timeout
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                ready, timeout = self._collect()
+                if not ready:
+                    self._cond.wait(timeout)
+                    continue
+            for project_id, pending in ready:
+                logger.debug(f'Training of project {project_id} after {pending.annotations} annotation events')
+                try:
+                    self.start(project_id, pending.event, pending.data,
+                               lambda project_id=project_id: self.done(project_id))
+                except Exception as e:
+                    logger.error(f'Training of project {project_id} failed to start: {e}', exc_info=True)
+                    self.done(project_id)
+
+    def done(self, project_id: str):
+        """
+        The training of the project is finished, the next one can start
+        """
+        with self._cond:
+            self._running.discard(project_id)
+            self._cond.notify()
+
+    def pending(self, project_id: str) -> int:
+        """
+        Number of annotation events waiting for the training of the project
+        """
+        with self._cond:
+            pending = self._pending.get(project_id)
+            return pending.annotations if pending is not None else 0
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
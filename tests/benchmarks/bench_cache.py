@@ -0,0 +1,159 @@
+"""
+Micro-benchmark of project state caches from label_studio_ml.cache.
+
+Every backend returned by create_cache() is exercised with a mix of get/set/contains
+operations across N threads and M projects, throughput and p50/p99 latency are reported per operation.
+
+Usage:
+    python -m tests.benchmarks.bench_cache
+    python -m tests.benchmarks.bench_cache --backends sqlite lmdb --threads 1 8 --projects 100 --value-size 65536
+    python -m tests.benchmarks.bench_cache --backends sqlite --min-ops-per-sec 50000  # fail on regression
+
+Redis backend uses REDIS_URL if it's set, otherwise in-process fakeredis server if it's installed.
+"""
+import os
+import sys
+import json
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import time
+
+from label_studio_ml.cache import create_cache
+
+BACKENDS = ('sqlite', 'redis', 'lmdb', 'tiered')
+OPERATIONS = ('get', 'set', 'contains')
+KEYS = ('label_config', 'parsed_label_config', 'model_version', 'extra_params')
+
+
+def make_cache(backend, path):
+    """
+    Create the cache for the backend, returns None if it can't be used in this environment
+    """
+    try:
+        if backend == 'redis' and not os.getenv('REDIS_URL'):
+            import fakeredis
+            return create_cache('redis', path, client=fakeredis.FakeRedis(decode_responses=True),
+                                prefix=f'bench-{os.getpid()}')
+        if backend == 'tiered':
+            return create_cache('tiered', path, compaction_interval=0)
+        return create_cache(backend, path)
+    except ImportError as e:
+        print(f'Skip {backend}: {e}', file=sys.stderr)
+        return None
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_benchmark(cache, threads=8, projects=10, ops=2000, value_size=256, write_ratio=0.1, seed=0):
+    """
+    Run `ops` operations in each of `threads` threads against `projects` projects
+    :return: dict with total throughput and p50/p99 latency (microseconds) per operation
+    """
+    value = 'x' * value_size
+    for project in range(projects):
+        cache.set_many(str(project), {key: value for key in KEYS})
+
+    latencies = {op: [] for op in OPERATIONS}
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(n):
+        rnd = random.Random(seed + n)
+        local = {op: [] for op in OPERATIONS}
+        barrier.wait()
+        for i in range(ops):
+            project_id_key = (str(rnd.randrange(projects)), rnd.choice(KEYS))
+            r = rnd.random()
+            start = time.perf_counter()
+            if r < write_ratio:
+                op = 'set'
+                cache[project_id_key] = value[:-1] + str(i % 10)
+            elif r < write_ratio + (1 - write_ratio) / 4:
+                op = 'contains'
+                project_id_key in cache
+            else:
+                op = 'get'
+                cache[project_id_key]
+            local[op].append(time.perf_counter() - start)
+        with lock:
+            for op in OPERATIONS:
+                latencies[op].extend(local[op])
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    result = {'ops_per_sec': threads * ops / elapsed, 'operations': {}}
+    for op, values in latencies.items():
+        values.sort()
+        result['operations'][op] = {
+            'count': len(values),
+            'p50_us': percentile(values, 50) * 1e6,
+            'p99_us': percentile(values, 99) * 1e6,
+        }
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='label_studio_ml cache benchmark')
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument('--threads', nargs='+', type=int, default=[1, 8])
+    parser.add_argument('--projects', type=int, default=10)
+    parser.add_argument('--ops', type=int, default=2000, help='Operations per thread')
+    parser.add_argument('--value-size', type=int, default=256, help='Value size in bytes')
+    parser.add_argument('--write-ratio', type=float, default=0.1)
+    parser.add_argument('--min-ops-per-sec', type=float, default=None,
+                        help='Exit with error if any run is slower, use it to guard against regressions')
+    parser.add_argument('--json', dest='json_output', action='store_true', help='Print results as JSON')
+    args = parser.parse_args(argv)
+
+    results = []
+    for backend in args.backends:
+        for threads in args.threads:
+            path = tempfile.mkdtemp(prefix=f'bench-{backend}-')
+            try:
+                cache = make_cache(backend, path)
+                if cache is None:
+                    break
+                result = run_benchmark(cache, threads=threads, projects=args.projects, ops=args.ops,
+                                       value_size=args.value_size, write_ratio=args.write_ratio)
+                close = getattr(cache, 'close', None)
+                if close:
+                    close()
+            finally:
+                shutil.rmtree(path, ignore_errors=True)
+            result.update(backend=backend, threads=threads)
+            results.append(result)
+            if not args.json_output:
+                line = f'{backend:>8} threads={threads:<3} {result["ops_per_sec"]:>12,.0f} ops/sec'
+                for op, stats in result['operations'].items():
+                    line += f'  {op} p50={stats["p50_us"]:.1f}us p99={stats["p99_us"]:.1f}us'
+                print(line)
+
+    if args.json_output:
+        print(json.dumps(results, indent=2))
+
+    if args.min_ops_per_sec is not None:
+        slow = [r for r in results if r['ops_per_sec'] < args.min_ops_per_sec]
+        for r in slow:
+            print(f'REGRESSION: {r["backend"]} with {r["threads"]} threads: '
+                  f'{r["ops_per_sec"]:,.0f} < {args.min_ops_per_sec:,.0f} ops/sec', file=sys.stderr)
+        return 1 if slow else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""
+Benchmark of /predict response compression on brush masks payloads.
+
+Segmentation backends (SAM, Grounding DINO) return BrushLabels regions with masks encoded by
+label_studio_converter.brush.mask2rle(). The benchmark draws masks of random ellipses with `--noise` share
+of flipped pixels (ragged edges of real model masks), encodes the answer {"results": [...]} to JSON
+and measures for each encoding:
+    ms          - compression time
+    ratio       - uncompressed size / compressed size
+    transfer_ms - time to send the body over `--mbps` link
+    total_ms    - compression + transfer
+Streamed (NDJSON) responses are measured with --stream: one line per task, flushed after every line.
+Without label_studio_converter installed random RLE lists are used, they compress much worse than real masks.
+
+Usage:
+    python -m tests.benchmarks.bench_compression
+    python -m tests.benchmarks.bench_compression --tasks 5 --masks 3 --noise 0.001 --mbps 1000
+"""
+import sys
+import json
+import time
+import argparse
+
+from label_studio_ml import serialization
+from label_studio_ml.compression import ResponseCompression, zstd_available
+from label_studio_ml.response import ModelResponse
+from tests.benchmarks.bench_serialization import make_rle
+
+CODECS = ('identity', 'gzip-1', 'gzip-6', 'zstd-1', 'zstd-3')
+
+
+def make_mask(width, height, noise, seed):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:height, :width]
+    mask = np.zeros((height, width), dtype=np.uint8)
+    for _ in range(5):
+        cy, cx = rng.integers(0, height), rng.integers(0, width)
+        ry, rx = rng.integers(height // 50 + 1, height // 3 + 2), rng.integers(width // 50 + 1, width // 3 + 2)
+        mask[((yy - cy) / ry) ** 2 + ((xx - cx) / rx) ** 2 <= 1] = 255
+    flipped = rng.random((height, width)) < noise
+    mask[flipped] = 255 - mask[flipped]
+    return mask
+
+
+def make_masks_rle(count, width, height, noise):
+    """
+    RLE of `count` masks, real mask2rle() output if label_studio_converter is installed
+    """
+    try:
+        from label_studio_converter import brush
+    except ImportError:
+        return [make_rle(width * height // 50, seed=i) for i in range(count)], 'random'
+    return [brush.mask2rle(make_mask(width, height, noise, seed=i)) for i in range(count)], 'mask2rle'
+
+
+def make_predictions(tasks, masks, width, height, noise):
+    rles, source = make_masks_rle(tasks * masks, width, height, noise)
+    predictions = []
+    for task in range(tasks):
+        result = [{
+            'from_name': 'tag',
+            'to_name': 'image',
+            'type': 'brushlabels',
+            'original_width': width,
+            'original_height': height,
+            'image_rotation': 0,
+            'value': {'format': 'rle', 'rle': rles[task * masks + i], 'brushlabels': ['object']},
+            'score': 0.9,
+        } for i in range(masks)]
+        predictions.append({'result': result, 'score': 0.9})
+    return ModelResponse(model_version='0.0.1', predictions=predictions).serialize()['predictions'], source
+
+
+def run_benchmark(codec, predictions, mbps=100, repeat=5, stream=False):
+    """
+    Returns the best compression time of `repeat` runs in milliseconds, sizes and the transfer time estimate
+    """
+    if stream:
+        chunks = [serialization.dumps(prediction) + b'\n' for prediction in predictions]
+    else:
+        chunks = [serialization.dumps({'results': predictions})]
+    size = sum(len(chunk) for chunk in chunks)
+
+    if codec == 'identity':
+        def compress():
+            return b''.join(chunks)
+    else:
+        encoding, level = codec.split('-')
+        if encoding == 'zstd' and not zstd_available():
+            raise ImportError('zstandard is not installed, install it with `pip install zstandard`')
+        compression = ResponseCompression([encoding], levels={encoding: int(level)})
+
+        def compress():
+            if stream:
+                return b''.join(compression.stream(iter(chunks), encoding))
+            return compression.compress(chunks[0], encoding)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = compress()
+        timings.append(time.perf_counter() - start)
+    best = min(timings) * 1000
+    transfer = len(body) * 8 / (mbps * 1e6) * 1000
+    return {'codec': codec, 'ms': best, 'bytes': size, 'compressed_bytes': len(body),
+            'ratio': size / len(body), 'transfer_ms': transfer, 'total_ms': best + transfer}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='label_studio_ml response compression benchmark')
+    parser.add_argument('--codecs', nargs='+', default=list(CODECS), choices=CODECS)
+    parser.add_argument('--tasks', type=int, default=5)
+    parser.add_argument('--masks', type=int, default=2, help='Brush regions per task')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--noise', type=float, default=0.01, help='Share of flipped mask pixels')
+    parser.add_argument('--mbps', type=float, default=100, help='Link bandwidth for the transfer time estimate')
+    parser.add_argument('--stream', action='store_true', help='Compress NDJSON lines flushing every line')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', dest='json_output', action='store_true', help='Print results as JSON')
+    args = parser.parse_args(argv)
+
+    predictions, source = make_predictions(args.tasks, args.masks, args.width, args.height, args.noise)
+    if source == 'random':
+        print('label_studio_converter is not installed, random RLE lists are used', file=sys.stderr)
+
+    results = []
+    for codec in args.codecs:
+        try:
+            result = run_benchmark(codec, predictions, mbps=args.mbps, repeat=args.repeat, stream=args.stream)
+        except ImportError as e:
+            print(f'{codec:>9} skipped: {e}', file=sys.stderr)
+            continue
+        results.append(result)
+        if not args.json_output:
+            print(f'{codec:>9} {result["ms"]:>8.1f} ms {result["compressed_bytes"] / 1e6:>8.2f} MB '
+                  f'x{result["ratio"]:>5.1f} transfer {result["transfer_ms"]:>8.1f} ms '
+                  f'total {result["total_ms"]:>8.1f} ms')
+
+    if args.json_output:
+        print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
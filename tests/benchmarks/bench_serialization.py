@@ -0,0 +1,113 @@
+"""
+Benchmark of /predict response encoding on brush masks payloads.
+
+Segmentation backends (SAM, Grounding DINO) return BrushLabels regions with masks encoded as RLE integer lists,
+the response for one task is usually megabytes of JSON. The benchmark builds ModelResponse with such predictions
+and measures the time to encode the answer {"results": [...]} with:
+    stdlib   - json.dumps() of serialized predictions, as Flask jsonify() did
+    json     - label_studio_ml.serialization of the predictions with stdlib json
+    orjson   - label_studio_ml.serialization of the predictions with orjson
+    orjson-numpy - the same, but RLE masks are numpy arrays as models produce them
+
+Usage:
+    python -m tests.benchmarks.bench_serialization
+    python -m tests.benchmarks.bench_serialization --tasks 10 --masks 3 --rle-size 500000
+"""
+import sys
+import json
+import time
+import random
+import argparse
+
+from label_studio_ml import serialization
+from label_studio_ml.response import ModelResponse
+
+ENCODERS = ('stdlib', 'json', 'orjson', 'orjson-numpy')
+
+
+def make_rle(size, seed=0):
+    """
+    RLE of a brush mask has the shape of label_studio_converter.brush.encode_rle() output: bytes as ints
+    """
+    rng = random.Random(seed)
+    return [rng.randrange(256) for _ in range(size)]
+
+
+def make_response(tasks, masks, rle_size, numpy=False):
+    rle = make_rle(rle_size)
+    if numpy:
+        import numpy as np
+        rle = np.array(rle, dtype=np.uint8)
+    predictions = []
+    for _ in range(tasks):
+        result = [{
+            'from_name': 'tag',
+            'to_name': 'image',
+            'type': 'brushlabels',
+            'original_width': 1920,
+            'original_height': 1080,
+            'image_rotation': 0,
+            'value': {'format': 'rle', 'rle': rle, 'brushlabels': ['object']},
+            'score': 0.9,
+        } for _ in range(masks)]
+        predictions.append({'result': result, 'score': 0.9})
+    return ModelResponse(model_version='0.0.1', predictions=predictions)
+
+
+def encode_stdlib(response):
+    return json.dumps({'results': response.serialize()['predictions']}).encode('utf-8')
+
+
+def run_benchmark(encoder, tasks=5, masks=2, rle_size=100000, repeat=5):
+    """
+    Returns the best encoding time of `repeat` runs in milliseconds and the response size
+    """
+    response = make_response(tasks, masks, rle_size, numpy=encoder == 'orjson-numpy')
+    if encoder == 'stdlib':
+        encode = encode_stdlib
+    else:
+        encode_json = serialization._create_encoder('json' if encoder == 'json' else 'orjson')
+
+        def encode(r):
+            # the server encodes PredictionValue objects directly, without ModelResponse.serialize()
+            return encode_json({'results': r.predictions})
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = encode(response)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    return {'encoder': encoder, 'ms': best * 1000, 'bytes': len(body), 'mb_per_sec': len(body) / best / 1e6}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='label_studio_ml response encoding benchmark')
+    parser.add_argument('--encoders', nargs='+', default=list(ENCODERS), choices=ENCODERS)
+    parser.add_argument('--tasks', type=int, default=5)
+    parser.add_argument('--masks', type=int, default=2, help='Brush regions per task')
+    parser.add_argument('--rle-size', type=int, default=100000, help='RLE length of one mask')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', dest='json_output', action='store_true', help='Print results as JSON')
+    args = parser.parse_args(argv)
+
+    results = []
+    for encoder in args.encoders:
+        try:
+            result = run_benchmark(encoder, tasks=args.tasks, masks=args.masks, rle_size=args.rle_size,
+                                   repeat=args.repeat)
+        except ImportError as e:
+            print(f'{encoder:>12} skipped: {e}', file=sys.stderr)
+            continue
+        results.append(result)
+        if not args.json_output:
+            print(f'{encoder:>12} {result["ms"]:>9.1f} ms {result["bytes"] / 1e6:>8.1f} MB '
+                  f'{result["mb_per_sec"]:>8.1f} MB/s')
+
+    if args.json_output:
+        print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
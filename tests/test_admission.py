@@ -0,0 +1,132 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from label_studio_ml import api
+from label_studio_ml.admission import AdmissionController, Overloaded
+from label_studio_ml.api import _server, init_app
+from label_studio_ml.asgi import ASGIApp
+from label_studio_ml.model import LabelStudioMLBase
+
+from .test_asgi import call, predict_request
+
+
+def test_queue_and_rejection():
+    controller = AdmissionController('test', limit=1, queue_size=1, timeout=5)
+    first = controller.acquire()
+    admitted = threading.Event()
+
+    def waiting():
+        controller.release(controller.acquire())
+        admitted.set()
+
+    thread = threading.Thread(target=waiting)
+    thread.start()
+    while not controller._waiters:
+        time.sleep(0.001)
+
+    # the queue is full
+    with pytest.raises(Overloaded) as e:
+        controller.acquire()
+    assert e.value.retry_after >= 1
+
+    assert not admitted.is_set()
+    controller.release(first)
+    thread.join()
+    assert admitted.is_set()
+    assert controller._active == 0
+
+
+def test_wait_timeout():
+    controller = AdmissionController('test', limit=1, queue_size=1, timeout=0.05)
+    with controller.admit():
+        with pytest.raises(Overloaded):
+            controller.acquire()
+    assert not controller._waiters
+    with controller.admit():
+        pass
+
+
+def test_async_limit():
+    controller = AdmissionController('test', limit=2, queue_size=10)
+    running = []
+    max_running = []
+
+    async def request():
+        admitted = await controller.acquire_async()
+        running.append(1)
+        max_running.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+        controller.release(admitted)
+
+    async def main():
+        await asyncio.gather(*[request() for _ in range(8)])
+
+    asyncio.run(main())
+    assert max(max_running) == 2
+    assert controller._active == 0
+
+
+class BlockingModel(LabelStudioMLBase):
+    started = threading.Event()
+    release = threading.Event()
+
+    def predict(self, tasks, context=None, **kwargs):
+        BlockingModel.started.set()
+        BlockingModel.release.wait(5)
+        return [{'result': [], 'score': 1.0}]
+
+
+@pytest.fixture
+def limited():
+    BlockingModel.started.clear()
+    BlockingModel.release.clear()
+    init_app(BlockingModel, admission={'predict': AdmissionController('predict', limit=1, queue_size=0)})
+    yield
+    BlockingModel.release.set()
+    init_app(LabelStudioMLBase)
+
+
+def test_flask_overload(limited):
+    responses = []
+
+    def busy():
+        with _server.test_client() as client:
+            responses.append(client.post('/predict', json=predict_request()).status_code)
+
+    thread = threading.Thread(target=busy)
+    thread.start()
+    assert BlockingModel.started.wait(5)
+
+    with _server.test_client() as client:
+        response = client.post('/predict', json=predict_request())
+        assert response.status_code == 503
+        assert int(response.headers['Retry-After']) >= 1
+        # other routes are not limited
+        assert client.get('/health').status_code == 200
+
+        BlockingModel.release.set()
+        thread.join()
+        assert responses == [200]
+        assert client.post('/predict', json=predict_request()).status_code == 200
+        assert 'label_studio_ml_admission_rejected_total{route="predict"}' in client.get('/metrics').get_data(True)
+
+
+def test_asgi_overload(limited):
+    app = ASGIApp()
+
+    async def main():
+        busy = asyncio.ensure_future(call(app, 'POST', '/predict', predict_request()))
+        while not BlockingModel.started.is_set():
+            await asyncio.sleep(0.01)
+        rejected = await call(app, 'POST', '/predict', predict_request())
+        BlockingModel.release.set()
+        return await busy, rejected
+
+    (busy_status, _), (status, body) = asyncio.run(main())
+    assert busy_status == 200
+    assert status == 503 and b'overloaded' in body
+    assert api.ADMISSION['predict']._active == 0
@@ -1,6 +1,8 @@
 
 import pytest
-from label_studio_ml.api import _server
+from label_studio_ml import api
+from label_studio_ml.api import _server, init_app
+from label_studio_ml.model import LabelStudioMLBase
 
 @pytest.fixture
 def client():
@@ -13,8 +15,14 @@ def test_api(client):
     assert response.get_json() ==  {'model_class': 'LabelStudioMLBase', 'status': 'UP'}
 
 def test_metrics(client):
+    client.post('/setup', json={'project': '1.1000000000', 'schema': '<View></View>'})
     response = client.get('/metrics')
     assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+    body = response.get_data(as_text=True)
+    assert '# TYPE label_studio_ml_cache_operation_seconds histogram' in body
+    assert 'label_studio_ml_cache_operation_seconds_count{backend="SqliteCache",operation="get_many"}' in body
+    assert 'label_studio_ml_cache_memory_hits_total{backend="SqliteCache"}' in body
 
 def test_predict(client):
     response = client.post('/predict', json={
@@ -48,3 +56,63 @@ def test_webhook(client):
     
     assert response.status_code == 201
 
+
+
+class CountingModel(LabelStudioMLBase):
+    instances = 0
+
+    def setup(self):
+        CountingModel.instances += 1
+
+
+@pytest.fixture
+def pooled_client():
+    init_app(CountingModel, model_pool_size=2)
+    CountingModel.instances = 0
+    with _server.test_client() as client:
+        yield client
+    init_app(LabelStudioMLBase, model_pool_size=0)
+
+
+def _predict_request(project='1.1000000000', label_config='<View></View>'):
+    return {'tasks': [{'id': 1}], 'label_config': label_config, 'project': project, 'params': {'context': {}}}
+
+
+def test_model_pool(pooled_client):
+    for _ in range(3):
+        assert pooled_client.post('/predict', json=_predict_request()).status_code == 200
+    assert CountingModel.instances == 1
+
+    # label config has changed
+    pooled_client.post('/predict', json=_predict_request(label_config='<View><Text name="t" value="$t"/></View>'))
+    assert CountingModel.instances == 2
+    assert len(api.MODEL_POOL) == 1
+
+    # setup and webhook invalidate the project models
+    pooled_client.post('/setup', json={'project': '1.1000000000', 'schema': '<View></View>'})
+    assert CountingModel.instances == 3
+    pooled_client.post('/webhook', json={
+        'action': 'ANNOTATION_CREATED', 'project': {'id': 1, 'label_config': '<View></View>'}})
+    pooled_client.post('/predict', json=_predict_request())
+    assert CountingModel.instances == 4
+
+    # LRU eviction
+    pooled_client.post('/predict', json=_predict_request(project='2.1000000000'))
+    pooled_client.post('/predict', json=_predict_request(project='3.1000000000'))
+    assert len(api.MODEL_POOL) == 2
+
+
+class AsyncPredictModel(LabelStudioMLBase):
+
+    async def predict(self, tasks, context=None, **kwargs):
+        return [{'result': [], 'score': 1.0}]
+
+
+def test_async_predict_in_flask_app():
+    init_app(AsyncPredictModel)
+    try:
+        with _server.test_client() as client:
+            response = client.post('/predict', json=_predict_request())
+        assert response.get_json() == {'results': [{'result': [], 'score': 1.0}]}
+    finally:
+        init_app(LabelStudioMLBase)
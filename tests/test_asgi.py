@@ -0,0 +1,115 @@
+import json
+import asyncio
+import base64
+
+import pytest
+
+from label_studio_ml import api
+from label_studio_ml.asgi import init_asgi_app
+from label_studio_ml.model import LabelStudioMLBase
+
+
+class AsyncModel(LabelStudioMLBase):
+    in_flight = 0
+    max_in_flight = 0
+
+    async def predict(self, tasks, context=None, **kwargs):
+        AsyncModel.in_flight += 1
+        AsyncModel.max_in_flight = max(AsyncModel.max_in_flight, AsyncModel.in_flight)
+        await asyncio.sleep(0.05)
+        AsyncModel.in_flight -= 1
+        return [{'result': [], 'score': 1.0, 'task': task['id']} for task in tasks]
+
+
+class SyncModel(LabelStudioMLBase):
+
+    def predict(self, tasks, context=None, **kwargs):
+        return [{'result': [], 'score': 0.5} for _ in tasks]
+
+
+async def call(app, method, path, body=None, headers=None):
+    body = json.dumps(body).encode() if body is not None else b''
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+             'headers': [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]}
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        # the client waits for the response, like a real server
+        await asyncio.Event().wait()
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    status = sent[0]['status']
+    response_body = b''.join(m.get('body', b'') for m in sent[1:])
+    return status, response_body
+
+
+def predict_request(task_id=1):
+    return {'tasks': [{'id': task_id}], 'label_config': '<View></View>', 'project': '1.1000000000',
+            'params': {'context': {}}}
+
+
+@pytest.fixture
+def restore_app():
+    yield
+    api.init_app(LabelStudioMLBase, model_pool_size=0)
+    api.BASIC_AUTH = None
+
+
+def test_async_predict_runs_concurrently(restore_app):
+    app = init_asgi_app(AsyncModel, max_threads=2)
+    AsyncModel.max_in_flight = 0
+
+    async def main():
+        return await asyncio.gather(*[call(app, 'POST', '/predict', predict_request(i)) for i in range(20)])
+
+    responses = asyncio.run(main())
+    assert all(status == 200 for status, _ in responses)
+    assert json.loads(responses[3][1])['results'][0]['task'] == 3
+    # all predictions were in flight at once, not limited by the thread pool
+    assert AsyncModel.max_in_flight == 20
+
+
+def test_sync_model_routes(restore_app):
+    app = init_asgi_app(SyncModel)
+
+    status, body = asyncio.run(call(app, 'POST', '/predict', predict_request()))
+    assert status == 200
+    assert json.loads(body)['results'] == [{'result': [], 'score': 0.5}]
+
+    status, body = asyncio.run(call(app, 'GET', '/health'))
+    assert json.loads(body) == {'status': 'UP', 'model_class': 'SyncModel'}
+
+    status, body = asyncio.run(call(app, 'POST', '/setup', {'project': '1.1000000000', 'schema': '<View></View>'}))
+    assert status == 200
+    assert 'model_version' in json.loads(body)
+
+    status, _ = asyncio.run(call(app, 'POST', '/webhook', {
+        'action': 'ANNOTATION_CREATED', 'project': {'id': 1, 'label_config': '<View></View>'}}))
+    assert status == 201
+
+    status, body = asyncio.run(call(app, 'GET', '/metrics'))
+    assert status == 200 and b'label_studio_ml_cache_operation_seconds' in body
+
+    status, _ = asyncio.run(call(app, 'GET', '/unknown'))
+    assert status == 404
+
+
+def test_errors_and_auth(restore_app):
+    app = init_asgi_app(SyncModel, basic_auth_user='user', basic_auth_pass='pass')
+
+    status, _ = asyncio.run(call(app, 'GET', '/health'))
+    assert status == 401
+
+    headers = {'Authorization': 'Basic ' + base64.b64encode(b'user:pass').decode()}
+    status, _ = asyncio.run(call(app, 'GET', '/health', headers=headers))
+    assert status == 200
+
+    status, body = asyncio.run(call(app, 'POST', '/setup', {'schema': '<View></View>'}, headers=headers))
+    assert status == 500
+    assert json.loads(body)['detail'].startswith('AttributeError')
@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+
+from label_studio_ml.api import _server, init_app
+from label_studio_ml.batching import PredictBatcher
+from label_studio_ml.model import LabelStudioMLBase
+
+
+def run_concurrently(fn, args_list):
+    results = [None] * len(args_list)
+    errors = []
+
+    def worker(i, args):
+        try:
+            results[i] = fn(*args)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i, args)) for i, args in enumerate(args_list)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def test_concurrent_requests_are_coalesced():
+    calls = []
+
+    def predict(model, tasks, context, params):
+        calls.append(list(tasks))
+        return [{'task': task['id']} for task in tasks]
+
+    batcher = PredictBatcher(predict, window=0.2, max_batch_size=32)
+    args = [(None, '1', '<View/>', [{'id': i}, {'id': i + 100}], {}, {}) for i in range(8)]
+    results, errors = run_concurrently(batcher.submit, args)
+
+    assert not errors
+    assert len(calls) == 1 and len(calls[0]) == 16
+    for i, result in enumerate(results):
+        assert result == [{'task': i}, {'task': i + 100}]
+
+
+def test_batches_are_split_by_key_and_size():
+    calls = []
+
+    def predict(model, tasks, context, params):
+        calls.append(len(tasks))
+        return [{} for _ in tasks]
+
+    batcher = PredictBatcher(predict, window=0.2, max_batch_size=4)
+    args = [(None, str(i % 2), '<View/>', [{'id': i}], {}, {}) for i in range(8)]
+    results, errors = run_concurrently(batcher.submit, args)
+
+    assert not errors
+    assert sorted(calls) == [4, 4]
+    assert all(len(result) == 1 for result in results)
+
+    # large requests are predicted right away
+    calls.clear()
+    assert len(batcher.submit(None, '1', '<View/>', [{'id': i} for i in range(4)], {}, {})) == 4
+    assert calls == [4]
+
+
+def test_wrong_number_of_predictions_fails_the_batch():
+    batcher = PredictBatcher(lambda model, tasks, context, params: [{}], window=0.2, max_batch_size=32)
+    results, errors = run_concurrently(batcher.submit, [(None, '1', '<View/>', [{'id': i}], {}, {}) for i in range(3)])
+    assert len(errors) == 3
+    assert all(isinstance(e, ValueError) for e in errors)
+
+    # a single request gets whatever predict() returns
+    assert batcher.submit(None, '1', '<View/>', [{'id': 1}, {'id': 2}], {}, {}) == [{}]
+
+
+class BatchModel(LabelStudioMLBase):
+    batches = []
+
+    def predict(self, tasks, context=None, **kwargs):
+        BatchModel.batches.append(len(tasks))
+        return [{'result': [], 'score': task['id']} for task in tasks]
+
+
+@pytest.fixture
+def batching_client():
+    init_app(BatchModel, model_pool_size=4, batch_window_ms=200)
+    BatchModel.batches = []
+    yield _server
+    init_app(LabelStudioMLBase, model_pool_size=0, batch_window_ms=0)
+
+
+def test_predict_route_batching(batching_client):
+    def post(task_id):
+        with batching_client.test_client() as client:
+            response = client.post('/predict', json={
+                'tasks': [{'id': task_id}],
+                'label_config': '<View></View>',
+                'project': '1.1000000000',
+                'params': {'context': {}},
+            })
+        assert response.status_code == 200
+        return response.get_json()['results']
+
+    results, errors = run_concurrently(post, [(i,) for i in range(6)])
+    assert not errors
+    assert BatchModel.batches == [6]
+    for i, result in enumerate(results):
+        assert result[0]['score'] == i
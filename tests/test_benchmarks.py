@@ -0,0 +1,29 @@
+from label_studio_ml.cache import create_cache
+from tests.benchmarks import bench_cache, bench_compression, bench_serialization
+
+
+def test_cache_benchmark_smoke(tmp_path):
+    result = bench_cache.run_benchmark(create_cache('sqlite', str(tmp_path)), threads=2, projects=2, ops=50)
+    assert result['ops_per_sec'] > 0
+    assert sum(stats['count'] for stats in result['operations'].values()) == 100
+    assert set(result['operations']['get']) == {'count', 'p50_us', 'p99_us'}
+
+
+def test_cache_benchmark_regression_guard(capsys):
+    assert bench_cache.main(['--backends', 'sqlite', '--threads', '1', '--ops', '10']) == 0
+    assert bench_cache.main(['--backends', 'sqlite', '--threads', '1', '--ops', '10',
+                             '--min-ops-per-sec', '1e12']) == 1
+
+
+def test_serialization_benchmark_smoke(capsys):
+    result = bench_serialization.run_benchmark('json', tasks=2, masks=1, rle_size=100, repeat=1)
+    assert result['bytes'] > 200 and result['ms'] > 0
+    assert bench_serialization.main(['--encoders', 'stdlib', 'json', '--tasks', '1', '--rle-size', '10']) == 0
+
+
+def test_compression_benchmark_smoke(capsys):
+    predictions, _ = bench_compression.make_predictions(tasks=2, masks=1, width=64, height=32, noise=0.01)
+    result = bench_compression.run_benchmark('gzip-1', predictions, repeat=1)
+    assert result['compressed_bytes'] < result['bytes'] and result['total_ms'] > 0
+    assert bench_compression.main(['--codecs', 'identity', 'gzip-1', '--tasks', '1', '--width', '64',
+                                   '--height', '32', '--stream', '--repeat', '1']) == 0
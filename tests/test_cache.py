@@ -0,0 +1,247 @@
+import time
+import threading
+
+import pytest
+
+from label_studio_ml.cache import create_cache
+
+
+def _redis_cache(tmp_path):
+    fakeredis = pytest.importorskip('fakeredis')
+    return create_cache('redis', str(tmp_path), client=fakeredis.FakeRedis(decode_responses=True))
+
+
+def _lmdb_cache(tmp_path):
+    pytest.importorskip('lmdb')
+    return create_cache('lmdb', str(tmp_path), map_size=1 << 24)
+
+
+BACKENDS = {
+    'sqlite': lambda tmp_path: create_cache('sqlite', str(tmp_path)),
+    'redis': _redis_cache,
+    'lmdb': _lmdb_cache,
+    'tiered': lambda tmp_path: create_cache('tiered', str(tmp_path), backend='sqlite', compaction_interval=0),
+}
+
+
+@pytest.fixture(params=list(BACKENDS))
+def cache(request, tmp_path):
+    return BACKENDS[request.param](tmp_path)
+
+
+@pytest.fixture
+def sqlite_cache(tmp_path):
+    return create_cache('sqlite', str(tmp_path))
+
+
+def test_set_get(cache):
+    assert cache['1', 'model_version'] is None
+    assert ('1', 'model_version') not in cache
+
+    cache['1', 'model_version'] = '0.0.1'
+    assert cache['1', 'model_version'] == '0.0.1'
+    assert ('1', 'model_version') in cache
+    assert cache['2', 'model_version'] is None
+
+    cache['1', 'model_version'] = '0.0.2'
+    assert cache['1', 'model_version'] == '0.0.2'
+
+    del cache['1', 'model_version']
+    assert cache['1', 'model_version'] is None
+    assert ('1', 'model_version') not in cache
+
+
+def test_value_must_be_string(cache):
+    with pytest.raises(ValueError):
+        cache['1', 'model_version'] = 1
+
+
+def test_concurrent_threads(cache):
+    errors = []
+
+    def worker(n):
+        try:
+            for i in range(50):
+                cache[str(n), 'key'] = str(i)
+                assert cache[str(n), 'key'] == str(i)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    assert all(cache[str(n), 'key'] == '49' for n in range(8))
+
+
+def test_unsupported_cache_type(tmp_path):
+    with pytest.raises(ValueError):
+        create_cache('unknown', str(tmp_path))
+
+
+def test_wal_journal_mode(sqlite_cache):
+    mode = sqlite_cache._connection().execute('PRAGMA journal_mode;').fetchone()[0]
+    assert mode == 'wal'
+
+
+def test_memory_layer_per_key_invalidation(sqlite_cache):
+    cache = sqlite_cache
+    cache['1', 'label_config'] = '<View/>'
+    cache['2', 'label_config'] = '<View></View>'
+    assert cache['1', 'label_config'] == '<View/>'
+    assert cache['2', 'label_config'] == '<View></View>'
+
+    hits = cache.memory.hits
+    # writing a key of project 2 must keep project 1 resident
+    cache['2', 'model_version'] = '0.0.2'
+    assert cache['1', 'label_config'] == '<View/>'
+    assert cache['2', 'label_config'] == '<View></View>'
+    assert cache.memory.hits == hits + 2
+
+
+def test_memory_layer_capacity(tmp_path):
+    cache = create_cache('sqlite', str(tmp_path), memory_size=2)
+    for i in range(5):
+        cache[str(i), 'key'] = str(i)
+    assert len(cache.memory) == 2
+    assert cache['0', 'key'] == '0'
+    assert cache.memory.stats()['misses'] == 1
+
+
+def test_coherence_between_workers(tmp_path):
+    # two caches on the same database behave like two gunicorn workers
+    worker1 = create_cache('sqlite', str(tmp_path))
+    worker2 = create_cache('sqlite', str(tmp_path))
+
+    worker1['1', 'model_version'] = '0.0.1'
+    worker1['2', 'model_version'] = '0.0.1'
+    assert worker2['1', 'model_version'] == '0.0.1'
+    assert worker2['2', 'model_version'] == '0.0.1'
+
+    worker1['1', 'model_version'] = '0.0.2'
+    assert worker2['1', 'model_version'] == '0.0.2'
+    assert ('1', 'extra_params') not in worker2
+    worker1['1', 'extra_params'] = '{}'
+    assert ('1', 'extra_params') in worker2
+
+    # project 2 wasn't changed, so it stays in memory of worker2
+    hits = worker2.memory.hits
+    assert worker2['2', 'model_version'] == '0.0.1'
+    assert worker2.memory.hits == hits + 1
+
+
+def test_coherence_after_own_write(tmp_path):
+    worker1 = create_cache('sqlite', str(tmp_path))
+    worker2 = create_cache('sqlite', str(tmp_path))
+
+    worker1['1', 'model_version'] = 'old'
+    assert worker2['1', 'model_version'] == 'old'
+    worker1['1', 'model_version'] = 'new'
+    # worker2 writes the same project before reading it again
+    worker2['1', 'extra_params'] = '{}'
+    assert worker2['1', 'model_version'] == 'new'
+
+
+def test_redis_project_hash_ttl(tmp_path):
+    fakeredis = pytest.importorskip('fakeredis')
+    client = fakeredis.FakeRedis(decode_responses=True)
+    cache = create_cache('redis', str(tmp_path), client=client, prefix='test', ttl=60)
+
+    cache['1', 'model_version'] = '0.0.1'
+    cache['1', 'extra_params'] = '{}'
+    assert client.hgetall('test:1') == {'model_version': '0.0.1', 'extra_params': '{}'}
+    assert 0 < client.ttl('test:1') <= 60
+
+
+def test_get_many_set_many(cache):
+    assert cache.get_many('1', ['label_config', 'model_version']) == {'label_config': None, 'model_version': None}
+
+    cache.set_many('1', {'label_config': '<View/>', 'model_version': '0.0.1'})
+    cache['2', 'model_version'] = '0.0.2'
+    assert cache.get_many('1', ['label_config', 'model_version', 'extra_params']) == {
+        'label_config': '<View/>', 'model_version': '0.0.1', 'extra_params': None}
+    assert cache['1', 'model_version'] == '0.0.1'
+    assert cache.get_many('2', ['model_version']) == {'model_version': '0.0.2'}
+
+    with pytest.raises(ValueError):
+        cache.set_many('1', {'model_version': 1})
+
+
+def test_large_values(cache):
+    value = 'x' * (1 << 20)
+    cache['1', 'prompt'] = value
+    assert cache['1', 'prompt'] == value
+    assert cache.get_many('1', ['prompt'])['prompt'] == value
+
+
+def _write_from_worker(cache, value):
+    cache['1', 'model_version'] = value
+
+
+def test_lmdb_shared_between_processes(tmp_path):
+    pytest.importorskip('lmdb')
+    import multiprocessing
+    cache = create_cache('lmdb', str(tmp_path), map_size=1 << 24)
+    cache['1', 'model_version'] = '0.0.1'
+
+    # forked worker reopens the environment and writes to the same map
+    process = multiprocessing.get_context('fork').Process(target=_write_from_worker, args=(cache, '0.0.2'))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    assert cache['1', 'model_version'] == '0.0.2'
+
+
+def test_projects_keys_delete_project(cache):
+    cache.set_many('1', {'label_config': '<View/>', 'model_version': '0.0.1'})
+    cache['2', 'model_version'] = '0.0.1'
+    assert sorted(cache.projects()) == ['1', '2']
+    assert sorted(cache.keys('1')) == ['label_config', 'model_version']
+
+    cache.delete_project('1')
+    assert cache.projects() == ['2']
+    assert cache['1', 'model_version'] is None
+    assert cache['2', 'model_version'] == '0.0.1'
+
+
+@pytest.fixture
+def tiered_cache(tmp_path):
+    cache = create_cache('tiered', str(tmp_path), backend='sqlite', capacity=2, ttl=60,
+                         project_ttl=0.2, compaction_interval=0)
+    yield cache
+    cache.close()
+
+
+def test_tiered_key_ttl(tiered_cache):
+    tiered_cache.set_with_ttl(('1', 'prompt'), 'prompt', ttl=0.1)
+    tiered_cache['1', 'model_version'] = '0.0.1'
+    assert tiered_cache['1', 'prompt'] == 'prompt'
+    time.sleep(0.15)
+    assert tiered_cache['1', 'prompt'] is None
+    assert ('1', 'prompt') not in tiered_cache
+
+    # expiration is stored in L2, so another worker ignores the expired key too
+    assert tiered_cache.l2['1', 'prompt'] == 'prompt'
+    assert tiered_cache.compact() == 1
+    assert tiered_cache.l2['1', 'prompt'] is None
+    assert tiered_cache['1', 'model_version'] == '0.0.1'
+
+
+def test_tiered_l1_is_bounded(tiered_cache):
+    for i in range(5):
+        tiered_cache[str(i), 'key'] = str(i)
+    assert len(tiered_cache.l1) == 2
+    assert tiered_cache['0', 'key'] == '0'
+
+
+def test_tiered_compaction_evicts_stale_projects(tiered_cache):
+    tiered_cache['1', 'extra_params'] = '{}'
+    time.sleep(0.25)
+    tiered_cache['2', 'extra_params'] = '{}'
+    assert tiered_cache.compact() == 1
+    assert tiered_cache.projects() == ['2']
+    assert tiered_cache['1', 'extra_params'] is None
+    assert tiered_cache['2', 'extra_params'] == '{}'
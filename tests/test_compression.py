@@ -0,0 +1,159 @@
+import gzip
+import json
+import zlib
+import asyncio
+
+import pytest
+
+from label_studio_ml.api import _server, init_app
+from label_studio_ml.asgi import ASGIApp
+from label_studio_ml.compression import ResponseCompression, parse_accept_encoding, zstd_available
+from label_studio_ml.model import LabelStudioMLBase
+
+from .test_streaming import NDJSON, predict_request
+
+requires_zstd = pytest.mark.skipif(not zstd_available(), reason='zstandard is not installed')
+
+
+class MaskModel(LabelStudioMLBase):
+    """
+    Predictions with long RLE lists, like segmentation backends return
+    """
+
+    def predict(self, tasks, context=None, **kwargs):
+        for task in tasks:
+            rle = [i % 256 for i in range(task.get('size', 10000))]
+            yield {'result': [{'type': 'brushlabels', 'value': {'format': 'rle', 'rle': rle}}], 'score': task['id']}
+
+
+def decompress(body, encoding):
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    import zstandard
+    return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+
+
+@pytest.fixture
+def compressed():
+    init_app(MaskModel, compression=ResponseCompression(min_size=1024))
+    yield _server.test_client()
+    init_app(LabelStudioMLBase)
+
+
+def test_negotiate():
+    assert parse_accept_encoding('gzip, deflate;q=0.5, zstd;q=0') == {'gzip': 1.0, 'deflate': 0.5, 'zstd': 0.0}
+    compression = ResponseCompression(['gzip'], min_size=100)
+    # negotiation doesn't need zstandard installed
+    compression.encodings = ('zstd', 'gzip')
+    json_type = 'application/json'
+    # server preference when the client accepts both equally
+    assert compression.negotiate('gzip, zstd', json_type, 1000) == 'zstd'
+    assert compression.negotiate('gzip, zstd;q=0.5', json_type, 1000) == 'gzip'
+    assert compression.negotiate('gzip, zstd;q=0', json_type, 1000) == 'gzip'
+    assert compression.negotiate('*', json_type, 1000) == 'zstd'
+    assert compression.negotiate('br', json_type, 1000) is None
+    assert compression.negotiate(None, json_type, 1000) is None
+    assert compression.negotiate('identity, *;q=0', json_type, 1000) is None
+    # small and binary responses are sent as is, the size of streams is unknown
+    assert compression.negotiate('gzip', json_type, 99) is None
+    assert compression.negotiate('gzip', 'image/png', 1000) is None
+    assert compression.negotiate('gzip', 'application/x-ndjson', None) == 'gzip'
+
+
+def test_from_config():
+    assert ResponseCompression.from_config(None) is None
+    assert ResponseCompression.from_config('0') is None
+    assert ResponseCompression.from_config('gzip', min_size=10).encodings == ('gzip',)
+    assert 'gzip' in ResponseCompression.from_config('auto').encodings
+    with pytest.raises(ValueError):
+        ResponseCompression.from_config('br')
+
+
+@pytest.mark.parametrize('encoding', ['gzip', pytest.param('zstd', marks=requires_zstd)])
+def test_compress_and_stream(encoding):
+    compression = ResponseCompression([encoding])
+    body = json.dumps({'rle': list(range(10000))}).encode()
+    compressed = compression.compress(body, encoding)
+    assert len(compressed) < len(body) / 2
+    assert decompress(compressed, encoding) == body
+
+    lines = [json.dumps({'id': i, 'rle': list(range(1000))}).encode() + b'\n' for i in range(3)]
+    chunks = list(compression.stream(iter(lines), encoding))
+    assert decompress(b''.join(chunks), encoding) == b''.join(lines)
+    if encoding == 'gzip':
+        # every line can be decoded as soon as its chunk is received
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        assert decompressor.decompress(chunks[0]) == lines[0]
+
+
+def test_flask_compression(compressed):
+    client = compressed
+    request = predict_request([{'id': 1}, {'id': 2}])
+    plain = client.post('/predict', json=request).get_data()
+
+    response = client.post('/predict', json=request, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert int(response.headers['Content-Length']) < len(plain) / 2
+    assert gzip.decompress(response.get_data()) == plain
+
+    # small responses and clients without compression support get the body as is
+    response = client.post('/predict', json=predict_request([{'id': 1, 'size': 1}]),
+                           headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_json()['results'][0]['score'] == 1
+    assert 'Content-Encoding' not in client.post('/predict', json=request).headers
+
+
+def test_flask_stream_compression(compressed):
+    response = compressed.post('/predict', json=predict_request([{'id': 1}, {'id': 2}]),
+                               headers=dict(NDJSON, **{'Accept-Encoding': 'gzip'}))
+    assert response.is_streamed
+    assert response.headers['Content-Encoding'] == 'gzip'
+    lines = gzip.decompress(response.get_data()).splitlines()
+    assert [json.loads(line)['score'] for line in lines] == [1, 2]
+
+
+def test_flask_compression_disabled():
+    init_app(MaskModel)
+    response = _server.test_client().post('/predict', json=predict_request([{'id': 1}]),
+                                          headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    init_app(LabelStudioMLBase)
+
+
+@pytest.mark.parametrize('encoding', ['gzip', pytest.param('zstd', marks=requires_zstd)])
+def test_asgi_compression(compressed, encoding):
+    app = ASGIApp()
+
+    async def post(request, headers):
+        body = json.dumps(request).encode()
+        scope = {'type': 'http', 'method': 'POST', 'path': '/predict', 'query_string': b'',
+                 'headers': [(k.lower().encode(), v.encode()) for k, v in headers.items()]}
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await asyncio.Event().wait()
+
+        async def send(message):
+            sent.append(message)
+
+        await app(scope, receive, send)
+        headers = {k.decode().lower(): v.decode() for k, v in sent[0]['headers']}
+        return headers, b''.join(m.get('body', b'') for m in sent[1:])
+
+    request = predict_request([{'id': 1}, {'id': 2}])
+    headers, body = asyncio.run(post(request, {'Accept-Encoding': encoding}))
+    assert headers['content-encoding'] == encoding
+    assert [p['score'] for p in json.loads(decompress(body, encoding))['results']] == [1, 2]
+
+    headers, body = asyncio.run(post(request, dict(NDJSON, **{'Accept-Encoding': encoding})))
+    assert headers['content-encoding'] == encoding
+    assert [json.loads(line)['score'] for line in decompress(body, encoding).splitlines()] == [1, 2]
+
+    headers, body = asyncio.run(post(request, {}))
+    assert 'content-encoding' not in headers
+    assert json.loads(body)['results'][0]['score'] == 1
@@ -0,0 +1,297 @@
+import json
+import time
+import asyncio
+import threading
+
+import pytest
+
+from label_studio_ml import api
+from label_studio_ml.admission import AdmissionController
+from label_studio_ml.api import _server, init_app
+from label_studio_ml.asgi import ASGIApp, init_asgi_app
+from label_studio_ml.batching import PredictBatcher
+from label_studio_ml.deadline import (
+    Deadline, DeadlineExceeded, current_deadline, deadline_scope, request_deadline
+)
+from label_studio_ml.model import LabelStudioMLBase
+
+from .test_asgi import call, predict_request
+
+TIMEOUT = {'X-Request-Timeout': '0.2'}
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class SlowModel(LabelStudioMLBase):
+    """
+    Works on tasks step by step until its deadline
+    """
+    steps = 0
+
+    def predict(self, tasks, context=None, **kwargs):
+        for _ in range(100):
+            self.deadline.check()
+            SlowModel.steps += 1
+            time.sleep(0.01)
+        return [{'result': [], 'score': 1.0} for _ in tasks]
+
+
+class GeneratorModel(LabelStudioMLBase):
+
+    def predict(self, tasks, context=None, **kwargs):
+        for task in tasks:
+            time.sleep(0.05)
+            yield {'result': [], 'score': task['id']}
+
+
+class RemainingModel(LabelStudioMLBase):
+
+    def predict(self, tasks, context=None, **kwargs):
+        return [{'result': [], 'score': self.deadline.remaining()} for _ in tasks]
+
+
+class BlockingModel(LabelStudioMLBase):
+    started = threading.Event()
+    release = threading.Event()
+
+    def predict(self, tasks, context=None, **kwargs):
+        BlockingModel.started.set()
+        BlockingModel.release.wait(5)
+        return [{'result': [], 'score': 1.0}]
+
+
+@pytest.fixture
+def restore_app():
+    yield
+    init_app(LabelStudioMLBase)
+
+
+def test_deadline():
+    clock = Clock()
+    deadline = Deadline(10, clock=clock)
+    assert deadline.remaining() == 10
+    assert deadline.timeout(3) == 3
+    assert deadline.timeout() == 10
+    deadline.check()
+
+    clock.now += 11
+    assert deadline.expired()
+    assert deadline.timeout(3) == 0
+    with pytest.raises(DeadlineExceeded):
+        deadline.check()
+
+    unlimited = Deadline()
+    assert unlimited.remaining() is None and unlimited.timeout(3) == 3
+    unlimited.cancel()
+    assert unlimited.cancelled and unlimited.remaining() == 0
+    with pytest.raises(DeadlineExceeded, match='cancelled'):
+        unlimited.check()
+
+
+def test_latest():
+    clock = Clock()
+    assert Deadline.latest([Deadline(1, clock=clock), Deadline(5, clock=clock)]).expires_at == 105
+    assert Deadline.latest([Deadline(1, clock=clock), Deadline()]).expires_at is None
+
+
+def test_sleep_and_run():
+    deadline = Deadline(0.05)
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        deadline.sleep(10)
+    # the blocking call isn't waited for after the deadline
+    with pytest.raises(DeadlineExceeded):
+        Deadline(0.05).run(time.sleep, 10)
+    assert time.monotonic() - start < 1
+
+    assert Deadline(5).run(lambda x: x * 2, 21) == 42
+    assert Deadline().run(lambda: 'no limit') == 'no limit'
+
+    cancelled = Deadline()
+    threading.Timer(0.05, cancelled.cancel).start()
+    with pytest.raises(DeadlineExceeded):
+        cancelled.sleep(10)
+
+
+def test_abandoned_runs_dont_block_others():
+    release = threading.Event()
+    # more abandoned calls than any helper pool would have threads
+    for _ in range(20):
+        with pytest.raises(DeadlineExceeded):
+            Deadline(0.01).run(release.wait, 5)
+    try:
+        assert Deadline(1).run(lambda: 'done') == 'done'
+    finally:
+        release.set()
+
+
+def test_scope():
+    assert current_deadline().remaining() is None
+    deadline = Deadline(5)
+    with deadline_scope(deadline):
+        assert current_deadline() is deadline
+    assert current_deadline() is not deadline
+
+
+def test_request_deadline(monkeypatch):
+    assert request_deadline({}).remaining() is None
+    assert 0 < request_deadline({'X-Request-Timeout': '2.5'}).remaining() <= 2.5
+    assert request_deadline({'x-request-timeout': 'bad'}).remaining() is None
+    monkeypatch.setenv('PREDICT_TIMEOUT', '7')
+    assert 6 < request_deadline({}).remaining() <= 7
+    assert request_deadline({'X-Request-Timeout': '0'}).remaining() is None
+
+
+def test_flask_predict_deadline(restore_app):
+    init_app(SlowModel)
+    SlowModel.steps = 0
+    with _server.test_client() as client:
+        response = client.post('/predict', json=predict_request(), headers=TIMEOUT)
+        assert response.status_code == 504
+        assert 'deadline' in response.json['detail']
+        # the work was cut off
+        assert SlowModel.steps < 100
+
+    init_app(RemainingModel)
+    with _server.test_client() as client:
+        score = client.post('/predict', json=predict_request(), headers={'X-Request-Timeout': '30'}).json
+        assert 0 < score['results'][0]['score'] <= 30
+        # no limit without the header
+        assert client.post('/predict', json=predict_request()).json['results'][0]['score'] is None
+
+
+def test_flask_generator_deadline(restore_app):
+    init_app(GeneratorModel)
+    tasks = [{'id': i} for i in range(20)]
+    with _server.test_client() as client:
+        response = client.post('/predict', json=dict(predict_request(), tasks=tasks), headers=TIMEOUT)
+        assert response.status_code == 504
+
+        # streamed predictions end with the deadline error
+        response = client.post('/predict', json=dict(predict_request(), tasks=tasks),
+                               headers=dict(TIMEOUT, Accept='application/x-ndjson'))
+        lines = [json.loads(line) for line in response.get_data().splitlines()]
+        assert 1 < len(lines) < 20
+        assert lines[-1]['status'] == 504
+
+
+def test_admission_wait_deadline(restore_app):
+    BlockingModel.started.clear()
+    BlockingModel.release.clear()
+    init_app(BlockingModel, admission={'predict': AdmissionController('predict', limit=1, timeout=30)})
+
+    def busy():
+        with _server.test_client() as client:
+            client.post('/predict', json=predict_request())
+
+    thread = threading.Thread(target=busy)
+    thread.start()
+    assert BlockingModel.started.wait(5)
+    try:
+        with _server.test_client() as client:
+            start = time.monotonic()
+            response = client.post('/predict', json=predict_request(), headers=TIMEOUT)
+            assert response.status_code == 504
+            # the request stopped waiting for a slot at its deadline, not after the queue timeout
+            assert time.monotonic() - start < 5
+    finally:
+        BlockingModel.release.set()
+        thread.join()
+    assert not api.ADMISSION['predict']._waiters
+
+
+def test_batch_follower_deadline():
+    release = threading.Event()
+
+    def predict(model, tasks, context, params):
+        release.wait(5)
+        return [{'score': 1.0} for _ in tasks]
+
+    batcher = PredictBatcher(predict, window=0.05)
+    leader = threading.Thread(target=batcher.submit, args=(None, '1', '', [{'id': 1}], {}, {}))
+    leader.start()
+    time.sleep(0.01)
+    with deadline_scope(Deadline(0.2)):
+        with pytest.raises(DeadlineExceeded):
+            batcher.submit(None, '1', '', [{'id': 2}], {}, {})
+    release.set()
+    leader.join()
+
+
+def test_asgi_deadline(restore_app):
+    app = init_asgi_app(SlowModel)
+    SlowModel.steps = 0
+
+    async def post(headers):
+        # the same as test_asgi.call(), but the client disconnects when `disconnect` is set
+        disconnect = asyncio.Event()
+        messages = [{'type': 'http.request', 'body': json.dumps(predict_request()).encode(), 'more_body': False}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'POST', 'path': '/predict', 'query_string': b'',
+                 'headers': [(k.lower().encode(), v.encode()) for k, v in headers.items()]}
+        task = asyncio.ensure_future(app(scope, receive, send))
+        return task, disconnect, sent
+
+    async def main():
+        task, _, sent = await post(TIMEOUT)
+        await task
+        timed_out = sent[0]['status'], json.loads(sent[1]['body'])
+
+        task, disconnect, sent = await post({})
+        await asyncio.sleep(0.1)
+        disconnect.set()
+        await asyncio.wait_for(task, 5)
+        return timed_out, sent[0]['status']
+
+    (status, body), disconnected = asyncio.run(main())
+    assert status == 504 and body['status'] == 504
+    # the work of the client that went away was cancelled
+    assert disconnected == 504
+    assert SlowModel.steps < 100
+
+
+def test_asgi_admission_deadline(restore_app):
+    BlockingModel.started.clear()
+    BlockingModel.release.clear()
+    init_app(BlockingModel, admission={'predict': AdmissionController('predict', limit=1, timeout=30)})
+    app = ASGIApp()
+
+    async def main():
+        busy = asyncio.ensure_future(call(app, 'POST', '/predict', predict_request()))
+        while not BlockingModel.started.is_set():
+            await asyncio.sleep(0.01)
+        timed_out = await call(app, 'POST', '/predict', predict_request(), headers=TIMEOUT)
+        BlockingModel.release.set()
+        return await busy, timed_out
+
+    (busy_status, _), (status, _) = asyncio.run(main())
+    assert busy_status == 200
+    assert status == 504
+    assert api.ADMISSION['predict']._active == 0
+
+
+def test_streamed_deadline_does_not_leak(restore_app):
+    init_app(GeneratorModel)
+    with _server.test_client() as client:
+        response = client.post('/predict', json=dict(predict_request(), tasks=[{'id': 1}]),
+                               headers=dict(TIMEOUT, Accept='application/x-ndjson'))
+        assert len(response.get_data().splitlines()) == 1
+    # the server thread serves the next request without the deadline of the previous one
+    assert current_deadline().remaining() is None
@@ -0,0 +1,46 @@
+import re
+import subprocess
+import sys
+
+import pytest
+
+HEAVY_MODULES = ('torch', 'flask', 'label_studio_sdk', 'label_studio_tools', 'pydantic', 'requests', 'PIL')
+
+# cumulative import time budgets in microseconds, generous to stay stable on slow CI runners
+BUDGETS = [
+    # label-studio-ml --help / create
+    ('label_studio_ml.server', 250_000, HEAVY_MODULES),
+    # model state and cache, imported by model scripts
+    ('label_studio_ml.model', 400_000, HEAVY_MODULES),
+    # _wsgi app, Flask is needed to serve requests, but the SDK is loaded on the first request
+    ('label_studio_ml.api', 1_500_000, ('torch', 'label_studio_sdk', 'pydantic', 'PIL')),
+]
+
+
+def import_times(module: str) -> dict:
+    """
+    Import module in a clean interpreter with -X importtime, returns {module: cumulative time in us}
+    """
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, check=True).stderr
+    times = {}
+    for line in output.splitlines():
+        match = re.match(r'import time:\s+\d+ \|\s+(\d+) \|\s+(\S+)', line)
+        if match:
+            times[match.group(2)] = int(match.group(1))
+    return times
+
+
+@pytest.mark.parametrize('module,budget,forbidden', BUDGETS)
+def test_import_time_budget(module, budget, forbidden):
+    times = import_times(module)
+    loaded = {name.split('.')[0] for name in times}
+    assert not loaded & set(forbidden), f'{module} imports heavy modules eagerly'
+    assert times[module] < budget, f'{module} import takes {times[module]}us, budget is {budget}us'
+
+
+def test_model_response_is_still_exported():
+    from label_studio_ml.model import ModelResponse
+    from label_studio_ml.response import ModelResponse as Response
+    assert ModelResponse is Response
@@ -0,0 +1,164 @@
+import os
+import time
+import asyncio
+import threading
+import subprocess
+import sys
+
+import pytest
+
+from label_studio_ml import api
+from label_studio_ml.api import _server, init_app
+from label_studio_ml.asgi import ASGIApp
+from label_studio_ml.jobs import JobQueue, COMPLETED, FAILED, RUNNING, _process_token
+from label_studio_ml.model import LabelStudioMLBase
+
+from .test_asgi import call
+
+
+def wait_for(queue, job_id, status, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job['status'] == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'Job {job_id} is {job["status"]}, not {status}')
+
+
+def test_job_lifecycle(tmp_path):
+    queue = JobQueue(str(tmp_path), workers=2)
+    release = threading.Event()
+    job = queue.submit('1', 'ANNOTATION_CREATED', release.wait)
+    assert job['project_id'] == '1' and job['duration'] is None
+
+    running = wait_for(queue, job['id'], RUNNING)
+    assert running['started_at'] >= running['created_at']
+    release.set()
+    completed = wait_for(queue, job['id'], COMPLETED)
+    assert completed['duration'] >= 0 and completed['error'] is None
+
+    def fail():
+        raise ValueError('broken')
+
+    failed = wait_for(queue, queue.submit('1', None, fail)['id'], FAILED)
+    assert 'ValueError: broken' in failed['error']
+
+    assert [j['status'] for j in queue.jobs(project_id='1')] == [FAILED, COMPLETED]
+    assert queue.jobs(project_id='2') == []
+    assert len(queue.jobs(status=COMPLETED)) == 1
+    queue.shutdown()
+
+
+def test_jobs_of_project_run_one_at_a_time(tmp_path):
+    queue = JobQueue(str(tmp_path), workers=4)
+    running = {'1': 0, '2': 0}
+    max_running = {'1': 0, '2': 0}
+    lock = threading.Lock()
+
+    def fit(project_id):
+        with lock:
+            running[project_id] += 1
+            max_running[project_id] = max(max_running[project_id], running[project_id])
+        time.sleep(0.02)
+        with lock:
+            running[project_id] -= 1
+
+    jobs = [queue.submit(p, None, fit, p) for p in ('1', '2') * 3]
+    queue.shutdown()
+    assert all(queue.get(job['id'])['status'] == COMPLETED for job in jobs)
+    assert max_running == {'1': 1, '2': 1}
+
+
+def test_jobs_of_project_run_one_at_a_time_across_workers(tmp_path):
+    # two queues on the same database behave like two gunicorn workers
+    queues = [JobQueue(str(tmp_path), workers=2, poll_interval=0.01) for _ in range(2)]
+    running = []
+    overlaps = []
+
+    def fit():
+        running.append(1)
+        if len(running) > 1:
+            overlaps.append(len(running))
+        time.sleep(0.02)
+        running.pop()
+
+    jobs = [(queue, queue.submit('1', None, fit)) for queue in queues * 3]
+    for queue in queues:
+        queue.shutdown()
+    assert all(queue.get(job['id'])['status'] == COMPLETED for queue, job in jobs)
+    assert overlaps == []
+
+
+def test_interrupted_jobs_fail(tmp_path):
+    queue = JobQueue(str(tmp_path))
+    dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+    dead.wait()
+    queue._connection().execute(
+        "INSERT INTO jobs (id, project_id, status, pid, created_at) VALUES ('old', '1', 'running', ?, 0);",
+        (dead.pid,))
+
+    job = JobQueue(str(tmp_path)).get('old')
+    assert job['status'] == FAILED and job['error'].startswith('Interrupted')
+
+
+@pytest.mark.skipif(_process_token(os.getpid()) is None, reason='process start time is not available')
+def test_interrupted_job_with_reused_pid_fails(tmp_path):
+    queue = JobQueue(str(tmp_path))
+    # the pid of the process which queued the job now belongs to another process
+    queue._connection().execute(
+        "INSERT INTO jobs (id, project_id, status, pid, token, created_at) VALUES ('old', '1', 'running', ?, ?, 0);",
+        (os.getpid(), 'another-boot:1'))
+    queue.submit('2', None, lambda: None)
+
+    assert JobQueue(str(tmp_path)).get('old')['status'] == FAILED
+    queue.shutdown()
+    assert queue.jobs(project_id='2')[0]['status'] == COMPLETED
+
+
+class SlowModel(LabelStudioMLBase):
+    release = threading.Event()
+
+    def fit(self, event, data, **kwargs):
+        SlowModel.release.wait(5)
+
+
+@pytest.fixture
+def training_app(tmp_path, monkeypatch):
+    monkeypatch.setenv('MODEL_DIR', str(tmp_path))
+    SlowModel.release.clear()
+    init_app(SlowModel, training_workers=1)
+    yield
+    SlowModel.release.set()
+    init_app(LabelStudioMLBase)
+
+
+def test_webhook_queues_training(training_app):
+    with _server.test_client() as client:
+        response = client.post('/webhook', json={
+            'action': 'ANNOTATION_CREATED', 'project': {'id': 5, 'label_config': '<View></View>'}})
+        assert response.status_code == 201
+        job_id = response.get_json()['job_id']
+
+        wait_for(api.JOB_QUEUE, job_id, RUNNING)
+        SlowModel.release.set()
+        wait_for(api.JOB_QUEUE, job_id, COMPLETED)
+
+        jobs = client.get('/jobs?project=5').get_json()['jobs']
+        assert [job['id'] for job in jobs] == [job_id]
+        job = client.get(f'/jobs/{job_id}').get_json()
+        assert job['status'] == COMPLETED and job['event'] == 'ANNOTATION_CREATED'
+        assert client.get('/jobs/unknown').status_code == 404
+
+        assert len(client.get('/jobs?limit=1').get_json()['jobs']) == 1
+        assert client.get('/jobs?limit=0').status_code == 400
+        assert client.get('/jobs?limit=many').status_code == 400
+
+    status, body = asyncio.run(call(ASGIApp(), 'GET', f'/jobs/{job_id}'))
+    assert status == 200 and job_id.encode() in body
+
+
+def test_jobs_disabled():
+    with _server.test_client() as client:
+        assert client.get('/jobs').status_code == 404
+        assert client.get('/jobs/1').status_code == 404
@@ -0,0 +1,45 @@
+from label_studio_ml.metrics import Counter, Gauge, Histogram, generate_latest, REGISTRY
+
+
+def test_counter_and_gauge():
+    counter = Counter('test_requests', 'Test requests', ('route',), register=False)
+    counter.labels(route='/predict').inc()
+    counter.labels(route='/predict').inc(2)
+    assert counter.labels(route='/predict').get() == 3
+    assert counter.collect().splitlines() == [
+        '# HELP test_requests_total Test requests',
+        '# TYPE test_requests_total counter',
+        'test_requests_total{route="/predict"} 3',
+    ]
+
+    gauge = Gauge('test_queue_depth', 'Test queue depth', register=False)
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+    assert 'test_queue_depth 1' in gauge.collect()
+    assert '# TYPE test_queue_depth gauge' in gauge.collect()
+
+
+def test_histogram():
+    histogram = Histogram('test_latency_seconds', 'Test latency', buckets=(0.1, 1.0), register=False)
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+    lines = histogram.collect().splitlines()
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{le="1.0"} 2' in lines
+    assert 'test_latency_seconds_bucket{le="+Inf"} 3' in lines
+    assert 'test_latency_seconds_count 3' in lines
+
+    with histogram.time():
+        pass
+    assert histogram.count == 4
+
+
+def test_generate_latest():
+    metric = Counter('test_registered', 'Registered metric')
+    try:
+        metric.inc()
+        assert 'test_registered_total 1' in generate_latest()
+    finally:
+        REGISTRY.remove(metric)
@@ -0,0 +1,83 @@
+import pytest
+
+from label_studio_ml import model as model_module
+from label_studio_ml.cache import create_cache
+from label_studio_ml.model import LabelStudioMLBase
+
+LABEL_CONFIG = '<View><Text name="text" value="$text"/>' \
+               '<Choices name="label" toName="text"><Choice value="A"/><Choice value="B"/></Choices></View>'
+
+
+class VersionedModel(LabelStudioMLBase):
+
+    def setup(self):
+        self.set('model_version', 'VersionedModel-v0.0.1')
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = create_cache('sqlite', str(tmp_path))
+    monkeypatch.setattr(model_module, 'CACHE', cache)
+    writes = []
+    original_write = cache._write
+
+    def _write(project_id, sql, seq_of_params):
+        writes.append(list(seq_of_params))
+        return original_write(project_id, sql, seq_of_params)
+
+    cache._write = _write
+    cache.writes = writes
+    return cache
+
+
+def test_first_init_is_single_transaction(cache):
+    model = VersionedModel(project_id='1', label_config=LABEL_CONFIG)
+    assert len(cache.writes) == 1
+    assert model.get('model_version') == 'VersionedModel-v0.0.1'
+    assert cache['1', 'label_config'] == LABEL_CONFIG
+    assert cache['1', 'model_version'] == 'VersionedModel-v0.0.1'
+
+
+def test_read_only_requests_do_not_write(cache):
+    VersionedModel(project_id='1', label_config=LABEL_CONFIG)
+    cache.writes.clear()
+
+    model = VersionedModel(project_id='1', label_config=LABEL_CONFIG)
+    with model.batch_writes():
+        model.predict([{'data': {'text': 'text'}}])
+    assert cache.writes == []
+
+
+def test_batch_writes(cache):
+    model = VersionedModel(project_id='1', label_config=LABEL_CONFIG)
+    cache.writes.clear()
+
+    with model.batch_writes():
+        model.set('key1', 'value1')
+        model.set('key2', 'value2')
+        assert model.get('key1') == 'value1'
+        assert cache['1', 'key1'] is None
+    assert len(cache.writes) == 1
+    assert cache['1', 'key1'] == 'value1'
+    assert cache['1', 'key2'] == 'value2'
+
+    # writes outside of the batch go to the cache immediately
+    model.set('key1', 'value3')
+    assert cache['1', 'key1'] == 'value3'
+    assert len(cache.writes) == 2
+
+
+def test_label_config_is_parsed_once(cache):
+    from label_studio_ml import label_config
+
+    label_config.cache_clear()
+    models = [VersionedModel(project_id=str(i), label_config=LABEL_CONFIG) for i in range(3)]
+    assert label_config.get_label_interface.cache_info().misses == 1
+    assert label_config.get_parsed_config.cache_info().misses == 1
+    assert models[0].label_interface is models[2].label_interface
+
+    for model in models:
+        assert model.parsed_label_config['label']['labels'] == ['A', 'B']
+        assert model.get_first_tag_occurence('Choices', 'Text') == ('label', 'text', 'text')
+    assert label_config.load_parsed_config.cache_info().misses == 1
+    assert label_config.get_first_tag_occurence.cache_info().misses == 1
@@ -0,0 +1,137 @@
+import json
+
+import pytest
+
+from label_studio_ml import prediction_cache
+from label_studio_ml.api import _server, init_app
+from label_studio_ml.model import LabelStudioMLBase
+from label_studio_ml.prediction_cache import PredictionCache, task_key
+
+LABEL_CONFIG = '<View></View>'
+
+
+def test_task_key():
+    key = task_key({'id': 1, 'data': {'text': 'a', 'meta': 1}}, LABEL_CONFIG, {}, {}, '0.0.1')
+    assert key == task_key({'id': 2, 'data': {'meta': 1, 'text': 'a'}}, LABEL_CONFIG, {}, {}, '0.0.1')
+    assert key != task_key({'data': {'text': 'a', 'meta': 1}}, LABEL_CONFIG, {}, {}, '0.1.0')
+    assert key != task_key({'data': {'text': 'a', 'meta': 1}}, LABEL_CONFIG, {'result': []}, {}, '0.0.1')
+    assert key != task_key({'data': {'text': 'a', 'meta': 1}}, '<View/>', {}, {}, '0.0.1')
+
+
+def test_store_and_evict(tmp_path):
+    cache = PredictionCache(str(tmp_path), max_bytes=10000)
+    cache.store('1', {'a': {'result': [], 'score': 0.5}})
+    assert cache.lookup('1', ['a', 'b']) == [{'result': [], 'score': 0.5}, None]
+
+    for i in range(100):
+        cache.store('1', {str(i): {'result': [1] * 100}})
+    size = cache._connection().execute('SELECT SUM(length(value)) FROM cache;').fetchone()[0]
+    # eviction runs after every max_bytes / 16 written
+    assert size <= 10000 + 10000 / 16
+    cache.evict()
+    assert cache._connection().execute('SELECT SUM(length(value)) FROM cache;').fetchone()[0] <= 10000
+    # the latest predictions are kept
+    assert cache.lookup('1', ['99'])[0] is not None
+
+
+def test_store_keeps_memory_of_other_workers(tmp_path):
+    worker1 = PredictionCache(str(tmp_path))
+    worker2 = PredictionCache(str(tmp_path))
+    worker1.store('1', {'a': {'score': 1}})
+    assert worker2.lookup('1', ['a']) == [{'score': 1}]
+
+    worker1.store('1', {'b': {'score': 2}})
+    hits = worker2.memory.hits
+    assert worker2.lookup('1', ['a', 'b']) == [{'score': 1}, {'score': 2}]
+    # 'a' is still served from memory
+    assert worker2.memory.hits == hits + 1
+
+    # deleting the project is seen by other workers
+    worker1.delete_project('1')
+    assert worker2.lookup('1', ['a', 'b']) == [None, None]
+
+
+class CountingModel(LabelStudioMLBase):
+    predicted = []
+
+    def predict(self, tasks, context=None, **kwargs):
+        CountingModel.predicted.extend(task['data']['text'] for task in tasks)
+        return [{'result': [], 'score': len(task['data']['text'])} for task in tasks]
+
+
+@pytest.fixture
+def client(tmp_path):
+    prediction_cache.PREDICTION_CACHE = PredictionCache(str(tmp_path))
+    init_app(CountingModel, cache_predictions=True)
+    CountingModel.predicted = []
+    with _server.test_client() as client:
+        yield client
+    init_app(LabelStudioMLBase)
+    assert prediction_cache.PREDICTION_CACHE is None
+
+
+def predict(client, *texts, project='11.1000000000'):
+    response = client.post('/predict', json={
+        'tasks': [{'id': i, 'data': {'text': text}} for i, text in enumerate(texts)],
+        'label_config': LABEL_CONFIG, 'project': project, 'params': {'context': {}}})
+    assert response.status_code == 200
+    return [p['score'] for p in response.get_json()['results']]
+
+
+def test_cached_predictions(client):
+    assert predict(client, 'a', 'bb') == [1, 2]
+    assert predict(client, 'a', 'bb') == [1, 2]
+    assert CountingModel.predicted == ['a', 'bb']
+
+    # only new tasks are predicted
+    assert predict(client, 'ccc', 'a', 'dddd') == [3, 1, 4]
+    assert CountingModel.predicted == ['a', 'bb', 'ccc', 'dddd']
+
+    # other projects don't share predictions
+    assert predict(client, 'a', project='12.1000000000') == [1]
+    assert CountingModel.predicted[-1] == 'a'
+
+
+def test_invalidation(client):
+    model = CountingModel(project_id='11', label_config=LABEL_CONFIG)
+    model.set('model_version', '0.0.1')
+    predict(client, 'a')
+    assert str(model.bump_model_version()) == '0.1.0'
+    assert model.get('model_version') == '0.1.0'
+    predict(client, 'a')
+    assert CountingModel.predicted == ['a', 'a']
+
+    client.post('/webhook', json={'action': 'ANNOTATION_CREATED', 'project': {'id': 11, 'label_config': LABEL_CONFIG}})
+    predict(client, 'a')
+    assert CountingModel.predicted == ['a', 'a', 'a']
+
+    model.set('model_version', 'custom')
+    with pytest.raises(ValueError):
+        model.bump_model_version()
+
+
+class PromptModel(LabelStudioMLBase):
+
+    def predict(self, tasks, context=None, **kwargs):
+        prompt = self.extra_params.get('prompt')
+        return [{'result': [], 'score': 1, 'model_version': prompt} for _ in tasks]
+
+
+def test_setup_extra_params_invalidation(tmp_path):
+    prediction_cache.PREDICTION_CACHE = PredictionCache(str(tmp_path))
+    init_app(PromptModel, cache_predictions=True)
+    request = {'tasks': [{'id': 1, 'data': {'text': 'a'}}], 'label_config': LABEL_CONFIG,
+               'project': '13.1000000000', 'params': {'context': {}}}
+    try:
+        with _server.test_client() as client:
+            def setup(prompt):
+                response = client.post('/setup', json={
+                    'project': '13.1000000000', 'schema': LABEL_CONFIG, 'extra_params': json.dumps({'prompt': prompt})})
+                assert response.status_code == 200
+
+            setup('OLD')
+            assert client.post('/predict', json=request).get_json()['results'][0]['model_version'] == 'OLD'
+            setup('NEW')
+            assert client.post('/predict', json=request).get_json()['results'][0]['model_version'] == 'NEW'
+    finally:
+        init_app(LabelStudioMLBase)
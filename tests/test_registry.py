@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+
+from label_studio_ml.registry import ModelRegistry
+
+
+def test_swap_waits_for_requests_in_flight():
+    released = []
+    registry = ModelRegistry(keep=0, on_release=released.append)
+    assert registry.load(lambda: 'v1-weights') == '1'
+
+    with registry.acquire() as model:
+        assert model == 'v1-weights'
+        registry.load(lambda: 'v2-weights', version='v2')
+        assert registry.version == 'v2'
+        with registry.acquire() as new_model:
+            assert new_model == 'v2-weights'
+        # the old version is still used by this request
+        assert released == []
+    assert released == ['v1-weights']
+    assert registry.versions() == ['v2']
+
+
+def test_rollback_and_failed_load():
+    released = []
+    registry = ModelRegistry(keep=1, on_release=released.append)
+    registry.load(lambda: 'a', version='a')
+    registry.load(lambda: 'b', version='b')
+    registry.load(lambda: 'c', version='c')
+    assert registry.versions() == ['c', 'b']
+    assert released == ['a']
+
+    def broken():
+        raise OSError('no checkpoint')
+
+    with pytest.raises(OSError):
+        registry.load(broken)
+    assert registry.version == 'c'
+
+    assert registry.rollback() == 'b'
+    assert released == ['a', 'c']
+    with registry.acquire() as model:
+        assert model == 'b'
+    with pytest.raises(LookupError):
+        registry.rollback()
+
+
+def test_background_and_initial_load():
+    registry = ModelRegistry()
+    with pytest.raises(LookupError):
+        with registry.acquire():
+            pass
+
+    loads = []
+    barrier = threading.Barrier(8)
+
+    def loader():
+        loads.append(1)
+        return 'initial'
+
+    def request():
+        barrier.wait()
+        with registry.acquire(loader) as model:
+            assert model == 'initial'
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(loads) == 1
+
+    assert registry.load_in_background(lambda: 'trained', version='trained').result(timeout=5) == 'trained'
+    with registry.acquire(loader) as model:
+        assert model == 'trained'
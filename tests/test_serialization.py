@@ -0,0 +1,134 @@
+import json
+import uuid
+import decimal
+import datetime
+import dataclasses
+
+import numpy as np
+import pytest
+
+from flask.json.provider import DefaultJSONProvider
+
+from label_studio_ml import serialization
+from label_studio_ml.api import _predict_results, _server, init_app
+from label_studio_ml.model import LabelStudioMLBase
+from label_studio_ml.response import ModelResponse
+
+
+@pytest.fixture(params=['json', 'orjson'])
+def encoder(request):
+    if request.param == 'orjson':
+        pytest.importorskip('orjson')
+    serialization.set_encoder(serialization._create_encoder(request.param))
+    yield request.param
+    serialization.set_encoder(None)
+
+
+def test_numpy_values(encoder):
+    obj = {'rle': np.array([0, 255, 3], dtype=np.uint8), 'score': np.float32(0.5), 'count': np.int64(3), 1: 'a'}
+    assert json.loads(serialization.dumps(obj)) == {'rle': [0, 255, 3], 'score': 0.5, 'count': 3, '1': 'a'}
+
+
+def test_prediction_values(encoder):
+    response = ModelResponse(model_version='1', predictions=[{'result': [{'value': {'rle': [1, 2]}}], 'score': 1}])
+    assert json.loads(serialization.dumps(response.predictions)) == [
+        {'model_version': None, 'score': 1.0, 'result': [{'value': {'rle': [1, 2]}}]}]
+
+    with pytest.raises(TypeError):
+        serialization.dumps({'value': object()})
+
+
+@dataclasses.dataclass
+class Point:
+    x: int
+    y: int
+
+
+class Markup:
+
+    def __html__(self):
+        return '<b>bold</b>'
+
+
+def test_flask_types(encoder):
+    obj = {
+        'datetime': datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc),
+        'date': datetime.date(2024, 1, 2),
+        'uuid': uuid.UUID(int=1),
+        'decimal': decimal.Decimal('1.10'),
+        'point': Point(1, 2),
+        'markup': Markup(),
+    }
+    assert json.loads(serialization.dumps(obj)) == {
+        'datetime': 'Tue, 02 Jan 2024 03:04:05 GMT',
+        'date': 'Tue, 02 Jan 2024 00:00:00 GMT',
+        'uuid': '00000000-0000-0000-0000-000000000001',
+        'decimal': '1.10',
+        'point': {'x': 1, 'y': 2},
+        'markup': '<b>bold</b>',
+    }
+    # the same as Flask's own encoder
+    assert json.loads(serialization.dumps(obj)) == json.loads(DefaultJSONProvider(_server).dumps(obj))
+
+
+def test_custom_encoder():
+    serialization.set_encoder(lambda obj: b'"custom"')
+    try:
+        assert serialization.dumps({}) == b'"custom"'
+    finally:
+        serialization.set_encoder(None)
+
+    with pytest.raises(ValueError):
+        serialization._create_encoder('unknown')
+
+
+class NumpyModel(LabelStudioMLBase):
+
+    def predict(self, tasks, context=None, **kwargs):
+        return ModelResponse(predictions=[{
+            'result': [{'type': 'brushlabels', 'value': {'format': 'rle', 'rle': np.arange(4, dtype=np.uint8)}}],
+            'score': np.float64(0.75)
+        } for _ in tasks])
+
+
+def test_predict_numpy_results(encoder):
+    init_app(NumpyModel)
+    try:
+        with _server.test_client() as client:
+            response = client.post('/predict', json={
+                'tasks': [{'id': 1}], 'label_config': '<View></View>', 'project': '1.1000000000',
+                'params': {'context': {}}})
+        assert response.status_code == 200
+        prediction = response.get_json()['results'][0]
+        assert prediction['result'][0]['value']['rle'] == [0, 1, 2, 3]
+        assert prediction['score'] == 0.75
+    finally:
+        init_app(LabelStudioMLBase)
+
+
+class FailingModel(LabelStudioMLBase):
+
+    def predict(self, tasks, context=None, **kwargs):
+        raise ValueError('broken')
+
+
+def test_error_request_args(encoder):
+    init_app(FailingModel)
+    try:
+        with _server.test_client() as client:
+            response = client.post('/predict?debug=1', json={
+                'tasks': [{'id': 1}], 'label_config': '<View></View>', 'project': '1.1000000000'})
+        assert response.status_code == 500
+        assert response.get_json()['request'] == {'debug': '1'}
+    finally:
+        init_app(LabelStudioMLBase)
+
+
+def test_predict_results_are_encoded_directly():
+    model = LabelStudioMLBase(project_id='1', label_config='<View></View>')
+    response = ModelResponse(model_version='1', predictions=[{'result': [], 'score': 0.5}])
+    results = _predict_results(model, response)
+    # no intermediate dicts, the encoder serializes the models
+    assert results[0] is response.predictions[0]
+    assert json.loads(serialization.dumps({'results': results})) == {
+        'results': [{'model_version': '1', 'score': 0.5, 'result': []}]}
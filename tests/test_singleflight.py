@@ -0,0 +1,277 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from label_studio_ml.api import _server, init_app
+from label_studio_ml.asgi import init_asgi_app
+from label_studio_ml.deadline import Deadline, DeadlineExceeded, deadline_scope
+from label_studio_ml.model import LabelStudioMLBase
+from label_studio_ml.singleflight import SingleFlight, request_key
+
+from .test_asgi import call, predict_request
+
+
+class CountingModel(LabelStudioMLBase):
+    calls = 0
+
+    def predict(self, tasks, context=None, **kwargs):
+        CountingModel.calls += 1
+        time.sleep(0.2)
+        return [{'result': [], 'score': task['id']} for task in tasks]
+
+
+class AsyncCountingModel(LabelStudioMLBase):
+    calls = 0
+
+    async def predict(self, tasks, context=None, **kwargs):
+        AsyncCountingModel.calls += 1
+        await asyncio.sleep(0.1)
+        return [{'result': [], 'score': task['id']} for task in tasks]
+
+
+def start_threads(n, target):
+    threads = [threading.Thread(target=target) for _ in range(n)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def test_request_key():
+    key = request_key('1', '<View/>', [{'id': 1, 'data': {'a': 1, 'b': 2}}], {}, {}, '0.0.1')
+    assert key == request_key('1', '<View/>', [{'data': {'b': 2, 'a': 1}, 'id': 1}], {}, {}, '0.0.1')
+    assert key != request_key('1', '<View/>', [{'id': 1, 'data': {'a': 1, 'b': 2}}], {}, {}, '0.0.2')
+    assert key != request_key('1', '<View/>', [{'id': 2, 'data': {'a': 1, 'b': 2}}], {}, {}, '0.0.1')
+
+
+def test_followers_share_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def predict(key):
+        calls.append(key)
+        release.wait(5)
+        return [key]
+
+    threads = start_threads(5, lambda: results.append(flight.do('a', predict, 'a')))
+    other = start_threads(1, lambda: results.append(flight.do('b', predict, 'b')))
+    while len(calls) < 2:
+        time.sleep(0.001)
+    time.sleep(0.05)
+    release.set()
+    for thread in threads + other:
+        thread.join()
+
+    assert sorted(calls) == ['a', 'b']
+    assert sorted(results) == [['a']] * 5 + [['b']]
+    # every caller gets its own list
+    assert len({id(result) for result in results}) == 6
+    # the call is done, the next one runs again
+    assert flight.do('a', predict, 'a') == ['a'] and len(calls) == 3
+
+
+def test_followers_get_error():
+    flight = SingleFlight()
+    started = threading.Event()
+    errors = []
+
+    def fail():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError('broken')
+
+    def request():
+        try:
+            flight.do('a', fail)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = start_threads(1, request)
+    started.wait(5)
+    threads += start_threads(2, request)
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 3
+    assert not flight._calls
+
+
+def test_deadlines():
+    flight = SingleFlight()
+    started = threading.Event()
+    calls = []
+
+    def predict(wait):
+        calls.append(wait)
+        started.set()
+        time.sleep(wait)
+        if len(calls) == 1:
+            raise DeadlineExceeded('the leader is out of time')
+        return 'done'
+
+    results = []
+    leader = threading.Thread(target=lambda: pytest.raises(DeadlineExceeded, flight.do, 'a', predict, 0.1))
+    leader.start()
+    started.wait(5)
+
+    def patient():
+        results.append(flight.do('a', predict, 0))
+
+    def impatient():
+        with deadline_scope(Deadline(0.02)):
+            with pytest.raises(DeadlineExceeded):
+                flight.do('a', predict, 0)
+            results.append('gave up')
+
+    threads = start_threads(1, patient) + start_threads(1, impatient)
+    for thread in threads + [leader]:
+        thread.join()
+    # the patient follower ran predict() once the leader gave up
+    assert sorted(results) == ['done', 'gave up']
+    assert calls == [0.1, 0]
+
+
+def test_async_followers():
+    flight = SingleFlight()
+    calls = []
+
+    async def predict():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return ['result']
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise ValueError('broken')
+
+    async def main():
+        results = await asyncio.gather(*[flight.do_async('a', predict) for _ in range(5)])
+        errors = await asyncio.gather(*[flight.do_async('b', fail) for _ in range(3)], return_exceptions=True)
+        return results, errors
+
+    results, errors = asyncio.run(main())
+    assert results == [['result']] * 5
+    assert all(isinstance(e, ValueError) for e in errors)
+    assert len(calls) == 2
+    assert not flight._async_calls
+
+
+def test_async_leader_cancelled():
+    flight = SingleFlight()
+    calls = []
+
+    async def predict():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return 'result'
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do_async('a', predict))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(flight.do_async('a', predict))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    # the follower runs predict() itself
+    assert asyncio.run(main()) == 'result'
+    assert len(calls) == 2
+
+
+def test_async_deadlines():
+    flight = SingleFlight()
+    calls = []
+
+    async def predict(wait):
+        calls.append(wait)
+        await asyncio.sleep(wait)
+        if len(calls) == 1:
+            raise DeadlineExceeded('the leader is out of time')
+        return 'done'
+
+    async def impatient():
+        with deadline_scope(Deadline(0.02)):
+            with pytest.raises(DeadlineExceeded):
+                await flight.do_async('a', lambda: predict(0))
+        return 'gave up'
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do_async('a', lambda: predict(0.1)))
+        await asyncio.sleep(0.01)
+        results = await asyncio.gather(flight.do_async('a', lambda: predict(0)), impatient())
+        with pytest.raises(DeadlineExceeded):
+            await leader
+        return results
+
+    # the patient follower ran predict() once the leader gave up
+    assert sorted(asyncio.run(main())) == ['done', 'gave up']
+    assert calls == [0.1, 0]
+
+
+def test_async_follower_cancelled():
+    flight = SingleFlight()
+
+    async def predict():
+        await asyncio.sleep(0.1)
+        return 'result'
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do_async('a', predict))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(flight.do_async('a', predict))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        return await leader
+
+    # the leader isn't affected by its follower going away
+    assert asyncio.run(main()) == 'result'
+
+
+@pytest.fixture
+def restore_app():
+    yield
+    init_app(LabelStudioMLBase)
+
+
+def test_flask_single_flight(restore_app):
+    init_app(CountingModel, single_flight=True)
+    CountingModel.calls = 0
+    responses = []
+
+    def request(task_id=1):
+        with _server.test_client() as client:
+            responses.append(client.post('/predict', json=predict_request(task_id)).json)
+
+    threads = start_threads(4, request) + [threading.Thread(target=request, args=(2,))]
+    threads[-1].start()
+    for thread in threads:
+        thread.join()
+    assert CountingModel.calls == 2
+    assert sorted(response['results'][0]['score'] for response in responses) == [1, 1, 1, 1, 2]
+
+
+def test_flask_without_single_flight(restore_app):
+    init_app(CountingModel)
+    CountingModel.calls = 0
+    threads = start_threads(3, lambda: _server.test_client().post('/predict', json=predict_request()))
+    for thread in threads:
+        thread.join()
+    assert CountingModel.calls == 3
+
+
+def test_asgi_single_flight(restore_app):
+    app = init_asgi_app(AsyncCountingModel)
+    init_app(AsyncCountingModel, single_flight=True)
+    AsyncCountingModel.calls = 0
+
+    async def main():
+        return await asyncio.gather(*[call(app, 'POST', '/predict', predict_request()) for _ in range(10)])
+
+    responses = asyncio.run(main())
+    assert all(status == 200 for status, _ in responses)
+    assert AsyncCountingModel.calls == 1
@@ -0,0 +1,118 @@
+import json
+import asyncio
+
+import pytest
+
+from label_studio_ml import api
+from label_studio_ml.api import _server, init_app
+from label_studio_ml.asgi import init_asgi_app
+from label_studio_ml.model import LabelStudioMLBase
+from label_studio_ml.response import ModelResponse
+
+from .test_asgi import call
+
+NDJSON = {'Accept': 'application/x-ndjson'}
+
+
+class GeneratorModel(LabelStudioMLBase):
+
+    def predict(self, tasks, context=None, **kwargs):
+        for task in tasks:
+            if task.get('fail'):
+                raise ValueError('broken task')
+            yield {'result': [], 'score': task['id']}
+
+
+class AsyncGeneratorModel(LabelStudioMLBase):
+
+    async def predict(self, tasks, context=None, **kwargs):
+        for task in tasks:
+            await asyncio.sleep(0)
+            yield {'result': [], 'score': task['id']}
+
+
+class ResponseModel(LabelStudioMLBase):
+
+    def predict(self, tasks, context=None, **kwargs):
+        return ModelResponse(predictions=[{'result': [], 'score': task['id']} for task in tasks])
+
+
+def predict_request(tasks):
+    return {'tasks': tasks, 'label_config': '<View></View>', 'project': '1.1000000000', 'params': {'context': {}}}
+
+
+def lines(body):
+    return [json.loads(line) for line in body.splitlines()]
+
+
+@pytest.fixture
+def app():
+    def make(model_class):
+        init_app(model_class)
+        return _server.test_client()
+    yield make
+    init_app(LabelStudioMLBase)
+
+
+@pytest.mark.parametrize('model_class', [GeneratorModel, AsyncGeneratorModel])
+def test_flask_streaming(app, model_class):
+    client = app(model_class)
+    tasks = [{'id': i} for i in range(5)]
+
+    response = client.post('/predict', json=predict_request(tasks), headers=NDJSON)
+    assert response.status_code == 200
+    assert response.content_type == 'application/x-ndjson'
+    assert response.is_streamed
+    assert [p['score'] for p in lines(response.data)] == list(range(5))
+
+    # clients which don't ask for a stream get the usual answer
+    response = client.post('/predict', json=predict_request(tasks))
+    assert [p['score'] for p in response.get_json()['results']] == list(range(5))
+
+
+def test_flask_streaming_errors(app):
+    client = app(GeneratorModel)
+
+    response = client.post('/predict', json=predict_request([{'id': 1, 'fail': True}]), headers=NDJSON)
+    assert response.status_code == 500
+
+    response = client.post('/predict', json=predict_request([{'id': 1}, {'id': 2, 'fail': True}]), headers=NDJSON)
+    assert response.status_code == 200
+    first, error = lines(response.data)
+    assert first['score'] == 1
+    assert error == {'status': 500, 'detail': 'ValueError: broken task'}
+
+
+def test_flask_streaming_model_response(app):
+    client = app(ResponseModel)
+    response = client.post('/predict', json=predict_request([{'id': 1}, {'id': 2}]), headers=NDJSON)
+    assert [(p['score'], p['model_version']) for p in lines(response.data)] == [(1, '0.0.1'), (2, '0.0.1')]
+
+
+@pytest.mark.parametrize('model_class', [GeneratorModel, AsyncGeneratorModel])
+def test_asgi_streaming(model_class):
+    asgi_app = init_asgi_app(model_class)
+    try:
+        tasks = [{'id': i} for i in range(5)]
+        status, body = asyncio.run(call(asgi_app, 'POST', '/predict', predict_request(tasks), NDJSON))
+        assert status == 200
+        assert [p['score'] for p in lines(body)] == list(range(5))
+
+        status, body = asyncio.run(call(asgi_app, 'POST', '/predict', predict_request(tasks)))
+        assert [p['score'] for p in json.loads(body)['results']] == list(range(5))
+    finally:
+        api.init_app(LabelStudioMLBase)
+
+
+def test_asgi_streaming_errors():
+    asgi_app = init_asgi_app(GeneratorModel)
+    try:
+        status, _ = asyncio.run(call(asgi_app, 'POST', '/predict', predict_request([{'id': 1, 'fail': True}]), NDJSON))
+        assert status == 500
+
+        status, body = asyncio.run(call(
+            asgi_app, 'POST', '/predict', predict_request([{'id': 1}, {'id': 2, 'fail': True}]), NDJSON))
+        assert status == 200
+        assert lines(body)[-1] == {'status': 500, 'detail': 'ValueError: broken task'}
+    finally:
+        api.init_app(LabelStudioMLBase)
@@ -0,0 +1,114 @@
+import time
+import threading
+
+import pytest
+
+from label_studio_ml.api import _server, init_app
+from label_studio_ml.model import LabelStudioMLBase
+from label_studio_ml.triggers import TrainingTrigger
+
+
+class Recorder:
+
+    def __init__(self, finish=True):
+        self.started = []
+        self.done = []
+        self.finish = finish
+        self.event = threading.Event()
+
+    def __call__(self, project_id, event, data, done):
+        self.started.append((project_id, event, data))
+        self.done.append(done)
+        if self.finish:
+            done()
+        self.event.set()
+
+    def wait(self, timeout=2):
+        assert self.event.wait(timeout)
+        self.event.clear()
+
+
+def test_burst_is_coalesced():
+    start = Recorder()
+    trigger = TrainingTrigger(start, debounce=0.1)
+    for i in range(5):
+        assert trigger.event('1', 'ANNOTATION_CREATED', {'i': i}) == {'status': 'pending', 'annotations': i + 1}
+        time.sleep(0.01)
+    start.wait()
+    time.sleep(0.15)
+    assert start.started == [('1', 'ANNOTATION_CREATED', {'i': 4})]
+    assert trigger.pending('1') == 0
+    trigger.close()
+
+
+def test_min_annotations_and_staleness():
+    start = Recorder()
+    trigger = TrainingTrigger(start, debounce=0.01, min_annotations=3)
+    trigger.event('1', 'ANNOTATION_CREATED', {})
+    trigger.event('1', 'ANNOTATION_UPDATED', {})
+    time.sleep(0.1)
+    assert start.started == [] and trigger.pending('1') == 2
+    trigger.event('1', 'ANNOTATION_CREATED', {})
+    start.wait()
+
+    # project updates start training regardless of the count
+    trigger.event('2', 'PROJECT_UPDATED', {})
+    start.wait()
+    assert [project_id for project_id, _, _ in start.started] == ['1', '2']
+    trigger.close()
+
+    start = Recorder()
+    trigger = TrainingTrigger(start, debounce=10, min_annotations=100, max_staleness=0.1)
+    begin = time.monotonic()
+    trigger.event('1', 'ANNOTATION_CREATED', {})
+    start.wait()
+    assert 0.1 <= time.monotonic() - begin < 1
+    trigger.close()
+
+
+def test_one_pending_training_per_project():
+    start = Recorder(finish=False)
+    trigger = TrainingTrigger(start, debounce=0.01)
+    trigger.event('1', 'ANNOTATION_CREATED', {})
+    start.wait()
+
+    # events during the training wait for it to finish
+    for _ in range(3):
+        trigger.event('1', 'ANNOTATION_CREATED', {})
+    time.sleep(0.1)
+    assert len(start.started) == 1 and trigger.pending('1') == 3
+
+    start.done[0]()
+    start.wait()
+    assert len(start.started) == 2 and trigger.pending('1') == 0
+    trigger.close()
+
+
+class CountingFitModel(LabelStudioMLBase):
+    fits = []
+
+    def fit(self, event, data, **kwargs):
+        CountingFitModel.fits.append(event)
+
+
+@pytest.fixture
+def debounced_client():
+    CountingFitModel.fits = []
+    init_app(CountingFitModel, training_debounce=0.05)
+    with _server.test_client() as client:
+        yield client
+    init_app(LabelStudioMLBase)
+
+
+def test_webhook_debounce(debounced_client):
+    for event in ('ANNOTATION_CREATED', 'ANNOTATION_UPDATED', 'ANNOTATION_CREATED'):
+        response = debounced_client.post('/webhook', json={
+            'action': event, 'project': {'id': 7, 'label_config': '<View></View>'}})
+        assert response.status_code == 201
+        assert response.get_json()['status'] == 'pending'
+
+    deadline = time.time() + 2
+    while not CountingFitModel.fits and time.time() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    assert CountingFitModel.fits == ['ANNOTATION_CREATED']